@@ -0,0 +1,306 @@
+# Top users by revenue over a trailing window (Part1/Question1.sql), kept in
+# memory and updated incrementally. Completed orders are held in daily buckets
+# of per-user revenue and group counts; buckets that fall out of the window
+# are expired as time moves on, and only orders changed since the last
+# refresh are read back, tracked by COALESCE(updated_at, created_at) as in
+# Part2/preprocess.py. Each user's lifetime category set grows from the carts
+# added since the last refresh. The top-K list is rebuilt only when a refresh
+# changed something, so reading the leaderboard never touches the database.
+
+import argparse
+import heapq
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import db  # noqa: E402
+import profiling  # noqa: E402
+
+
+WINDOW_DAYS = 60
+TOP_K = 10
+
+# The first load only needs completed orders; later refreshes also read
+# orders that stopped being completed so their revenue can be taken back, and
+# every order created since the previous end of the window.
+ORDER_DELTA_QUERY = """
+    SELECT
+        o.id,
+        o.created_at::date AS day,
+        gc.user_id,
+        g.id AS group_id,
+        o.total_amount,
+        o.status = 'COMPLETED' AS completed,
+        COALESCE(o.updated_at, o.created_at) AS changed_at
+    FROM
+        public.orders o
+    JOIN
+        public.groups_carts gc ON o.groups_carts_id = gc.id
+    JOIN
+        public.groups g ON gc.group_id = g.id
+    WHERE
+        o.created_at >= %(window_start)s
+        AND o.created_at <= %(as_of)s
+        AND (
+            %(since)s::timestamp IS NULL AND o.status = 'COMPLETED'
+            OR COALESCE(o.updated_at, o.created_at) >= %(since)s::timestamp
+            OR o.created_at > %(previous)s::timestamp
+        )
+"""
+
+# The UserCategories CTE of Question1.sql, restricted to carts changed since
+# the last refresh.
+CATEGORY_DELTA_QUERY = """
+    SELECT
+        gc.user_id,
+        c.name,
+        MAX(COALESCE(gc.updated_at, gc.created_at)) AS changed_at
+    FROM
+        public.groups_carts gc
+    JOIN
+        public.groups g ON gc.group_id = g.id
+    JOIN
+        public.group_deals gd ON g.group_deals_id = gd.id
+    JOIN
+        public.products p ON gd.product_id = p.id
+    JOIN
+        public.product_names pn ON p.name_id = pn.id
+    JOIN
+        public.categories c ON pn.category_id = c.id
+    WHERE
+        %(since)s::timestamp IS NULL
+        OR COALESCE(gc.updated_at, gc.created_at) >= %(since)s::timestamp
+    GROUP BY
+        gc.user_id, c.name
+"""
+
+
+# Name of a user id that is not in users (yet): such users are not ranked,
+# and are looked up again on every refresh. A NULL name is a plain None.
+_MISSING = object()
+
+
+class _Bucket:
+    """
+    One day of completed orders: revenue and group orders per user.
+    """
+
+    def __init__(self):
+        self.revenue = defaultdict(Decimal)
+        self.groups = defaultdict(Counter)
+        self.orders = set()
+
+
+class Leaderboard:
+    """
+    Top users by completed-order revenue over the last ``window_days`` days,
+    with the number of groups they ordered in during the window and the
+    categories of every group they ever joined. The window is counted in
+    whole days: the oldest day is included entirely.
+
+    ``as_of`` pins the end of the window (e.g. for historical data); by
+    default it is the database's current time at each refresh. Categories
+    only ever grow; ``reload`` rebuilds all state from scratch.
+    """
+
+    def __init__(self, window_days=WINDOW_DAYS, top_k=TOP_K, config=None, as_of=None):
+        self.window_days = window_days
+        self.top_k = top_k
+        self.config = config
+        self.as_of = as_of
+        # _refresh_lock serialises refreshes; _lock guards the in-memory state
+        # and is only held while a refresh merges what it read.
+        self._refresh_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._id_type = None
+        self.reload(refresh=False)
+
+    def reload(self, refresh=True):
+        with self._refresh_lock, self._lock:
+            self._buckets = {}
+            self._orders = {}
+            self._totals = defaultdict(Decimal)
+            self._groups = defaultdict(Counter)
+            self._categories = defaultdict(set)
+            self._names = {}
+            self._order_watermark = None
+            self._cart_watermark = None
+            self._ranking = None
+            self.refreshed_at = None
+        if refresh:
+            self.refresh()
+
+    def _add(self, order_id, day, user_id, group_id, amount):
+        bucket = self._buckets.setdefault(day, _Bucket())
+        bucket.revenue[user_id] += amount
+        bucket.groups[user_id][group_id] += 1
+        bucket.orders.add(order_id)
+        self._totals[user_id] += amount
+        self._groups[user_id][group_id] += 1
+        self._orders[order_id] = (day, user_id, group_id, amount)
+
+    def _remove(self, order_id):
+        day, user_id, group_id, amount = self._orders.pop(order_id)
+        bucket = self._buckets[day]
+        bucket.revenue[user_id] -= amount
+        bucket.groups[user_id][group_id] -= 1
+        bucket.orders.discard(order_id)
+        self._totals[user_id] -= amount
+        self._groups[user_id][group_id] -= 1
+        if not self._groups[user_id][group_id]:
+            del self._groups[user_id][group_id]
+        if not self._groups[user_id]:
+            del self._groups[user_id], self._totals[user_id]
+
+    def _expire(self, start_day):
+        """
+        Drop the buckets older than ``start_day``, taking their revenue and
+        group orders off the running totals.
+        """
+        expired = [day for day in self._buckets if day < start_day]
+        for day in expired:
+            bucket = self._buckets.pop(day)
+            for user_id, revenue in bucket.revenue.items():
+                self._totals[user_id] -= revenue
+                self._groups[user_id].subtract(bucket.groups[user_id])
+                self._groups[user_id] = +self._groups[user_id]
+                if not self._groups[user_id]:
+                    del self._groups[user_id], self._totals[user_id]
+            for order_id in bucket.orders:
+                del self._orders[order_id]
+        return len(expired)
+
+    def _lookup_names(self, user_ids):
+        """
+        Names of the users not seen before or not found last time, with
+        _MISSING for ids still missing from users (Question1.sql joins users,
+        so those are not ranked). The id array is cast to the type of users.id.
+        """
+        missing = [user_id for user_id in user_ids
+                   if self._names.get(user_id, _MISSING) is _MISSING]
+        if not missing:
+            return {}
+        if self._id_type is None:
+            self._id_type = db.fetchall("""
+                SELECT format_type(atttypid, atttypmod)
+                FROM pg_attribute
+                WHERE attrelid = 'public.users'::regclass AND attname = 'id';
+            """, config=self.config)[0][0]
+        names = dict.fromkeys(missing, _MISSING)
+        names.update(db.fetchall(
+            f"SELECT id, name FROM public.users WHERE id = ANY(%(ids)s::{self._id_type}[]);",
+            {'ids': missing}, config=self.config))
+        return names
+
+    @profiling.profiled()
+    def refresh(self):
+        """
+        Move the window to the current time and apply the orders and carts
+        changed since the last refresh. Returns the number of order rows read.
+        The queries run before the state lock is taken, so readers only wait
+        for the in-memory merge.
+        """
+        with self._refresh_lock:
+            as_of = self.as_of
+            if as_of is None:
+                as_of = db.fetchall("SELECT LOCALTIMESTAMP;", config=self.config)[0][0]
+            elif isinstance(as_of, str):
+                as_of = datetime.fromisoformat(as_of)
+            start_day = (as_of - timedelta(days=self.window_days)).date()
+            rows = db.fetchall(ORDER_DELTA_QUERY, {
+                'window_start': start_day, 'as_of': as_of,
+                'since': self._order_watermark, 'previous': self.refreshed_at},
+                config=self.config)
+            categories = db.fetchall(CATEGORY_DELTA_QUERY, {'since': self._cart_watermark},
+                                     config=self.config)
+            unresolved = {user_id for user_id, name in self._names.items() if name is _MISSING}
+            names = self._lookup_names({row[2] for row in rows if row[5]} | unresolved)
+
+            with self._lock:
+                found = any(name is not _MISSING for user_id, name in names.items()
+                            if user_id in unresolved)
+                self._names.update(names)
+                changed = self._expire(start_day) > 0 or found
+                for order_id, day, user_id, group_id, amount, completed, changed_at in rows:
+                    if order_id in self._orders:
+                        self._remove(order_id)
+                    if completed:
+                        # SUM ignores a missing amount, but the group still counts.
+                        self._add(order_id, day, user_id, group_id, amount or Decimal(0))
+                    if changed_at is not None and (
+                            self._order_watermark is None or changed_at > self._order_watermark):
+                        self._order_watermark = changed_at
+                for user_id, name, changed_at in categories:
+                    self._categories[user_id].add(name)
+                    if changed_at is not None and (
+                            self._cart_watermark is None or changed_at > self._cart_watermark):
+                        self._cart_watermark = changed_at
+                changed = changed or bool(rows) or bool(categories)
+                if changed or self._ranking is None:
+                    self._ranking = self._rank(self.top_k)
+                self.refreshed_at = as_of
+            return len(rows)
+
+    def _rank(self, k):
+        """
+        The ``k`` highest totals among users that exist, whatever their name.
+        Every user with a total came in through a refresh, which already
+        looked up the name.
+        """
+        def known(user_id):
+            return self._names.get(user_id, _MISSING) is not _MISSING
+
+        candidates = heapq.nlargest(2 * k, self._totals.items(), key=lambda item: item[1])
+        if sum(known(user_id) for user_id, _ in candidates) < k:
+            candidates = sorted(self._totals.items(), key=lambda item: item[1], reverse=True)
+        return [(user_id, total) for user_id, total in candidates if known(user_id)][:k]
+
+    def top(self, k=None):
+        """
+        (user_id, name, total_revenue, group_count, categories) for the top
+        ``k`` users as of the last refresh, read from memory. Asking for more
+        than ``top_k`` users raises ``top_k`` for later refreshes.
+        """
+        k = self.top_k if k is None else k
+        with self._lock:
+            if k > self.top_k:
+                self.top_k = k
+                self._ranking = self._rank(k)
+            ranking = self._ranking or []
+            return [(user_id, self._names[user_id], total, len(self._groups[user_id]),
+                     sorted(self._categories.get(user_id, ())) or None)
+                    for user_id, total in ranking[:k]]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Top users by revenue over a trailing window.")
+    parser.add_argument('--window-days', type=int, default=WINDOW_DAYS)
+    parser.add_argument('--top', type=int, default=TOP_K)
+    parser.add_argument('--as-of', help="end of the window (default: now)")
+    parser.add_argument('--refresh-every', type=float, default=0,
+                        help="keep refreshing every N seconds")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    board = Leaderboard(args.window_days, args.top, as_of=args.as_of)
+    rows = board.refresh()
+    print(f"Loaded {rows} orders in {time.perf_counter() - started:.3f}s.")
+    while True:
+        started = time.perf_counter()
+        leaders = board.top()
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        for rank, (user_id, name, revenue, groups, categories) in enumerate(leaders, 1):
+            print(f"{rank:>3}. {name} ({user_id})  revenue={revenue}  groups={groups}  "
+                  f"categories={', '.join(categories or [])}")
+        print(f"Leaderboard as of {board.refreshed_at} read in {elapsed_ms:.2f} ms.")
+        if not args.refresh_every:
+            break
+        time.sleep(args.refresh_every)
+        started = time.perf_counter()
+        rows = board.refresh()
+        print(f"Refreshed {rows} changed orders in {time.perf_counter() - started:.3f}s.")
@@ -3,25 +3,29 @@
 # and showing retention percentages based on their group deal participation over 
 # the next 3 months.
 
-import psycopg2
+import json
+import os
+import sys
+import numpy as np
 import pandas as pd
 import seaborn as sns
 import matplotlib.pyplot as plt
 import logging
 from datetime import datetime
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import db  # noqa: E402
+import profiling  # noqa: E402
+
 logging.basicConfig(level=logging.INFO,
                     format='%(asctime)s - %(levelname)s - %(message)s')
 
-
-DB_CONFIG = {
-    'host': 'localhost',
-    'database': 'SQLTEST',
-    'user': 'postgres',
-    'password': 'Admin'
-}
+COHORT_WINDOW_MONTHS = 3
+COHORT_COUNTS_FILE = 'cohort_counts.csv'
+COHORT_STATE_FILE = 'cohort_state.json'
 
 
+@profiling.profiled()
 def fetch_user_data():
     """
     Connects to the PostgreSQL database and fetches user data for cohort analysis.
@@ -43,9 +47,8 @@ def fetch_user_data():
     """
 
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        df = pd.read_sql_query(query, conn)
-        conn.close()
+        df = db.read_frame(query, parse_dates=[
+                           'signup_date', 'participation_date'])
         logging.info("Data fetched successfully from the database.")
         return df
     except Exception as e:
@@ -53,17 +56,135 @@ def fetch_user_data():
         return None
 
 
+@profiling.profiled()
+def fetch_cohort_counts(since=None):
+    """
+    Aggregates cohorts on the server: distinct participating users per signup
+    month and exact calendar-month offset, so only the cohort x offset matrix
+    is transferred. With ``since`` only users who signed up on or after that
+    date are scanned.
+    """
+    query = """
+    SELECT 
+        DATE_TRUNC('month', users.created_at)::date AS cohort_month,
+        (EXTRACT(YEAR FROM AGE(groups.created_at, users.created_at)) * 12
+         + EXTRACT(MONTH FROM AGE(groups.created_at, users.created_at)))::int AS months_after_signup,
+        COUNT(DISTINCT users.id) AS users
+    FROM 
+        users
+    JOIN 
+        groups ON users.id = groups.created_by
+    WHERE 
+        users.created_at IS NOT NULL
+        AND groups.created_at IS NOT NULL
+        AND groups.created_at >= users.created_at
+        AND groups.created_at <= users.created_at + INTERVAL '3 months'
+        AND (%(since)s::timestamp IS NULL OR users.created_at >= %(since)s::timestamp)
+    GROUP BY 
+        1, 2;
+    """
+
+    try:
+        counts = db.read_frame(query, {'since': since}, parse_dates=['cohort_month'])
+        counts['cohort_month'] = pd.to_datetime(
+            counts['cohort_month']).dt.to_period('M')
+        logging.info("Cohort counts fetched successfully from the database.")
+        return counts
+    except Exception as e:
+        logging.error(f"Error fetching cohort counts: {e}")
+        return None
+
+
+def load_cohort_state():
+    """
+    Loads the stored cohort counts and the first cohort month whose
+    observation window was still open when they were computed.
+    """
+    if not (os.path.exists(COHORT_COUNTS_FILE) and os.path.exists(COHORT_STATE_FILE)):
+        return None, None
+    with open(COHORT_STATE_FILE, encoding='utf-8') as f:
+        state = json.load(f)
+    counts = pd.read_csv(COHORT_COUNTS_FILE)
+    counts['cohort_month'] = pd.PeriodIndex(counts['cohort_month'], freq='M')
+    return counts, pd.Period(state['first_open_cohort'], freq='M')
+
+
+def save_cohort_state(counts, first_open, as_of):
+    counts.to_csv(COHORT_COUNTS_FILE, index=False)
+    with open(COHORT_STATE_FILE, 'w', encoding='utf-8') as f:
+        json.dump({'first_open_cohort': str(first_open),
+                   'as_of': as_of.isoformat()}, f)
+
+
+@profiling.profiled()
+def refresh_cohort_counts():
+    """
+    Returns cohort counts for every cohort, recomputing only the cohorts whose
+    3-month observation window was still open at the previous refresh. A
+    cohort is closed once its last possible signup is more than
+    COHORT_WINDOW_MONTHS old; its counts can no longer change.
+    """
+    try:
+        as_of = pd.Timestamp(db.fetchall("SELECT NOW()::timestamp;")[0][0])
+    except Exception as e:
+        logging.error(f"Error fetching cohort counts: {e}")
+        return None
+    stored, first_open = load_cohort_state()
+    since = first_open.start_time if stored is not None else None
+
+    fresh = fetch_cohort_counts(since)
+    if fresh is None:
+        return None
+    if stored is not None:
+        closed = stored[stored['cohort_month'] < first_open]
+        fresh = pd.concat([closed, fresh], ignore_index=True) if len(fresh) else closed
+        logging.info(
+            f"Reused {closed['cohort_month'].nunique()} closed cohorts; recomputed cohorts from {first_open}.")
+
+    save_cohort_state(fresh, as_of.to_period('M') - COHORT_WINDOW_MONTHS, as_of)
+    return fresh
+
+
+@profiling.profiled()
+def load_user_data(path):
+    """
+    Loads user participation rows from a CSV or Parquet export with the
+    columns returned by fetch_user_data, reading only those columns.
+    """
+    columns = ['user_id', 'signup_date', 'participation_date']
+    try:
+        if path.endswith('.parquet'):
+            df = pd.read_parquet(path, columns=columns)
+        else:
+            df = pd.read_csv(path, usecols=columns, parse_dates=columns[1:])
+        logging.info(f"Data loaded from {path}.")
+        return df
+    except Exception as e:
+        logging.error(f"Error loading data from {path}: {e}")
+        return None
+
+
+@profiling.profiled()
 def preprocess_data(df):
     """
-    Preprocess the data to extract monthly cohorts and participation flags.
+    Preprocess the data to extract monthly cohorts and the number of whole
+    calendar months between signup and participation.
     """
     try:
 
         df['signup_date'] = pd.to_datetime(df['signup_date'])
         df['participation_date'] = pd.to_datetime(df['participation_date'])
-        df['cohort_month'] = df['signup_date'].dt.to_period('M')
-        df['months_after_signup'] = (
-            df['participation_date'] - df['signup_date']).dt.days // 30
+        df = df[df['participation_date'] >= df['signup_date']].copy()
+        signup = df['signup_date']
+        participation = df['participation_date']
+        df['cohort_month'] = signup.dt.to_period('M')
+        # Same rule as PostgreSQL AGE(): a month only counts once the day and
+        # time of the signup have been reached in the participation month.
+        months = (participation.dt.year - signup.dt.year) * 12 + \
+            (participation.dt.month - signup.dt.month)
+        not_reached = (participation - participation.dt.to_period('M').dt.start_time) < \
+            (signup - df['cohort_month'].dt.start_time)
+        df['months_after_signup'] = months - not_reached.astype(int)
 
         logging.info("Data preprocessing completed.")
         return df
@@ -72,17 +193,38 @@ def preprocess_data(df):
         return None
 
 
-def calculate_cohorts(df):
+@profiling.profiled()
+def count_cohort_users(df):
     """
-    Calculate monthly cohort retention based on participation in group deals.
+    Count distinct users per cohort month and month offset with NumPy, giving
+    the same layout as fetch_cohort_counts.
+    """
+    cohorts = df['cohort_month'].array.asi8
+    offsets = df['months_after_signup'].to_numpy(dtype=np.int64)
+    user_codes, _ = pd.factorize(df['user_id'])
+    triples = np.unique(np.column_stack(
+        [cohorts, offsets, user_codes]), axis=0)
+    pairs, users = np.unique(triples[:, :2], axis=0, return_counts=True)
+    return pd.DataFrame({
+        'cohort_month': pd.PeriodIndex.from_ordinals(pairs[:, 0], freq='M'),
+        'months_after_signup': pairs[:, 1],
+        'users': users,
+    })
+
+
+@profiling.profiled()
+def build_cohort_tables(counts):
+    """
+    Turn cohort counts into the (retention, cohort_pivot) pair: one row per
+    cohort month, one "Month N" column per offset, and retention as a
+    percentage of the first month.
     """
     try:
-        cohort_pivot = df.pivot_table(
+        cohort_pivot = counts.pivot(
             index='cohort_month',
             columns='months_after_signup',
-            values='user_id',
-            aggfunc='count'
-        )
+            values='users'
+        ).sort_index()
         cohort_pivot = cohort_pivot.fillna(0)
 
         cohort_pivot.columns = [f"Month {i+1}" for i in cohort_pivot.columns]
@@ -97,6 +239,20 @@ def calculate_cohorts(df):
         return None, None
 
 
+@profiling.profiled()
+def calculate_cohorts(df):
+    """
+    Calculate monthly cohort retention from preprocessed participation rows.
+    This is the client-side path for CSV or Parquet inputs.
+    """
+    try:
+        counts = count_cohort_users(df)
+    except Exception as e:
+        logging.error(f"Error during cohort calculation: {e}")
+        return None, None
+    return build_cohort_tables(counts)
+
+
 def save_to_csv(df, filename):
     """
     Save the retention DataFrame to a CSV file.
@@ -108,6 +264,7 @@ def save_to_csv(df, filename):
         logging.error(f"Error saving to CSV: {e}")
 
 
+@profiling.profiled()
 def visualize_cohorts(retention):
     """
     Generate a heatmap for cohort retention analysis.
@@ -126,16 +283,23 @@ def visualize_cohorts(retention):
         logging.error(f"Error during visualization: {e}")
 
 
-def main():
-    user_data = fetch_user_data()
-    if user_data is None:
-        return
+def main(input_path=None):
+    if input_path:
+        user_data = load_user_data(input_path)
+        if user_data is None:
+            return
 
-    processed_data = preprocess_data(user_data)
-    if processed_data is None:
-        return
+        processed_data = preprocess_data(user_data)
+        if processed_data is None:
+            return
+
+        retention_df, cohort_pivot = calculate_cohorts(processed_data)
+    else:
+        counts = refresh_cohort_counts()
+        if counts is None:
+            return
 
-    retention_df, cohort_pivot = calculate_cohorts(processed_data)
+        retention_df, cohort_pivot = build_cohort_tables(counts)
     if retention_df is None:
         return
 
@@ -144,4 +308,4 @@ def main():
 
 
 if __name__ == '__main__':
-    main()
+    main(sys.argv[1] if len(sys.argv) > 1 else None)
@@ -1,84 +1,18 @@
-import psycopg2
 import csv
+from sales_growth import calculate_sales_growth, current_vs_previous
 
 
-def calculate_sales_growth_with_query(db_params):
-    conn = psycopg2.connect(**db_params)
-    cursor = conn.cursor()
-
-    sales_growth_query = """
-    WITH sales_data AS (
-        SELECT 
-            pn.category_id,
-            c.name AS category_name,
-            SUM(o.total_amount) AS total_sales,
-            'Current Period' AS period
-        FROM 
-            public.orders o
-        JOIN 
-            public.product_ratings pr ON o.id = pr.order_id
-        JOIN 
-            public.products p ON pr.product_id = p.id
-        JOIN 
-            public.product_names pn ON p.name_id = pn.id
-        JOIN 
-            public.categories c ON pn.category_id = c.id
-        WHERE 
-            o.created_at BETWEEN '2024-09-14 17:52:36.368747' AND '2024-12-13 17:52:36.368747'
-        GROUP BY 
-            pn.category_id, c.name
-
-        UNION ALL
-
-        SELECT 
-            pn.category_id,
-            c.name AS category_name,
-            SUM(o.total_amount) AS total_sales,
-            'Previous Period' AS period
-        FROM 
-            public.orders o
-        JOIN 
-            public.product_ratings pr ON o.id = pr.order_id
-        JOIN 
-            public.products p ON pr.product_id = p.id
-        JOIN 
-            public.product_names pn ON p.name_id = pn.id
-        JOIN 
-            public.categories c ON pn.category_id = c.id
-        WHERE 
-            o.created_at BETWEEN '2024-06-16 17:52:36.368747' AND '2024-09-14 17:52:36.368747'
-        GROUP BY 
-            pn.category_id, c.name
-    )
-
-    SELECT 
-        current.category_id,
-        current.category_name,
-        current.total_sales AS current_sales,
-        previous.total_sales AS previous_sales,
-        CASE 
-            WHEN previous.total_sales = 0 THEN NULL
-            ELSE ((current.total_sales - previous.total_sales) / previous.total_sales) * 100
-        END AS sales_growth_percentage
-    FROM 
-        (SELECT category_id, category_name, total_sales 
-         FROM sales_data 
-         WHERE period = 'Current Period') AS current
-    LEFT JOIN 
-        (SELECT category_id, category_name, total_sales 
-         FROM sales_data 
-         WHERE period = 'Previous Period') AS previous
-    ON current.category_id = previous.category_id
-    ORDER BY 
-        current.category_name;
+def calculate_sales_growth_with_query(db_params=None, period='90 days', as_of='2024-12-13 17:52:36.368747',
+                                      use_rollup=False):
     """
-
-    cursor.execute(sales_growth_query)
-    results = cursor.fetchall()
-    cursor.close()
-    conn.close()
-
-    return results
+    Sales per category for the period ending at ``as_of`` compared with the
+    period before it, computed in a single scan by the sales growth engine.
+    With ``use_rollup`` the daily category rollup (sales_rollup.py) is read
+    instead of the order tables.
+    """
+    rows = calculate_sales_growth(
+        db_params, period=period, periods=1, as_of=as_of, source='ratings', use_rollup=use_rollup)
+    return current_vs_previous(rows)
 
 
 def write_results_to_csv(results, filename='sales_growth_results2.csv'):
@@ -93,17 +27,8 @@ def write_results_to_csv(results, filename='sales_growth_results2.csv'):
             writer.writerow(row)
 
 
-db_params = {
-    'dbname': 'SQLTEST',
-    'user': 'postgres',
-    'password': 'Admin',
-    'host': 'localhost',
-    'port': '5432',
-}
-
-
 if __name__ == "__main__":
-    results = calculate_sales_growth_with_query(db_params)
+    results = calculate_sales_growth_with_query()
     if results:
         write_results_to_csv(results)
         print(f"Results written to 'sales_growth_results.csv'")
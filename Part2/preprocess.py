@@ -2,20 +2,116 @@
 # (e.g., handling NULLs, encoding categorical variables, aggregating timestamps 
 # to periods).
 
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
 import psycopg2
 import pandas as pd
-from sqlalchemy import create_engine, inspect, text
-from sklearn.preprocessing import LabelEncoder
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import bindparam, inspect, text
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from dateutil import parser
+from vocabulary import VocabularyStore
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import db  # noqa: E402
+import profiling  # noqa: E402
+
+
+def _key_tuples(df, keys):
+    return zip(*(df[key].astype(str) for key in keys))
+
+
+def _rewrite_without_keys(path, out_path, keys, drop_keys, chunksize):
+    """
+    Copy a preprocessed CSV chunk by chunk, leaving out rows whose key is in
+    ``drop_keys`` because a newer version of them is about to be appended.
+    """
+    with open(path, 'rb') as src, open(out_path, 'wb') as out:
+        out.write(src.readline())
+    reader = pd.read_csv(path, chunksize=chunksize,
+                         dtype={key: str for key in keys})
+    for chunk in reader:
+        keep = [key not in drop_keys for key in _key_tuples(chunk, keys)]
+        chunk[keep].to_csv(out_path, mode='a', header=False, index=False)
+
+
+# Storage types for database column types when writing Parquet. Only REAL,
+# which is single precision in the database already, is stored as float32;
+# NUMERIC and DOUBLE PRECISION stay float64 so no precision is lost.
+ARROW_TYPES = [
+    ('SMALLINT', pa.int16()),
+    ('BIGINT', pa.int64()),
+    ('INTEGER', pa.int32()),
+    ('REAL', pa.float32()),
+    ('DOUBLE', pa.float64()),
+    ('FLOAT', pa.float64()),
+    ('BOOLEAN', pa.bool_()),
+    # Stored as text, as in the CSV exports, so merge keys read back unchanged.
+    ('UUID', pa.string()),
+]
+
+
+PERIOD_FREQS = {'day': 'D', 'week': 'W', 'month': 'M'}
+
+
+def period_code_to_start(codes, granularity='month'):
+    """
+    Convert integer period codes produced by ``aggregate_table`` back to the
+    start timestamp of each period.
+    """
+    return pd.PeriodIndex.from_ordinals(codes, freq=PERIOD_FREQS[granularity]).start_time
+
+
+def load_preprocessed(path, columns=None, periods=None):
+    """
+    Read a Parquet export, loading only ``columns`` and, for partitioned
+    tables, only the partitions listed in ``periods``.
+    """
+    filters = [('period', 'in', list(periods))] if periods else None
+    return pd.read_parquet(path, columns=columns, filters=filters)
+
+
+def _move_staged_files(staging_dir, target_dir):
+    for root, _, files in os.walk(staging_dir):
+        rel = os.path.relpath(root, staging_dir)
+        for name in files:
+            os.makedirs(os.path.join(target_dir, rel), exist_ok=True)
+            os.replace(os.path.join(root, name),
+                       os.path.join(target_dir, rel, name))
+
+
+def _drop_keys_from_parquet_dir(part_dir, keys, drop_keys, run_id):
+    """
+    Rewrite the files of one partition without the rows whose key is in
+    ``drop_keys``. Only partitions touched by an increment are rewritten.
+    """
+    files = sorted(os.path.join(part_dir, name) for name in os.listdir(part_dir)
+                   if name.endswith('.parquet'))
+    if not files:
+        return
+    table = pa.concat_tables([pq.read_table(f) for f in files])
+    keep = [key not in drop_keys
+            for key in _key_tuples(table.select(keys).to_pandas(), keys)]
+    pq.write_table(table.filter(pa.array(keep)),
+                   os.path.join(part_dir, f"merged-{run_id}.parquet"))
+    for f in files:
+        os.remove(f)
 
 
 class DataPreprocessor:
-    def __init__(self, db_config):
-        db_string = "postgresql://{}:{}@{}:{}/{}".format(
-            db_config['user'], db_config['password'], db_config['host'], '5432', db_config['database'])
-        self.engine = create_engine(db_string)
+    def __init__(self, db_config=None, chunksize=50000, vocabulary_dir='vocabularies',
+                 watermark_dir='watermarks', engine=None):
+        self.engine = engine if engine is not None else db.get_engine(db_config)
         self.inspector = inspect(self.engine)
         self.table_configs = {}
+        self.chunksize = chunksize
+        self.vocabulary = VocabularyStore(vocabulary_dir)
+        self.watermark_dir = watermark_dir
+        self._pending_watermarks = {}
 
     def auto_generate_config(self, table_name):
         columns = self.inspector.get_columns(table_name)
@@ -31,72 +127,527 @@ class DataPreprocessor:
                 config['timestamp_cols'].append(col_name)
         return config
 
+    def table_sizes(self):
+        """
+        Return the on-disk size in bytes of every table in the public schema.
+        """
+        query = text("""
+            SELECT c.relname, pg_total_relation_size(c.oid)
+            FROM pg_class c
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE n.nspname = 'public' AND c.relkind IN ('r', 'p')
+        """)
+        with self.engine.connect() as conn:
+            return dict(conn.execute(query).fetchall())
+
     def add_table_config(self, table_name, config):
         self.table_configs[table_name] = config
 
-    def preprocess_table(self, table_name):
+    def _resolve_config(self, table_name):
         if table_name not in self.table_configs:
             print(
                 f"Warning: No configuration found for table '{table_name}'. Using auto-generated config.")
             self.table_configs[table_name] = self.auto_generate_config(
                 table_name)
+        return self.table_configs[table_name]
 
-        config = self.table_configs[table_name]
+    @profiling.profiled()
+    def _transform(self, df, table_name, config):
+        """
+        Apply null filling, categorical encoding and timestamp handling to a frame.
+        Categorical codes come from the persistent vocabulary store, so they are
+        the same for every chunk and every run.
+        """
+        for col in df.columns:
+            if df[col].isnull().any():
+                if pd.api.types.is_numeric_dtype(df[col]):
+                    df[col] = df[col].fillna(0)
+                else:
+                    df[col] = df[col].fillna('')
+
+        for col in config.get('categorical_cols', []):
+            if col in df.columns:
+                df[col] = self.vocabulary.encode(table_name, col, df[col])
+            else:
+                print(
+                    f"Warning: Column '{col}' not found in table '{table_name}'. Skipping encoding.")
+
+        for col in config.get('timestamp_cols', []):
+            if col in df.columns:
+                try:
+                    df[col] = pd.to_datetime(df[col])
+                    df[col] = df[col].dt.date
+                except:
+                    print(
+                        f"Warning: Could not convert column '{col}' to datetime in table '{table_name}'. Check data type.")
+            else:
+                print(
+                    f"Warning: Column '{col}' not found in table '{table_name}'. Skipping timestamp aggregation.")
+
+        return df
+
+    @profiling.profiled()
+    def preprocess_table(self, table_name):
+        config = self._resolve_config(table_name)
         try:
             df = pd.read_sql_table(table_name, self.engine)
+            df = self._transform(df, table_name, config)
+            self.vocabulary.save(table_name)
+            return df
+        except Exception as e:
+            print(f"Error reading or processing table '{table_name}': {e}")
+            return None
+
+    def watermark_column(self, table_name):
+        """
+        Pick the column used as a high-water mark for incremental runs:
+        an explicit ``watermark_col`` in the table config, then ``updated_at``,
+        then ``created_at``, then a single integer primary key.
+        """
+        config = self._resolve_config(table_name)
+        if config.get('watermark_col'):
+            return config['watermark_col']
+        for col in ('updated_at', 'created_at'):
+            if col in config.get('timestamp_cols', []):
+                return col
+        pk = self.primary_key(table_name)
+        if len(pk) == 1:
+            col_types = {col['name']: str(col['type'])
+                         for col in self.inspector.get_columns(table_name)}
+            if 'INT' in col_types.get(pk[0], ''):
+                return pk[0]
+        return None
+
+    def _column_type(self, table_name, col):
+        for column in self.inspector.get_columns(table_name):
+            if column['name'] == col:
+                return column['type']
+        return None
+
+    def _watermark_kind(self, table_name, col):
+        col_type = str(self._column_type(table_name, col)).upper()
+        if 'DATE' in col_type or 'TIME' in col_type:
+            return 'temporal'
+        if 'INT' in col_type:
+            return 'integer'
+        return 'text'
+
+    def _watermark_value(self, table_name, col, value):
+        """
+        The JSON form of a watermark, chosen by the column's SQL type rather
+        than by what the driver returned: drivers such as sqlite hand back
+        timestamps as strings.
+        """
+        kind = self._watermark_kind(table_name, col)
+        if kind == 'temporal':
+            return pd.to_datetime(value).isoformat()
+        if kind == 'integer':
+            return int(value)
+        return str(value)
+
+    def _watermark_param(self, table_name, col, value):
+        kind = self._watermark_kind(table_name, col)
+        if kind == 'temporal':
+            return pd.to_datetime(value).to_pydatetime()
+        if kind == 'integer':
+            return int(value)
+        return value
+
+    def primary_key(self, table_name):
+        return self.inspector.get_pk_constraint(table_name).get('constrained_columns') or []
+
+    def _key_columns(self, table_name):
+        """
+        Primary and foreign key columns: identifiers, never values to sum.
+        """
+        columns = set(self.primary_key(table_name))
+        for fk in self.inspector.get_foreign_keys(table_name):
+            columns.update(fk['constrained_columns'])
+        return columns
+
+    def _watermark_path(self, table_name):
+        return os.path.join(self.watermark_dir, f"{table_name}.json")
 
-            for col in df.columns:
-                if df[col].isnull().any():
-                    if pd.api.types.is_numeric_dtype(df[col]):
-                        df[col] = df[col].fillna(0)
+    def load_watermark(self, table_name):
+        path = self._watermark_path(table_name)
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+
+    def commit_watermark(self, table_name):
+        """
+        Persist the watermark reached by the last fully consumed incremental read.
+        """
+        watermark = self._pending_watermarks.pop(table_name, None)
+        if watermark is None:
+            return
+        os.makedirs(self.watermark_dir, exist_ok=True)
+        path = self._watermark_path(table_name)
+        with open(f"{path}.tmp", 'w', encoding='utf-8') as f:
+            json.dump(watermark, f)
+        os.replace(f"{path}.tmp", path)
+
+    def _watermark_fallback(self, table_name, watermark_col):
+        """
+        ``updated_at`` is often only set once a row changes, so rows that were
+        never updated are tracked through ``created_at`` instead.
+        """
+        config = self._resolve_config(table_name)
+        if watermark_col == 'updated_at' and 'created_at' in config.get('timestamp_cols', []):
+            return 'created_at'
+        return None
+
+    def _read_chunks(self, conn, table_name, chunksize, watermark_col, since, inclusive):
+        if since is None:
+            return pd.read_sql_table(table_name, conn, chunksize=chunksize)
+        op = '>=' if inclusive else '>'
+        expr = f'"{watermark_col}"'
+        fallback = self._watermark_fallback(table_name, watermark_col)
+        if fallback:
+            expr = f'COALESCE({expr}, "{fallback}")'
+        # Binding with the column type lets the dialect format the watermark
+        # the way it stores the column.
+        query = text(
+            f'SELECT * FROM "{table_name}" WHERE {expr} {op} :since').bindparams(
+            bindparam('since', type_=self._column_type(table_name, watermark_col)))
+        since = self._watermark_param(table_name, watermark_col, since)
+        return pd.read_sql_query(query, conn, params={'since': since}, chunksize=chunksize)
+
+    def iter_preprocessed_chunks(self, table_name, chunksize=None, incremental=False, resume=True):
+        """
+        Stream a table through a server-side cursor and yield preprocessed chunks,
+        so peak memory depends on ``chunksize`` rather than on the table size.
+        With ``incremental`` the watermark reached is tracked and, if ``resume``,
+        only rows past the stored watermark are read; call ``commit_watermark``
+        once the chunks have been written.
+        """
+        config = self._resolve_config(table_name)
+        watermark_col = self.watermark_column(
+            table_name) if incremental else None
+        since = None
+        if watermark_col and resume:
+            stored = self.load_watermark(table_name)
+            if stored and stored['column'] == watermark_col:
+                since = stored['value']
+        merge_keys = self._merge_keys(table_name, watermark_col)
+        fallback = self._watermark_fallback(table_name, watermark_col)
+        latest = None
+        try:
+            with self.engine.connect() as conn:
+                # A full-table scan can legitimately outlive the report timeout.
+                if conn.dialect.name == 'postgresql':
+                    conn.execute(text("SET LOCAL statement_timeout = 0"))
+                conn.execution_options(stream_results=True)
+                chunks = self._read_chunks(conn, table_name, chunksize or self.chunksize,
+                                           watermark_col, since, inclusive=bool(merge_keys))
+                for chunk in chunks:
+                    marks = chunk[watermark_col] if watermark_col else None
+                    if fallback:
+                        marks = marks.fillna(chunk[fallback])
+                    if marks is not None and marks.notna().any():
+                        chunk_max = marks.max()
+                        latest = chunk_max if latest is None else max(
+                            latest, chunk_max)
+                    yield self._transform(chunk, table_name, config)
+            if latest is not None:
+                self._pending_watermarks[table_name] = {
+                    'column': watermark_col,
+                    'value': self._watermark_value(table_name, watermark_col, latest)}
+        finally:
+            self.vocabulary.save(table_name)
+
+    def _merge_keys(self, table_name, watermark_col):
+        """
+        Rows read by ``updated_at`` may already be in the output, so they are
+        merged on the primary key; other watermarks only ever see new rows.
+        """
+        if watermark_col != 'updated_at':
+            return []
+        return self.primary_key(table_name)
+
+    @profiling.profiled()
+    def aggregate_table(self, table_name, granularity='month', keys=None, time_col=None,
+                        value_cols=None, chunksize=None):
+        """
+        Roll a table up by time period (day, week or month) and ``keys``,
+        returning the sum of every value column and the row count per group.
+        By default the value columns are the numeric columns that are not
+        keys, categorical codes, or primary or foreign key columns.
+        Periods are stored as int32 period ordinals (see ``period_code_to_start``).
+        Chunks are aggregated as they stream, so memory follows the number of
+        groups rather than the number of rows.
+        """
+        freq = PERIOD_FREQS[granularity]
+        config = self._resolve_config(table_name)
+        time_col = time_col or self.partition_column(table_name)
+        if time_col is None:
+            raise ValueError(
+                f"Table '{table_name}' has no timestamp column to aggregate on.")
+        keys = list(keys or [])
+        group_cols = ['period'] + keys
+        result = None
+        for chunk in self.iter_preprocessed_chunks(table_name, chunksize):
+            if value_cols is None:
+                excluded = set(keys) | set(config.get('categorical_cols', [])) \
+                    | self._key_columns(table_name)
+                value_cols = [col for col in chunk.columns
+                              if pd.api.types.is_numeric_dtype(chunk[col])
+                              and col not in excluded]
+            periods = pd.to_datetime(chunk[time_col]).dt.to_period(freq)
+            chunk = chunk[periods.notna()].assign(
+                period=periods[periods.notna()].array.asi8.astype('int32'))
+            partial = chunk.groupby(group_cols).agg(
+                **{f"{col}_sum": (col, 'sum') for col in value_cols},
+                row_count=(time_col, 'size'))
+            result = partial if result is None else \
+                pd.concat([result, partial]).groupby(level=group_cols).sum()
+
+        if result is None:
+            return pd.DataFrame(columns=group_cols + [f"{col}_sum" for col in value_cols or []] + ['row_count'])
+        return result.reset_index()
+
+    def partition_column(self, table_name):
+        config = self._resolve_config(table_name)
+        if 'partition_col' in config:
+            return config['partition_col']
+        timestamp_cols = config.get('timestamp_cols', [])
+        if 'created_at' in timestamp_cols:
+            return 'created_at'
+        return timestamp_cols[0] if timestamp_cols else None
+
+    def arrow_schema(self, table_name, sample):
+        """
+        Build the Parquet schema for a table: categorical codes as int32, dates
+        as date32 and numeric columns downcast according to their database type.
+        Other columns keep the type Arrow infers from ``sample``.
+        """
+        config = self._resolve_config(table_name)
+        db_types = {col['name']: str(col['type'])
+                    for col in self.inspector.get_columns(table_name)}
+        fields = []
+        for field in pa.Schema.from_pandas(sample, preserve_index=False):
+            name = field.name
+            if name in config.get('categorical_cols', []):
+                field = field.with_type(pa.int32())
+            elif name in config.get('timestamp_cols', []):
+                field = field.with_type(pa.date32())
+            else:
+                for db_type, arrow_type in ARROW_TYPES:
+                    if db_type in db_types.get(name, ''):
+                        field = field.with_type(arrow_type)
+                        break
+            fields.append(field)
+        return pa.schema(fields)
+
+    def _write_parquet_chunk(self, chunk, root_path, schema, partition_col, freq, basename):
+        text_cols = [field.name for field in schema
+                     if field.type == pa.string() and field.name in chunk.columns]
+        chunk = chunk.astype({col: str for col in text_cols})
+        partition_cols = None
+        if partition_col and partition_col in chunk.columns:
+            periods = pd.to_datetime(chunk[partition_col], errors='coerce').dt.to_period(freq)
+            chunk = chunk.assign(period=periods.astype(str))
+            schema = schema.append(pa.field('period', pa.string()))
+            partition_cols = ['period']
+        table = pa.Table.from_pandas(chunk, schema=schema, preserve_index=False)
+        pq.write_to_dataset(table, root_path, partition_cols=partition_cols,
+                            basename_template=f"{basename}-{{i}}.parquet")
+        return set(chunk['period']) if partition_cols else set()
+
+    def _export_parquet(self, table_name, path, chunksize, incremental):
+        """
+        Write a table as a Parquet dataset partitioned by time period. Full runs
+        are staged next to the target and swapped in; incremental runs stage the
+        new rows, rewrite the partitions holding updated rows, then move the new
+        files into place.
+        """
+        path = path or f"{table_name}_preprocessed.parquet"
+        resume = incremental and os.path.isdir(
+            path) and self.load_watermark(table_name) is not None
+        staging_dir = f"{path}.delta" if resume else f"{path}.tmp"
+        watermark_col = self.watermark_column(table_name)
+        merge_keys = self._merge_keys(table_name, watermark_col) if resume else []
+        partition_col = self.partition_column(table_name)
+        freq = self._resolve_config(table_name).get('partition_period', 'M')
+        run_id = time.strftime('%Y%m%dT%H%M%S')
+        schema = None
+        rows = 0
+        new_keys = set()
+        touched = set()
+        if os.path.exists(staging_dir):
+            shutil.rmtree(staging_dir)
+        try:
+            chunks = self.iter_preprocessed_chunks(
+                table_name, chunksize, incremental, resume=resume)
+            for i, chunk in enumerate(chunks):
+                if schema is None:
+                    schema = self.arrow_schema(table_name, chunk)
+                if merge_keys:
+                    new_keys.update(_key_tuples(chunk, merge_keys))
+                touched |= self._write_parquet_chunk(
+                    chunk, staging_dir, schema, partition_col, freq, f"part-{run_id}-{i}")
+                rows += len(chunk)
+
+            if not resume:
+                os.makedirs(staging_dir, exist_ok=True)
+                if os.path.exists(path):
+                    shutil.rmtree(path)
+                os.replace(staging_dir, path)
+            elif rows:
+                if merge_keys:
+                    if touched and partition_col != watermark_col:
+                        part_dirs = [os.path.join(path, f"period={period}")
+                                     for period in touched]
                     else:
-                        df[col] = df[col].fillna('')
+                        # Partitioned on the watermark itself, an updated row
+                        # moves to a new period and its old version can be in
+                        # any partition.
+                        part_dirs = [root for root, _, _ in os.walk(path)]
+                    for part_dir in part_dirs:
+                        if os.path.isdir(part_dir):
+                            _drop_keys_from_parquet_dir(
+                                part_dir, merge_keys, new_keys, run_id)
+                _move_staged_files(staging_dir, path)
+            self.commit_watermark(table_name)
+            return rows
+        except Exception as e:
+            print(f"Error reading or processing table '{table_name}': {e}")
+            return None
+        finally:
+            if os.path.exists(staging_dir):
+                shutil.rmtree(staging_dir)
 
-            for col in config.get('categorical_cols', []):
-                if col in df.columns:
-                    le = LabelEncoder()
-                    df[col] = le.fit_transform(df[col])
-                else:
-                    print(
-                        f"Warning: Column '{col}' not found in table '{table_name}'. Skipping encoding.")
-
-            for col in config.get('timestamp_cols', []):
-                if col in df.columns:
-                    try:
-                        df[col] = pd.to_datetime(df[col])
-                        df[col] = df[col].dt.date
-                    except:
-                        print(
-                            f"Warning: Could not convert column '{col}' to datetime in table '{table_name}'. Check data type.")
-                else:
-                    print(
-                        f"Warning: Column '{col}' not found in table '{table_name}'. Skipping timestamp aggregation.")
+    @profiling.profiled()
+    def export_table(self, table_name, path=None, chunksize=None, incremental=False,
+                     output_format='csv'):
+        """
+        Preprocess a table chunk by chunk and append each chunk to a CSV file,
+        or to a partitioned Parquet dataset when ``output_format='parquet'``.
+        With ``incremental`` and an existing output, only rows past the stored
+        watermark are fetched and appended or merged into it.
+        Returns the number of rows written, or None on failure.
+        """
+        if output_format == 'parquet':
+            return self._export_parquet(table_name, path, chunksize, incremental)
+        path = path or f"{table_name}_preprocessed.csv"
+        if incremental and os.path.exists(path) and self.load_watermark(table_name):
+            return self._export_increment(table_name, path, chunksize)
 
-            return df
+        tmp_path = f"{path}.tmp"
+        rows = 0
+        try:
+            chunks = self.iter_preprocessed_chunks(
+                table_name, chunksize, incremental, resume=False)
+            for i, chunk in enumerate(chunks):
+                chunk.to_csv(tmp_path, mode='w' if i == 0 else 'a',
+                             header=i == 0, index=False)
+                rows += len(chunk)
+            os.replace(tmp_path, path)
+            self.commit_watermark(table_name)
+            return rows
+        except Exception as e:
+            print(f"Error reading or processing table '{table_name}': {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return None
+
+    def _export_increment(self, table_name, path, chunksize):
+        merge_keys = self._merge_keys(
+            table_name, self.watermark_column(table_name))
+        delta_path = f"{path}.delta"
+        tmp_path = f"{path}.tmp"
+        rows = 0
+        new_keys = set()
+        try:
+            for i, chunk in enumerate(self.iter_preprocessed_chunks(table_name, chunksize, incremental=True)):
+                if merge_keys:
+                    new_keys.update(_key_tuples(chunk, merge_keys))
+                chunk.to_csv(delta_path, mode='w' if i == 0 else 'a',
+                             header=False, index=False)
+                rows += len(chunk)
+
+            if rows and merge_keys:
+                _rewrite_without_keys(path, tmp_path, merge_keys,
+                                      new_keys, chunksize or self.chunksize)
+                with open(tmp_path, 'ab') as out, open(delta_path, 'rb') as delta:
+                    shutil.copyfileobj(delta, out)
+                os.replace(tmp_path, path)
+            elif rows:
+                with open(path, 'ab') as out, open(delta_path, 'rb') as delta:
+                    shutil.copyfileobj(delta, out)
+            self.commit_watermark(table_name)
+            return rows
         except Exception as e:
             print(f"Error reading or processing table '{table_name}': {e}")
             return None
+        finally:
+            for leftover in (delta_path, tmp_path):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
 
     def close_connection(self):
         self.engine.dispose()
 
 
-db_config = {
-    'host': 'localhost',
-    'database': 'SQLTEST',
-    'user': 'postgres',
-    'password': 'Admin'
-}
+_worker_preprocessor = None
+
+
+def _init_worker(db_config, chunksize, vocabulary_dir, table_configs):
+    global _worker_preprocessor
+    _worker_preprocessor = DataPreprocessor(
+        db_config, chunksize, vocabulary_dir)
+    _worker_preprocessor.table_configs.update(table_configs)
 
-preprocessor = DataPreprocessor(db_config)
 
+def _export_in_worker(table_name, incremental, output_format):
+    start = time.perf_counter()
+    rows = _worker_preprocessor.export_table(
+        table_name, incremental=incremental, output_format=output_format)
+    return table_name, rows, time.perf_counter() - start
+
+
+@profiling.profiled()
+def run_parallel(db_config=None, table_names=None, workers=None, chunksize=50000,
+                 vocabulary_dir='vocabularies', table_configs=None, incremental=False,
+                 output_format='csv', exclude=None):
+    """
+    Export tables across a process pool, largest tables first. Every worker
+    builds its own DataPreprocessor and therefore its own engine. Tables in
+    ``exclude`` are left out, e.g. derived tables other jobs are rewriting.
+    Returns a dict of table name -> (rows written, seconds).
+    """
+    preprocessor = DataPreprocessor(db_config, chunksize, vocabulary_dir)
+    try:
+        sizes = preprocessor.table_sizes()
+        if table_names is None:
+            table_names = preprocessor.inspector.get_table_names()
+    finally:
+        preprocessor.close_connection()
+
+    table_names = sorted(
+        (name for name in table_names if name not in set(exclude or [])),
+        key=lambda name: sizes.get(name, 0), reverse=True)
+    timings = {}
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(db_config, chunksize, vocabulary_dir, table_configs or {})) as pool:
+        futures = [pool.submit(_export_in_worker, name, incremental, output_format)
+                   for name in table_names]
+        for done, future in enumerate(as_completed(futures), 1):
+            table_name, rows, elapsed = future.result()
+            timings[table_name] = (rows, elapsed)
+            status = f"{rows} rows" if rows is not None else "failed"
+            print(
+                f"[{done}/{len(table_names)}] '{table_name}': {status} in {elapsed:.1f}s")
 
-table_names = preprocessor.inspector.get_table_names()
+    print(f"Preprocessed {len(table_names)} tables in {time.perf_counter() - start:.1f}s")
+    return timings
 
-for table_name in table_names:
-    preprocessed_df = preprocessor.preprocess_table(table_name)
-    if preprocessed_df is not None:
-        preprocessed_df.to_csv(f"{table_name}_preprocessed.csv", index=False)
-        print(f"Preprocessed '{table_name}' successfully.")
 
-preprocessor.close_connection()
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Preprocess and export tables in parallel.")
+    parser.add_argument('--tables', nargs='+', help="tables to export (default: all)")
+    parser.add_argument('--exclude', nargs='+', default=[], help="tables to leave out")
+    args = parser.parse_args()
+    run_parallel(table_names=args.tables, incremental=True, exclude=args.exclude)
@@ -0,0 +1,210 @@
+# Compute per-category sales for any number of consecutive periods (weekly,
+# monthly or a fixed interval) in a single scan of the order tables, and derive
+# period-over-period growth and category rankings with window functions.
+
+import csv
+import os
+import sys
+from datetime import datetime
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import db  # noqa: E402
+import profiling  # noqa: E402
+
+
+# Expressions for the category, timestamp and amount of each sales row.
+ORDER_COLUMNS = {
+    'category_id': 'c.id',
+    'category_name': 'c.name',
+    'created_at': 'o.created_at',
+    'amount': 'o.total_amount',
+}
+# A rollup day is placed by its last instant, so with a midnight as-of date
+# it lands in the same period as the orders it summarises.
+ROLLUP_COLUMNS = {
+    'category_id': 'r.category_id',
+    'category_name': 'r.category_name',
+    'created_at': "(r.day + 1 - INTERVAL '1 microsecond')",
+    'amount': 'r.revenue',
+}
+
+# The two join paths the existing reports use to reach a category from an order.
+SALES_SOURCES = {
+    'ratings': """
+        FROM
+            public.orders o
+        JOIN
+            public.product_ratings pr ON o.id = pr.order_id
+        JOIN
+            public.products p ON pr.product_id = p.id
+        JOIN
+            public.product_names pn ON p.name_id = pn.id
+        JOIN
+            public.categories c ON pn.category_id = c.id
+    """,
+    'cart_variations': """
+        FROM
+            public.groups_carts gc
+        JOIN
+            public.orders o ON gc.id = o.groups_carts_id
+        JOIN
+            public.group_cart_variations gcv ON gc.id = gcv.group_cart_id
+        JOIN
+            public.product_variations pv ON gcv.product_variation_id = pv.id
+        JOIN
+            public.products p ON pv.product_id = p.id
+        JOIN
+            public.product_names pn ON p.name_id = pn.id
+        JOIN
+            public.categories c ON pn.category_id = c.id
+    """,
+}
+
+# The daily rollup maintained by sales_rollup.py holds both join paths.
+ROLLUP_SOURCE = """
+        FROM
+            public.category_sales_daily r
+"""
+
+PERIOD_LENGTHS = {'week': '1 week', 'month': '1 month'}
+
+# Period 0 ends at the as-of date, period 1 is the one before it, and so on.
+# Months are counted in calendar months back from the as-of date; every other
+# period length is a fixed interval.
+MONTH_INDEX = """(
+    EXTRACT(YEAR FROM AGE(%(as_of)s::timestamp, {created_at})) * 12
+    + EXTRACT(MONTH FROM AGE(%(as_of)s::timestamp, {created_at})))::int"""
+INTERVAL_INDEX = """FLOOR(
+    EXTRACT(EPOCH FROM (%(as_of)s::timestamp - {created_at}))
+    / EXTRACT(EPOCH FROM %(length)s::interval))::int"""
+
+GROWTH_COLUMNS = ['Category ID', 'Category Name', 'Period Index', 'Period Start',
+                  'Total Sales', 'Previous Sales', 'Growth Percentage', 'Sales Rank']
+
+
+def build_sales_growth_query(period='month', source='ratings', top_n=None, use_rollup=False):
+    if use_rollup:
+        columns, from_clause = ROLLUP_COLUMNS, ROLLUP_SOURCE
+        source_filter = "AND r.source = %(source)s"
+    else:
+        columns, from_clause = ORDER_COLUMNS, SALES_SOURCES[source]
+        source_filter = ""
+    period_index = (MONTH_INDEX if period == 'month' else INTERVAL_INDEX).format(
+        created_at=columns['created_at'])
+    top_filter = "AND sales_rank <= %(top_n)s" if top_n else ""
+    return f"""
+    WITH sales AS (
+        SELECT
+            {columns['category_id']} AS category_id,
+            {columns['category_name']} AS category_name,
+            {period_index} AS period_index,
+            SUM({columns['amount']}) AS total_sales
+        {from_clause}
+        WHERE
+            {columns['created_at']} > %(as_of)s::timestamp - %(length)s::interval * %(scan_periods)s
+            AND {columns['created_at']} <= %(as_of)s::timestamp
+            {source_filter}
+        GROUP BY
+            1, 2, 3
+    ),
+    grid AS (
+        SELECT DISTINCT
+            s.category_id,
+            s.category_name,
+            g.period_index
+        FROM
+            sales s
+        CROSS JOIN
+            generate_series(0, %(scan_periods)s - 1) AS g(period_index)
+    ),
+    growth AS (
+        SELECT
+            grid.category_id,
+            grid.category_name,
+            grid.period_index,
+            %(as_of)s::timestamp - %(length)s::interval * (grid.period_index + 1) AS period_start,
+            s.total_sales,
+            LAG(s.total_sales) OVER w AS previous_sales,
+            RANK() OVER (
+                PARTITION BY grid.period_index
+                ORDER BY s.total_sales DESC NULLS LAST) AS sales_rank
+        FROM
+            grid
+        LEFT JOIN
+            sales s
+            ON s.category_id = grid.category_id
+            AND s.period_index = grid.period_index
+        WINDOW w AS (PARTITION BY grid.category_id ORDER BY grid.period_index DESC)
+    )
+
+    SELECT
+        category_id,
+        category_name,
+        period_index,
+        period_start,
+        total_sales,
+        previous_sales,
+        CASE
+            WHEN previous_sales = 0 THEN NULL
+            ELSE ((total_sales - previous_sales) / previous_sales) * 100
+        END AS sales_growth_percentage,
+        sales_rank
+    FROM
+        growth
+    WHERE
+        period_index < %(periods)s
+        {top_filter}
+    ORDER BY
+        period_index, sales_rank, category_name;
+    """
+
+
+@profiling.profiled()
+def calculate_sales_growth(db_params=None, period='month', periods=12, as_of=None,
+                           source='ratings', top_n=None, use_rollup=False):
+    """
+    Return per-category sales and growth for ``periods`` consecutive periods
+    ending at ``as_of``, one row per category and period (see GROWTH_COLUMNS).
+    ``period`` is 'week', 'month' or any PostgreSQL interval such as '90 days'.
+    One extra period is scanned so the oldest period also has a growth value.
+    With ``top_n`` only the best-selling categories of each period are returned.
+    With ``use_rollup`` the figures come from the daily category rollup
+    instead of the order tables; pass a date as ``as_of`` for exact periods.
+    """
+    params = {
+        'as_of': as_of or datetime.now(),
+        'length': PERIOD_LENGTHS.get(period, period),
+        'periods': periods,
+        'scan_periods': periods + 1,
+        'top_n': top_n,
+        'source': source,
+    }
+    return db.fetchall(build_sales_growth_query(period, source, top_n, use_rollup),
+                       params, config=db_params)
+
+
+def current_vs_previous(rows):
+    """
+    Reduce engine rows to the (category id, name, current sales, previous
+    sales, growth) layout of the original two-window reports.
+    """
+    current = [row for row in rows if row[2] == 0 and row[4] is not None]
+    return [(row[0], row[1], row[4], row[5], row[6])
+            for row in sorted(current, key=lambda row: row[1])]
+
+
+def write_growth_to_csv(rows, filename='sales_growth_trend.csv'):
+    with open(filename, mode='w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(GROWTH_COLUMNS)
+        for row in rows:
+            writer.writerow(row)
+
+
+if __name__ == "__main__":
+    rows = calculate_sales_growth(period='month', periods=12, top_n=10)
+    if rows:
+        write_growth_to_csv(rows)
+        print("Results written to 'sales_growth_trend.csv'")
+    else:
+        print("No sales growth data found.")
@@ -0,0 +1,186 @@
+# Maintain per-vendor revenue so the dashboard can rank vendors without
+# scanning the order tables. A daily rollup per vendor is refreshed from the
+# last stored day onward, and the all-time totals are adjusted by the same
+# days instead of being rebuilt.
+#
+# Orders are attributed to vendors through products.vendor_id. That column is
+# not part of the original report schema (the synthetic schema in
+# benchmarks/schema.sql has it), so the refresh stops with an error on a
+# database whose products table lacks it.
+
+import os
+import sys
+from datetime import date
+
+from sales_growth import SALES_SOURCES
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import db  # noqa: E402
+import profiling  # noqa: E402
+
+
+DAILY_TABLE = 'public.vendor_sales_daily'
+TOTALS_TABLE = 'public.vendor_sales_totals'
+
+# An order is counted once per vendor even when several of its rows reach
+# products of the same vendor.
+DAILY_SELECT = """
+    SELECT
+        %(source)s::text AS source,
+        v.vendor_id,
+        v.day,
+        SUM(v.total_amount) AS revenue,
+        COUNT(*) AS order_count
+    FROM (
+        SELECT DISTINCT
+            o.id,
+            p.vendor_id,
+            o.total_amount,
+            o.created_at::date AS day
+        {from_clause}
+        WHERE
+            p.vendor_id IS NOT NULL
+            AND (%(since)s::date IS NULL OR o.created_at >= %(since)s::date)
+    ) v
+    GROUP BY
+        v.vendor_id, v.day
+"""
+
+CHANGED_TOTALS = f"""
+    SELECT
+        source,
+        vendor_id,
+        SUM(revenue) AS revenue,
+        SUM(order_count) AS order_count
+    FROM
+        {DAILY_TABLE}
+    WHERE
+        %(start)s::date IS NULL OR day >= %(start)s::date
+    GROUP BY
+        source, vendor_id
+"""
+
+
+def check_vendor_column(cursor):
+    cursor.execute("""
+        SELECT 1
+        FROM information_schema.columns
+        WHERE table_schema = 'public' AND table_name = 'products' AND column_name = 'vendor_id';
+    """)
+    if cursor.fetchone() is None:
+        raise RuntimeError(
+            "public.products has no vendor_id column; vendor sales need each product's vendor.")
+
+
+def create_vendor_tables(cursor):
+    # WITH NO DATA takes the column types from the source tables.
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {DAILY_TABLE} AS
+        {DAILY_SELECT.format(from_clause=SALES_SOURCES['cart_variations'])}
+        WITH NO DATA;
+    """, {'source': 'cart_variations', 'since': None})
+    cursor.execute(f"""
+        CREATE UNIQUE INDEX IF NOT EXISTS vendor_sales_daily_key
+        ON {DAILY_TABLE} (source, day, vendor_id);
+    """)
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {TOTALS_TABLE} AS
+        {CHANGED_TOTALS}
+        WITH NO DATA;
+    """, {'start': None})
+    cursor.execute(f"""
+        CREATE UNIQUE INDEX IF NOT EXISTS vendor_sales_totals_key
+        ON {TOTALS_TABLE} (source, vendor_id);
+    """)
+    # Serves the ranked, paginated reads.
+    cursor.execute(f"""
+        CREATE INDEX IF NOT EXISTS vendor_sales_totals_rank
+        ON {TOTALS_TABLE} (source, revenue DESC, vendor_id);
+    """)
+
+
+@profiling.profiled()
+def refresh_vendor_sales(db_params=None, since=None):
+    """
+    Bring the vendor rollup and totals up to date and return the number of
+    daily rows written. As in sales_rollup, the last stored day is always
+    recomputed; pass ``since`` to also rebuild older days. The totals first
+    lose what the recomputed days contributed and then gain the new values,
+    all in one transaction.
+    """
+    if isinstance(since, str):
+        since = date.fromisoformat(since)
+    with db.connection(db_params, timeout_ms=0) as conn, conn.cursor() as cursor:
+        check_vendor_column(cursor)
+        create_vendor_tables(cursor)
+        cursor.execute(f"SELECT MAX(day) FROM {DAILY_TABLE};")
+        last_day = cursor.fetchone()[0]
+        starts = [day for day in (since, last_day) if day is not None]
+        start = min(starts) if starts else None
+        if start is not None:
+            cursor.execute(f"""
+                UPDATE {TOTALS_TABLE} t
+                SET
+                    revenue = t.revenue - d.revenue,
+                    order_count = t.order_count - d.order_count
+                FROM ({CHANGED_TOTALS}) d
+                WHERE
+                    t.source = d.source AND t.vendor_id = d.vendor_id;
+            """, {'start': start})
+            cursor.execute(
+                f"DELETE FROM {DAILY_TABLE} WHERE day >= %(start)s;", {'start': start})
+        rows = 0
+        for source, from_clause in SALES_SOURCES.items():
+            cursor.execute(
+                f"INSERT INTO {DAILY_TABLE} {DAILY_SELECT.format(from_clause=from_clause)};",
+                {'source': source, 'since': start})
+            rows += cursor.rowcount
+        cursor.execute(f"""
+            INSERT INTO {TOTALS_TABLE} {CHANGED_TOTALS}
+            ON CONFLICT (source, vendor_id) DO UPDATE
+            SET
+                revenue = {TOTALS_TABLE}.revenue + EXCLUDED.revenue,
+                order_count = {TOTALS_TABLE}.order_count + EXCLUDED.order_count;
+        """, {'start': start})
+    return rows
+
+
+def top_vendors(limit=10, offset=0, source='cart_variations', db_params=None):
+    """
+    (rank, vendor_id, revenue, order_count) for one page of vendors ranked by
+    revenue, read from the precomputed totals.
+    """
+    query = f"""
+        SELECT
+            %(offset)s + ROW_NUMBER() OVER (ORDER BY revenue DESC, vendor_id) AS rank,
+            vendor_id,
+            revenue,
+            order_count
+        FROM (
+            SELECT vendor_id, revenue, order_count
+            FROM {TOTALS_TABLE}
+            WHERE source = %(source)s
+            ORDER BY revenue DESC, vendor_id
+            LIMIT %(limit)s OFFSET %(offset)s
+        ) page
+        ORDER BY
+            rank;
+    """
+    return db.fetchall(query, {'source': source, 'limit': limit, 'offset': offset},
+                       config=db_params)
+
+
+def vendor_count(source='cart_variations', db_params=None):
+    """
+    Number of vendors ranked for ``source``.
+    """
+    rows = db.fetchall(f"SELECT COUNT(*) FROM {TOTALS_TABLE} WHERE source = %(source)s;",
+                       {'source': source}, config=db_params)
+    return rows[0][0]
+
+
+if __name__ == "__main__":
+    rows = refresh_vendor_sales()
+    print(f"Vendor sales refreshed ({rows} daily rows written).")
+    for rank, vendor_id, revenue, order_count in top_vendors():
+        print(f"{rank:>3}. {vendor_id}  revenue={revenue}  orders={order_count}")
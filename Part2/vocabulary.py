@@ -0,0 +1,79 @@
+# Persistent categorical vocabularies used by the preprocessor to encode
+# categorical columns with codes that stay stable between runs.
+
+import json
+import os
+import pandas as pd
+
+
+class VocabularyStore:
+    """
+    Per-table, per-column vocabularies persisted as one JSON file per table.
+    A value's code is its position in the stored list, so codes never change
+    once assigned and new values are only ever appended.
+    """
+
+    def __init__(self, directory='vocabularies'):
+        self.directory = directory
+        self._vocabularies = {}
+        self._indexes = {}
+        self._dirty = set()
+
+    def _path(self, table_name):
+        return os.path.join(self.directory, f"{table_name}.json")
+
+    def load(self, table_name):
+        if table_name not in self._vocabularies:
+            path = self._path(table_name)
+            if os.path.exists(path):
+                with open(path, encoding='utf-8') as f:
+                    self._vocabularies[table_name] = json.load(f)
+            else:
+                self._vocabularies[table_name] = {}
+        return self._vocabularies[table_name]
+
+    def _index(self, table_name, column):
+        key = (table_name, column)
+        if key not in self._indexes:
+            values = self.load(table_name).setdefault(column, [])
+            self._indexes[key] = pd.Index(values, dtype=object)
+        return self._indexes[key]
+
+    def encode(self, table_name, column, series):
+        """
+        Map ``series`` to integer codes with a vectorized lookup, appending any
+        values not seen before (sorted, like LabelEncoder on a first run).
+        """
+        if not pd.api.types.is_string_dtype(series):
+            series = series.astype(str)
+        codes = self._index(table_name, column).get_indexer(series)
+        missing = codes == -1
+        if missing.any():
+            values = self._vocabularies[table_name][column]
+            new_values = sorted(pd.unique(series[missing]))
+            values.extend(new_values)
+            index = pd.Index(values, dtype=object)
+            self._indexes[(table_name, column)] = index
+            codes[missing] = index.get_indexer(series[missing])
+            self._dirty.add(table_name)
+        return pd.Series(codes, index=series.index)
+
+    def decode(self, table_name, column, codes):
+        return self._index(table_name, column).take(codes)
+
+    def save(self, table_name=None):
+        """
+        Write dirty vocabularies to disk. Each file is replaced atomically so a
+        crashed run never leaves a truncated vocabulary behind.
+        """
+        tables = [table_name] if table_name is not None else list(self._dirty)
+        for name in tables:
+            if name not in self._dirty:
+                continue
+            os.makedirs(self.directory, exist_ok=True)
+            path = self._path(name)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._vocabularies[name], f)
+            os.replace(tmp_path, path)
+            self._dirty.discard(name)
@@ -0,0 +1,165 @@
+# The Part4 KPIs (kpi1.sql, kpi2.sql, KPI3.sql) computed with one pass per
+# table. Group-deal revenue and cart participation share a single scan of
+# groups_carts joined to orders, and the conversion rate reads the completed
+# groups once. The independent statements run at the same time on pooled
+# connections, and the combined result is cached for KPI_CACHE_TTL seconds so
+# a dashboard refreshing every minute does not rescan the tables each time.
+
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from typing import Optional
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import db  # noqa: E402
+import profiling  # noqa: E402
+
+
+CACHE_TTL = float(os.environ.get('KPI_CACHE_TTL', '60'))
+
+# kpi1.sql (group deals) and kpi2.sql (participation): every cart is read
+# once, its orders joined to it; only completed carts count towards revenue.
+CART_QUERY = """
+    SELECT
+        COUNT(DISTINCT gc.user_id) AS participating_users,
+        SUM(o.total_amount) FILTER (WHERE gc.status = 'COMPLETED') AS revenue,
+        COUNT(o.id) FILTER (WHERE gc.status = 'COMPLETED') AS deals,
+        AVG(o.total_amount) FILTER (WHERE gc.status = 'COMPLETED') AS average_revenue
+    FROM
+        public.groups_carts gc
+    LEFT JOIN
+        public.orders o ON o.groups_carts_id = gc.id
+"""
+
+USER_QUERY = "SELECT COUNT(*) FROM public.users"
+
+# kpi1.sql (single deals).
+SINGLE_DEAL_QUERY = """
+    SELECT
+        SUM(original_price * quantity) AS net_sales,
+        COUNT(*) AS deals
+    FROM
+        public.single_deals
+    WHERE
+        status = 'ACTIVE'
+"""
+
+# KPI3.sql: its WHERE on g.status makes the LEFT JOIN an inner join, so the
+# rate is completed groups over the deals that have one.
+CONVERSION_QUERY = """
+    SELECT
+        COUNT(*) AS completed_groups,
+        COUNT(DISTINCT g.group_deals_id) AS converted_deals
+    FROM
+        public.groups g
+    WHERE
+        g.status = 'COMPLETED'
+        AND EXISTS (SELECT 1 FROM public.group_deals gd WHERE gd.id = g.group_deals_id)
+"""
+
+QUERIES = {
+    'carts': CART_QUERY,
+    'users': USER_QUERY,
+    'single_deals': SINGLE_DEAL_QUERY,
+    'conversion': CONVERSION_QUERY,
+}
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class KPIs:
+    """
+    One snapshot of the Part4 KPIs. Rates are percentages; amounts are None
+    when there is nothing to sum and rates are None when the base is zero.
+    """
+    group_deal_revenue: Optional[float]
+    group_deal_count: int
+    average_group_deal_revenue: Optional[float]
+    single_deal_net_sales: Optional[float]
+    single_deal_count: int
+    total_users: int
+    participating_users: int
+    participation_rate: Optional[float]
+    group_conversion_rate: Optional[float]
+    computed_at: datetime
+
+    def as_dict(self):
+        return asdict(self)
+
+
+def _float(value):
+    return None if value is None else float(value)
+
+
+def _percent(part, whole, digits=None):
+    if not whole:
+        return None
+    rate = part * 100.0 / whole
+    return rate if digits is None else round(rate, digits)
+
+
+@profiling.profiled()
+def compute_kpis(config=None):
+    """
+    Run the KPI statements concurrently, one pooled connection each, and
+    combine them into a KPIs record.
+    """
+    with ThreadPoolExecutor(max_workers=len(QUERIES)) as executor:
+        futures = {name: executor.submit(db.fetchall, query, config=config)
+                   for name, query in QUERIES.items()}
+        rows = {name: future.result()[0] for name, future in futures.items()}
+
+    participating, revenue, deals, average = rows['carts']
+    total_users, = rows['users']
+    net_sales, single_deals = rows['single_deals']
+    completed_groups, converted_deals = rows['conversion']
+    return KPIs(
+        group_deal_revenue=_float(revenue),
+        group_deal_count=deals,
+        average_group_deal_revenue=_float(average),
+        single_deal_net_sales=_float(net_sales),
+        single_deal_count=single_deals,
+        total_users=total_users,
+        participating_users=participating,
+        # kpi2.sql rounds the participation rate to two decimals.
+        participation_rate=_percent(participating, total_users, 2),
+        group_conversion_rate=_percent(completed_groups, converted_deals),
+        computed_at=datetime.now(),
+    )
+
+
+def get_kpis(config=None, ttl=None, refresh=False):
+    """
+    The KPIs for ``config``, recomputed when the cached snapshot is older than
+    ``ttl`` seconds (default KPI_CACHE_TTL) or ``refresh`` is set. Concurrent
+    callers wait for one computation instead of each running the queries.
+    """
+    ttl = CACHE_TTL if ttl is None else ttl
+    key = tuple(sorted((config or {}).items()))
+    with _cache_lock:
+        entry = _cache.setdefault(key, {'lock': threading.Lock(), 'at': None, 'kpis': None})
+    with entry['lock']:
+        if refresh or entry['at'] is None or time.monotonic() - entry['at'] > ttl:
+            entry['kpis'] = compute_kpis(config)
+            entry['at'] = time.monotonic()
+        return entry['kpis']
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compute the Part4 KPIs.")
+    parser.add_argument('--database', help="database to read (default: PGDATABASE)")
+    args = parser.parse_args()
+
+    config = {'dbname': args.database} if args.database else None
+    started = time.perf_counter()
+    kpis = get_kpis(config, refresh=True)
+    for name, value in kpis.as_dict().items():
+        print(f"{name:<28} {value}")
+    print(f"Computed in {time.perf_counter() - started:.3f}s.")
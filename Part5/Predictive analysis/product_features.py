@@ -0,0 +1,239 @@
+# Build the product features for the sell-out model in one pass. Orders are
+# first rolled up per product and day (refreshed from the last stored day, as
+# in Part2/sales_rollup.py); every rolling window is then a conditional sum
+# over that rollup instead of a correlated subquery per product. Snapshots are
+# written to a feature table keyed by feature version and as-of time.
+
+import argparse
+import os
+import sys
+from datetime import date
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+import db  # noqa: E402
+import profiling  # noqa: E402
+
+
+DAILY_TABLE = 'public.product_sales_daily'
+FEATURE_TABLE = 'public.product_features'
+# Bump when the feature definitions change so old snapshots stay comparable.
+FEATURE_VERSION = 1
+WINDOWS = {'3_months': '3 months', '6_months': '6 months'}
+
+FEATURE_COLUMNS = ['current_stock', 'current_price', 'product_weight', 'average_rating'] + [
+    f"total_{measure}_last_{window}" for window in WINDOWS for measure in ('orders', 'sales')]
+
+# Orders are reached through product_ratings, as in QueryforModelTesting.sql.
+# An order is counted once per product however many ratings it has.
+DAILY_SELECT = """
+    WITH rated_orders AS (
+        SELECT
+            pr.product_id,
+            o.id AS order_id,
+            o.created_at::date AS day,
+            o.total_amount,
+            SUM(pr.rating) AS rating_sum,
+            COUNT(pr.rating) AS rating_count
+        FROM
+            public.product_ratings pr
+        JOIN
+            public.orders o ON o.id = pr.order_id
+        WHERE
+            o.created_at IS NOT NULL
+            AND (%(since)s::date IS NULL OR o.created_at >= %(since)s::date)
+        GROUP BY
+            pr.product_id, o.id, o.created_at::date, o.total_amount
+    )
+    SELECT
+        product_id,
+        day,
+        COUNT(*) AS order_count,
+        SUM(total_amount) AS sales,
+        SUM(rating_sum) AS rating_sum,
+        SUM(rating_count) AS rating_count
+    FROM
+        rated_orders
+    GROUP BY
+        product_id, day
+"""
+
+WINDOW_COLUMNS = ",\n".join(
+    f"""        COALESCE(SUM(order_count) FILTER (
+            WHERE day >= (%(as_of)s::timestamp - INTERVAL '{length}')::date), 0) AS total_orders_last_{window},
+        COALESCE(SUM(sales) FILTER (
+            WHERE day >= (%(as_of)s::timestamp - INTERVAL '{length}')::date), 0) AS total_sales_last_{window}"""
+    for window, length in WINDOWS.items())
+
+# Windows are whole days up to and including the as-of day. Stock and price
+# are the latest values recorded at the as-of time, summed and averaged over
+# the product's variations.
+FEATURE_SELECT = f"""
+    WITH activity AS (
+        SELECT
+            product_id,
+{WINDOW_COLUMNS},
+            SUM(rating_sum)::numeric / NULLIF(SUM(rating_count), 0) AS average_rating
+        FROM
+            {DAILY_TABLE}
+        WHERE
+            day <= %(as_of)s::date
+        GROUP BY
+            product_id
+    ),
+    stocks AS (
+        SELECT DISTINCT ON (product_variation_id)
+            product_variation_id, stock
+        FROM
+            public.product_variation_stocks
+        WHERE
+            created_at IS NULL OR created_at <= %(as_of)s::timestamp
+        ORDER BY
+            product_variation_id, created_at DESC NULLS LAST
+    ),
+    prices AS (
+        SELECT DISTINCT ON (product_variation_id)
+            product_variation_id, price
+        FROM
+            public.product_variation_prices
+        WHERE
+            created_at IS NULL OR created_at <= %(as_of)s::timestamp
+        ORDER BY
+            product_variation_id, created_at DESC NULLS LAST
+    ),
+    variations AS (
+        SELECT
+            pv.product_id,
+            SUM(s.stock) AS current_stock,
+            AVG(pp.price) AS current_price,
+            AVG(pv.weight) AS product_weight
+        FROM
+            public.product_variations pv
+        LEFT JOIN
+            stocks s ON s.product_variation_id = pv.id
+        LEFT JOIN
+            prices pp ON pp.product_variation_id = pv.id
+        GROUP BY
+            pv.product_id
+    )
+    SELECT
+        %(version)s AS feature_version,
+        %(as_of)s::timestamp AS as_of,
+        p.id AS product_id,
+        pn.name AS product_name,
+        c.name AS category_name,
+        v.current_stock,
+        v.current_price,
+        v.product_weight,
+        COALESCE(a.average_rating, 0) AS average_rating,
+        {", ".join(f"COALESCE(a.total_{measure}_last_{window}, 0) AS total_{measure}_last_{window}"
+                   for window in WINDOWS for measure in ('orders', 'sales'))}
+    FROM
+        public.products p
+    JOIN
+        public.product_names pn ON p.name_id = pn.id
+    JOIN
+        public.categories c ON pn.category_id = c.id
+    JOIN
+        variations v ON v.product_id = p.id
+    LEFT JOIN
+        activity a ON a.product_id = p.id
+"""
+
+
+def create_feature_tables(cursor):
+    # WITH NO DATA takes the column types from the source tables.
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {DAILY_TABLE} AS
+        {DAILY_SELECT}
+        WITH NO DATA;
+    """, {'since': None})
+    cursor.execute(f"""
+        CREATE UNIQUE INDEX IF NOT EXISTS product_sales_daily_key
+        ON {DAILY_TABLE} (product_id, day);
+    """)
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {FEATURE_TABLE} AS
+        {FEATURE_SELECT}
+        WITH NO DATA;
+    """, {'version': FEATURE_VERSION, 'as_of': None})
+    cursor.execute(f"""
+        CREATE UNIQUE INDEX IF NOT EXISTS product_features_key
+        ON {FEATURE_TABLE} (feature_version, as_of, product_id);
+    """)
+    # Serves single-product lookups of the latest snapshot.
+    cursor.execute(f"""
+        CREATE INDEX IF NOT EXISTS product_features_product
+        ON {FEATURE_TABLE} (product_id, feature_version, as_of DESC);
+    """)
+
+
+def refresh_product_daily(cursor, since=None):
+    """
+    Recompute the product x day rollup from the last stored day (or ``since``,
+    if earlier) onward and return the number of rows written.
+    """
+    cursor.execute(f"SELECT MAX(day) FROM {DAILY_TABLE};")
+    last_day = cursor.fetchone()[0]
+    starts = [day for day in (since, last_day) if day is not None]
+    start = min(starts) if starts else None
+    if start is not None:
+        cursor.execute(
+            f"DELETE FROM {DAILY_TABLE} WHERE day >= %(start)s;", {'start': start})
+    cursor.execute(f"INSERT INTO {DAILY_TABLE} {DAILY_SELECT};", {'since': start})
+    return cursor.rowcount
+
+
+@profiling.profiled()
+def build_features(as_of=None, since=None, db_params=None):
+    """
+    Refresh the daily rollup and write the feature snapshot for ``as_of``
+    (default: the latest order time, as in the original query), replacing any
+    snapshot of the same version and time. Returns (as_of, products written).
+    """
+    if isinstance(since, str):
+        since = date.fromisoformat(since)
+    with db.connection(db_params, timeout_ms=0) as conn, conn.cursor() as cursor:
+        create_feature_tables(cursor)
+        refresh_product_daily(cursor, since)
+        if as_of is None:
+            cursor.execute("SELECT MAX(created_at) FROM public.orders;")
+            as_of = cursor.fetchone()[0]
+        params = {'version': FEATURE_VERSION, 'as_of': as_of}
+        cursor.execute(f"""
+            DELETE FROM {FEATURE_TABLE}
+            WHERE feature_version = %(version)s AND as_of = %(as_of)s::timestamp;
+        """, params)
+        cursor.execute(f"INSERT INTO {FEATURE_TABLE} {FEATURE_SELECT};", params)
+        return as_of, cursor.rowcount
+
+
+@profiling.profiled()
+def load_features(as_of=None, version=FEATURE_VERSION, db_params=None):
+    """
+    Read one feature snapshot into a DataFrame; the latest snapshot of
+    ``version`` when ``as_of`` is not given.
+    """
+    query = f"""
+        SELECT *
+        FROM {FEATURE_TABLE}
+        WHERE
+            feature_version = %(version)s
+            AND as_of = COALESCE(%(as_of)s::timestamp, (
+                SELECT MAX(as_of) FROM {FEATURE_TABLE}
+                WHERE feature_version = %(version)s))
+        ORDER BY
+            product_id
+    """
+    return db.read_frame(query, {'version': version, 'as_of': as_of},
+                         config=db_params, parse_dates=['as_of'])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Refresh the product rollup and write a feature snapshot.")
+    parser.add_argument('--as-of', help="snapshot time (default: latest order)")
+    parser.add_argument('--since', help="also rebuild rollup days from this date")
+    args = parser.parse_args()
+
+    as_of, rows = build_features(args.as_of, args.since)
+    print(f"Feature snapshot v{FEATURE_VERSION} at {as_of}: {rows} products.")
@@ -0,0 +1,178 @@
+# Score the whole catalog with the saved sell-out model. Features are streamed
+# from the feature table in batches, scored with vectorized predict_proba and
+# copied into a staging table, and the score table is replaced in the same
+# transaction so readers always see one complete run. lookup_score serves a
+# single product for the dashboard.
+
+import argparse
+import io
+import os
+import sys
+
+import joblib
+import pandas as pd
+
+from product_features import FEATURE_TABLE, FEATURE_VERSION
+from train_model import MODEL_PATH, positive_proba
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+import db  # noqa: E402
+import profiling  # noqa: E402
+
+
+SCORE_TABLE = 'public.product_sellout_scores'
+BATCH_SIZE = 50000
+# Scores at or above this are reported as a predicted sell-out, as predict() does.
+DECISION_THRESHOLD = 0.5
+
+_models = {}
+
+
+def load_model(path=MODEL_PATH):
+    """
+    Load a model bundle once per process; later calls reuse it until the file
+    on disk changes.
+    """
+    mtime = os.path.getmtime(path)
+    cached = _models.get(path)
+    if cached is None or cached[0] != mtime:
+        _models[path] = (mtime, joblib.load(path))
+    return _models[path][1]
+
+
+def latest_snapshot(db_params=None):
+    rows = db.fetchall(f"SELECT MAX(as_of) FROM {FEATURE_TABLE} WHERE feature_version = %(version)s;",
+                       {'version': FEATURE_VERSION}, config=db_params)
+    return rows[0][0]
+
+
+def create_score_table(cursor):
+    # WITH NO DATA takes product_id and as_of types from the feature table.
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {SCORE_TABLE} AS
+        SELECT
+            product_id,
+            as_of,
+            feature_version,
+            0::double precision AS score,
+            FALSE AS predicted_sell_out,
+            NULL::timestamp AS model_trained_at,
+            NOW()::timestamp AS scored_at
+        FROM
+            {FEATURE_TABLE}
+        WITH NO DATA;
+    """)
+    cursor.execute(f"""
+        CREATE UNIQUE INDEX IF NOT EXISTS product_sellout_scores_key
+        ON {SCORE_TABLE} (product_id);
+    """)
+
+
+@profiling.profiled()
+def score_catalog(as_of=None, model_path=MODEL_PATH, batch_size=BATCH_SIZE, db_params=None):
+    """
+    Score every product of the feature snapshot at ``as_of`` (default: the
+    latest one), replace the score table and return the number of products
+    scored. Only one batch of features is in memory at a time. Without any
+    snapshot the score table is left as it is.
+    """
+    bundle = load_model(model_path)
+    model, features = bundle['model'], bundle['features']
+    as_of = as_of or latest_snapshot(db_params)
+    if as_of is None:
+        return 0
+    query = f"""
+        SELECT product_id, {", ".join(features)}
+        FROM {FEATURE_TABLE}
+        WHERE feature_version = %(version)s AND as_of = %(as_of)s::timestamp
+    """
+    params = {'version': FEATURE_VERSION, 'as_of': as_of}
+
+    scored = 0
+    # Features are streamed through a named cursor on the same connection, so
+    # scoring never needs a second pooled connection.
+    with db.connection(db_params, timeout_ms=0) as conn, conn.cursor() as cursor, \
+            conn.cursor(name='score_features') as features_cursor:
+        create_score_table(cursor)
+        cursor.execute(f"""
+            CREATE TEMP TABLE sellout_scores_stage
+            (LIKE {SCORE_TABLE} INCLUDING DEFAULTS) ON COMMIT DROP;
+        """)
+        features_cursor.itersize = batch_size
+        features_cursor.execute(query, params)
+        while True:
+            rows = features_cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            batch = pd.DataFrame.from_records(
+                rows, columns=[col.name for col in features_cursor.description])
+            batch['score'] = positive_proba(model, batch[features].fillna(0))
+            buffer = io.StringIO()
+            batch[['product_id', 'score']].to_csv(buffer, index=False, header=False)
+            buffer.seek(0)
+            cursor.copy_expert(
+                "COPY sellout_scores_stage (product_id, score) FROM STDIN WITH (FORMAT csv)", buffer)
+            scored += len(batch)
+        cursor.execute(f"DELETE FROM {SCORE_TABLE};")
+        cursor.execute(f"""
+            INSERT INTO {SCORE_TABLE}
+            SELECT
+                product_id,
+                %(as_of)s::timestamp,
+                %(version)s,
+                score,
+                score >= %(threshold)s,
+                %(trained_at)s::timestamp,
+                NOW()::timestamp
+            FROM
+                sellout_scores_stage;
+        """, {**params, 'threshold': DECISION_THRESHOLD,
+              'trained_at': bundle['metrics'].get('trained_at')})
+    return scored
+
+
+@profiling.profiled()
+def lookup_score(product_id, live=False, model_path=MODEL_PATH, db_params=None):
+    """
+    Sell-out score of one product as a dict, or None for an unknown product.
+    By default this is an index lookup in the score table; with ``live`` the
+    product's latest features are scored with the in-memory model instead.
+    """
+    if not live:
+        rows = db.fetchall(f"""
+            SELECT as_of, score, predicted_sell_out, scored_at
+            FROM {SCORE_TABLE}
+            WHERE product_id = %(product_id)s;
+        """, {'product_id': product_id}, config=db_params)
+        if not rows:
+            return None
+        as_of, score, predicted, scored_at = rows[0]
+        return {'product_id': product_id, 'as_of': as_of, 'score': score,
+                'predicted_sell_out': predicted, 'scored_at': scored_at}
+
+    bundle = load_model(model_path)
+    features = bundle['features']
+    rows = db.fetchall(f"""
+        SELECT as_of, {", ".join(features)}
+        FROM {FEATURE_TABLE}
+        WHERE feature_version = %(version)s AND product_id = %(product_id)s
+        ORDER BY as_of DESC
+        LIMIT 1;
+    """, {'version': FEATURE_VERSION, 'product_id': product_id}, config=db_params)
+    if not rows:
+        return None
+    X = pd.DataFrame([rows[0][1:]], columns=features).astype(float).fillna(0)
+    score = float(positive_proba(bundle['model'], X)[0])
+    return {'product_id': product_id, 'as_of': rows[0][0], 'score': score,
+            'predicted_sell_out': score >= DECISION_THRESHOLD, 'scored_at': None}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score the catalog with the sell-out model.")
+    parser.add_argument('--as-of', help="feature snapshot to score (default: latest)")
+    parser.add_argument('--model-path', default=MODEL_PATH)
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+
+    rows = score_catalog(args.as_of, args.model_path, args.batch_size)
+    print(f"Scored {rows} products into {SCORE_TABLE}.")
@@ -0,0 +1,217 @@
+# Train the sell-out classifier from Main.ipynb as a script. Feature snapshots
+# written by product_features.py are read once and cached as Parquet per data
+# version, so a retrain holds no database session; the forest is trained on
+# every core, and the model is saved together with its evaluation metrics.
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import sys
+from datetime import datetime
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import classification_report, confusion_matrix, roc_auc_score
+from sklearn.model_selection import train_test_split
+
+from product_features import FEATURE_TABLE, FEATURE_VERSION
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+import db  # noqa: E402
+import profiling  # noqa: E402
+
+
+CACHE_DIR = os.environ.get('SELLOUT_CACHE_DIR', 'cache')
+MODEL_PATH = os.environ.get('SELLOUT_MODEL_PATH',
+                            os.path.join('models', 'sellout_model.joblib'))
+# The feature set and label rule from Main.ipynb.
+FEATURES = ['current_stock', 'current_price', 'total_sales_last_3_months',
+            'average_rating', 'product_weight']
+THRESHOLD = 10
+
+# Insert/update/delete counters of the feature table: they change whenever a
+# snapshot is written, without reading the snapshots themselves.
+DATA_VERSION_QUERY = """
+SELECT
+    n_tup_ins || ':' || n_tup_upd || ':' || n_tup_del
+FROM
+    pg_stat_user_tables
+WHERE
+    schemaname || '.' || relname = %(table)s
+"""
+
+
+def data_version(db_params=None):
+    rows = db.fetchall(DATA_VERSION_QUERY, {'table': FEATURE_TABLE}, config=db_params)
+    token = f"v{FEATURE_VERSION}:{rows[0][0] if rows else ''}"
+    return hashlib.sha1(token.encode()).hexdigest()[:12]
+
+
+@profiling.profiled()
+def load_training_data(version=None, db_params=None):
+    """
+    All feature snapshots of the current feature version, read from the
+    Parquet cache when this data version was loaded before.
+    """
+    version = version or data_version(db_params)
+    path = os.path.join(CACHE_DIR, f"features-{version}.parquet")
+    if os.path.exists(path):
+        return pd.read_parquet(path)
+
+    query = f"""
+        SELECT as_of, product_id, {", ".join(FEATURES)}
+        FROM {FEATURE_TABLE}
+        WHERE feature_version = %(version)s
+        ORDER BY as_of, product_id
+    """
+    data = db.read_frame(query, {'version': FEATURE_VERSION},
+                         config=db_params, parse_dates=['as_of'])
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    data.to_parquet(f"{path}.tmp", index=False)
+    os.replace(f"{path}.tmp", path)
+    # Every new snapshot is a new version; only the current one is kept.
+    for old in glob.glob(os.path.join(CACHE_DIR, 'features-*.parquet')):
+        if old != path:
+            try:
+                os.remove(old)
+            except FileNotFoundError:
+                pass
+    return data
+
+
+def add_label(data, threshold=THRESHOLD):
+    data = data.copy()
+    data['sold_out_next_week'] = np.where(
+        data['total_sales_last_3_months'] > threshold, 1, 0)
+    return data
+
+
+def split_data(data, split='time', test_snapshots=1, test_size=0.2, random_state=42):
+    """
+    Return (train, test). A time split tests on the latest ``test_snapshots``
+    snapshots and trains on the earlier ones; a random split is the
+    stratified 80/20 split of the notebook.
+    """
+    if split == 'time':
+        snapshots = np.sort(data['as_of'].unique())
+        if len(snapshots) <= test_snapshots:
+            raise ValueError(
+                f"A time split needs more than {test_snapshots} snapshot(s), found "
+                f"{len(snapshots)}; write older ones with product_features.py --as-of.")
+        cutoff = snapshots[-test_snapshots]
+        return data[data['as_of'] < cutoff], data[data['as_of'] >= cutoff]
+    stratify = data['sold_out_next_week'] if data['sold_out_next_week'].nunique() > 1 else None
+    return train_test_split(data, test_size=test_size, random_state=random_state,
+                            stratify=stratify)
+
+
+def resample_smote(X, y, random_state=42):
+    """
+    Oversample the minority class of the training set only, so no synthetic
+    rows leak into the evaluation.
+    """
+    try:
+        from imblearn.over_sampling import SMOTE
+    except ImportError as e:
+        raise RuntimeError(
+            "SMOTE needs the imbalanced-learn package (pip install imbalanced-learn).") from e
+    return SMOTE(random_state=random_state).fit_resample(X, y)
+
+
+def positive_proba(model, X):
+    """
+    Probability of the sold-out class; zero when training saw no sold-out
+    rows.
+    """
+    classes = list(model.classes_)
+    if 1 not in classes:
+        return np.zeros(len(X))
+    return model.predict_proba(X)[:, classes.index(1)]
+
+
+def evaluate(model, X_test, y_test):
+    y_pred = model.predict(X_test)
+    metrics = {
+        'test_rows': int(len(y_test)),
+        'confusion_matrix': confusion_matrix(y_test, y_pred, labels=[0, 1]).tolist(),
+        'classification_report': classification_report(
+            y_test, y_pred, labels=[0, 1], output_dict=True, zero_division=0),
+        'feature_importances': dict(zip(FEATURES, model.feature_importances_.tolist())),
+    }
+    if len(np.unique(y_test)) > 1:
+        metrics['roc_auc'] = roc_auc_score(y_test, positive_proba(model, X_test))
+    return metrics
+
+
+def save_model(model, metrics, path=MODEL_PATH):
+    """
+    Save the model bundle and a JSON copy of its metrics next to it.
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    bundle = {'model': model, 'features': FEATURES, 'metrics': metrics}
+    joblib.dump(bundle, f"{path}.tmp")
+    os.replace(f"{path}.tmp", path)
+    with open(f"{os.path.splitext(path)[0]}_metrics.json", 'w', encoding='utf-8') as f:
+        json.dump(metrics, f, indent=2, default=str)
+
+
+@profiling.profiled()
+def train(split='time', test_snapshots=1, test_size=0.2, smote=False, n_estimators=100,
+          threshold=THRESHOLD, random_state=42, model_path=MODEL_PATH, db_params=None):
+    """
+    Run the whole pipeline and return the metrics that were saved with the
+    model.
+    """
+    version = data_version(db_params)
+    data = add_label(load_training_data(version, db_params), threshold)
+    train_set, test_set = split_data(data, split, test_snapshots, test_size, random_state)
+    X_train = train_set[FEATURES].fillna(0)
+    y_train = train_set['sold_out_next_week']
+    if smote:
+        X_train, y_train = resample_smote(X_train, y_train, random_state)
+
+    model = RandomForestClassifier(n_estimators=n_estimators, random_state=random_state,
+                                   class_weight='balanced', n_jobs=-1)
+    model.fit(X_train, y_train)
+
+    metrics = evaluate(model, test_set[FEATURES].fillna(0), test_set['sold_out_next_week'])
+    metrics.update({
+        'data_version': version,
+        'feature_version': FEATURE_VERSION,
+        'trained_at': datetime.now().isoformat(timespec='seconds'),
+        'train_rows': int(len(X_train)),
+        'params': {'split': split, 'test_snapshots': test_snapshots, 'test_size': test_size,
+                   'smote': smote, 'n_estimators': n_estimators, 'threshold': threshold,
+                   'random_state': random_state},
+    })
+    if split == 'time':
+        metrics['test_as_of'] = [str(t) for t in np.sort(test_set['as_of'].unique())]
+    save_model(model, metrics, model_path)
+    return metrics
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the sell-out prediction model.")
+    parser.add_argument('--split', choices=['time', 'random'], default='time')
+    parser.add_argument('--test-snapshots', type=int, default=1,
+                        help="latest snapshots held out by a time split")
+    parser.add_argument('--test-size', type=float, default=0.2,
+                        help="test fraction of a random split")
+    parser.add_argument('--smote', action='store_true',
+                        help="oversample the training set with SMOTE")
+    parser.add_argument('--n-estimators', type=int, default=100)
+    parser.add_argument('--threshold', type=float, default=THRESHOLD)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--model-path', default=MODEL_PATH)
+    args = parser.parse_args()
+
+    metrics = train(args.split, args.test_snapshots, args.test_size, args.smote,
+                    args.n_estimators, args.threshold, args.seed, args.model_path)
+    report = metrics['classification_report']
+    print(f"Model saved to {args.model_path} (data version {metrics['data_version']}).")
+    print(f"Train rows: {metrics['train_rows']}, test rows: {metrics['test_rows']}, "
+          f"accuracy: {report['accuracy']:.3f}, ROC AUC: {metrics.get('roc_auc', float('nan')):.3f}")
@@ -1,8 +1,9 @@
 import streamlit as st
-import pandas as pd
 import matplotlib.pyplot as plt
-from sklearn.cluster import KMeans
-import numpy as np
+from clustering import assign_clusters, fit_model, plot_sample, sweep_k
+from data_loader import (TREND_GRANULARITIES, downsample, load_order_trend,
+                         load_user_order_stats, load_vendor_count,
+                         load_vendor_page, source_version)
 
 # Set up page configurations
 st.set_page_config(
@@ -14,36 +15,68 @@ pages = ["Home", "Clustering Dashboard", "Orders Overview",
          "Vendor Performance", "Trend Analysis"]
 page = st.sidebar.radio("Navigate", pages)
 
-# Load data from CSV files
+# Load per-user order stats, aggregated in the database and cached on disk
+# until the source tables change
+
+
+@st.cache_data(ttl=60)
+def get_source_version():
+    return source_version()
 
 
 @st.cache_data
-def load_data():
-    groups_carts = pd.read_csv('groups_carts.csv')
-    orders = pd.read_csv('orders.csv')
-    return groups_carts, orders
+def load_data(version):
+    return load_user_order_stats(version)
+
+
+data_version = get_source_version()
+data = load_data(data_version)
+
+data = data.dropna().drop_duplicates()
 
+MAX_TABLE_ROWS = 10000
+MAX_CLUSTERS = 10
+VENDOR_PAGE_SIZE = 20
 
-groups_carts, orders = load_data()
+# Models and labels are cached per (k, seed, data version), so changing an
+# unrelated widget never refits
 
-# Process data to create user order stats
+
+@st.cache_resource
+def get_model(n_clusters, random_state, version):
+    return fit_model(data, n_clusters, random_state, version)
 
 
 @st.cache_data
-def create_user_order_stats(groups_carts, orders):
-    user_order_stats = (
-        groups_carts.merge(orders, left_on='id',
-                           right_on='groups_carts_id', how='inner')
-        .groupby('user_id')
-        .agg(order_count=('id_y', 'count'), total_order_amount=('total_amount', 'sum'))
-        .reset_index()
-    )
-    return user_order_stats
+def get_labels(n_clusters, random_state, version):
+    return assign_clusters(get_model(n_clusters, random_state, version), data)
 
 
-data = create_user_order_stats(groups_carts, orders)
+@st.cache_data
+def get_plot_sample(n_clusters, random_state, version):
+    labels = get_labels(n_clusters, random_state, version)
+    return plot_sample(data[['order_count', 'total_order_amount']], labels)
+
+
+@st.cache_data
+def get_sweep(max_k, random_state, version):
+    return sweep_k(data, max_k, random_state, version)
+
+
+@st.cache_data
+def get_order_trend(granularity, version):
+    return downsample(load_order_trend(granularity, version))
+
+
+@st.cache_data(ttl=300)
+def get_vendor_count(source):
+    return load_vendor_count(source)
+
+
+@st.cache_data(ttl=300)
+def get_vendor_page(page, source):
+    return load_vendor_page(page, VENDOR_PAGE_SIZE, source)
 
-data = data.dropna().drop_duplicates()
 
 if page == "Home":
     st.title("Welcome to the User Clustering Dashboard")
@@ -84,20 +117,41 @@ elif page == "Clustering Dashboard":
 
     st.sidebar.header("Clustering Settings")
     n_clusters = st.sidebar.slider(
-        "Number of Clusters", min_value=2, max_value=10, value=3, step=1)
+        "Number of Clusters", min_value=2, max_value=MAX_CLUSTERS, value=3, step=1)
     random_state = st.sidebar.number_input("Random State", value=42, step=1)
-
-    kmeans = KMeans(n_clusters=n_clusters, random_state=random_state)
-    data['cluster'] = kmeans.fit_predict(
-        data[['order_count', 'total_order_amount']])
+    show_sweep = st.sidebar.checkbox("Compare cluster counts (k sweep)")
+
+    if show_sweep:
+        st.header("Choosing the Number of Clusters")
+        sweep = get_sweep(MAX_CLUSTERS, int(random_state), data_version)
+        fig, (ax_elbow, ax_silhouette) = plt.subplots(1, 2, figsize=(12, 4))
+        ax_elbow.plot(sweep['k'], sweep['inertia'], marker='o')
+        ax_elbow.set_xlabel('Number of Clusters')
+        ax_elbow.set_ylabel('Inertia')
+        ax_elbow.set_title('Elbow Curve')
+        ax_silhouette.plot(sweep['k'], sweep['silhouette'],
+                           marker='o', color='orange')
+        ax_silhouette.set_xlabel('Number of Clusters')
+        ax_silhouette.set_ylabel('Silhouette Score (sampled)')
+        ax_silhouette.set_title('Silhouette by k')
+        for ax in (ax_elbow, ax_silhouette):
+            ax.axvline(n_clusters, color='grey', linestyle='--')
+        st.pyplot(fig)
+        st.dataframe(sweep)
+
+    kmeans = get_model(n_clusters, int(random_state), data_version)
+    data['cluster'] = get_labels(n_clusters, int(random_state), data_version)
 
     st.header("Clustering Results")
-    st.dataframe(data)
+    st.dataframe(data.head(MAX_TABLE_ROWS))
+    if len(data) > MAX_TABLE_ROWS:
+        st.caption(f"Showing the first {MAX_TABLE_ROWS:,} of {len(data):,} users.")
 
     st.header("Visualizations")
+    sample = get_plot_sample(n_clusters, int(random_state), data_version)
     fig, ax = plt.subplots(figsize=(10, 6))
-    scatter = ax.scatter(data['order_count'], data['total_order_amount'],
-                         c=data['cluster'], cmap='viridis', alpha=0.7)
+    scatter = ax.scatter(sample['order_count'], sample['total_order_amount'],
+                         c=sample['cluster'], cmap='viridis', alpha=0.7)
     centers = kmeans.cluster_centers_
     ax.scatter(centers[:, 0], centers[:, 1], c='red',
                marker='X', s=200, label='Cluster Centers')
@@ -144,17 +198,26 @@ elif page == "Vendor Performance":
     st.title("Vendor Performance")
     st.write("Analyze revenue contributions by vendors.")
 
-    vendors_data = pd.DataFrame({
-        'vendor_id': ['V1', 'V2', 'V3', 'V4'],
-        'revenue': [15000, 22000, 18000, 25000]
-    })
-
-    st.dataframe(vendors_data)
+    source = st.radio("Attribute orders through",
+                      ["cart_variations", "ratings"], horizontal=True)
+    try:
+        vendor_count = get_vendor_count(source)
+    except Exception as e:
+        st.warning("Vendor totals are not available; run "
+                   f"Part2/vendor_sales.py to build them. ({e})")
+        st.stop()
+    page_count = max(1, -(-vendor_count // VENDOR_PAGE_SIZE))
+    page_number = st.number_input(
+        f"Page (of {page_count})", min_value=1, max_value=page_count, value=1, step=1)
+    vendors_data = get_vendor_page(int(page_number) - 1, source)
+
+    st.dataframe(vendors_data, hide_index=True)
+    st.caption(f"{vendor_count:,} vendors ranked by revenue.")
 
     st.subheader("Revenue by Vendor")
     fig, ax = plt.subplots(figsize=(10, 6))
-    ax.bar(vendors_data['vendor_id'], vendors_data['revenue'], color='purple')
-    ax.set_xlabel('Vendor ID')
+    ax.bar(vendors_data['rank'].astype(str), vendors_data['revenue'], color='purple')
+    ax.set_xlabel('Vendor Rank')
     ax.set_ylabel('Revenue')
     ax.set_title('Revenue Contribution by Vendor')
     st.pyplot(fig)
@@ -163,12 +226,11 @@ elif page == "Trend Analysis":
     st.title("Trend Analysis")
     st.write("Visualize trends in order amounts over time.")
 
-    # Simulating time series data
-    time_series_data = pd.DataFrame({
-        'date': pd.date_range(start='2023-01-01', periods=100),
-        'total_amount': (1000 * np.random.rand(100)).cumsum()
-    })
+    granularity = st.radio("Granularity", list(TREND_GRANULARITIES),
+                           horizontal=True)
+    trend = get_order_trend(granularity, data_version)
 
-    st.line_chart(time_series_data.set_index('date')['total_amount'])
-    st.subheader("Daily Order Amounts")
-    st.write("This chart shows the cumulative total order amounts over time.")
+    st.line_chart(trend.set_index('bucket')['revenue'])
+    st.subheader(f"Order Revenue per {granularity.title()}")
+    st.write("Revenue and order counts are aggregated in the database; long "
+             "series are averaged into at most 1,000 points.")
@@ -0,0 +1,194 @@
+# Clustering backend for the User Clustering Dashboard. Fitted models are cached
+# on disk by (k, seed, data version); large populations are fitted with
+# mini-batch k-means on a sample and then labelled in full with vectorized
+# predictions, and plots get a cluster-stratified subsample. sweep_k fits a
+# range of k in parallel to help choose the number of segments.
+
+import argparse
+import glob
+import os
+import sys
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.metrics import silhouette_score
+
+sys.path.append(os.path.join(os.path.dirname(
+    os.path.abspath(__file__)), '..', '..'))
+import profiling  # noqa: E402
+
+
+FEATURES = ['order_count', 'total_order_amount']
+MODEL_DIR = os.environ.get('USER_SEGMENT_MODEL_DIR',
+                           os.path.join('cache', 'models'))
+# Above this many users the model is fitted with MiniBatchKMeans on a sample.
+MINIBATCH_THRESHOLD = int(os.environ.get(
+    'USER_SEGMENT_MINIBATCH_THRESHOLD', '200000'))
+FIT_SAMPLE_SIZE = int(os.environ.get('USER_SEGMENT_FIT_SAMPLE_SIZE', '200000'))
+PREDICT_BATCH_SIZE = 1000000
+PLOT_POINTS = 5000
+SWEEP_DIR = os.environ.get('USER_SEGMENT_SWEEP_DIR',
+                           os.path.join('cache', 'sweeps'))
+# Silhouette is quadratic in the number of points, so it is scored on a sample.
+SILHOUETTE_SAMPLE_SIZE = int(os.environ.get(
+    'USER_SEGMENT_SILHOUETTE_SAMPLE_SIZE', '10000'))
+
+
+def feature_matrix(data):
+    return data[FEATURES].to_numpy(dtype=np.float64)
+
+
+def _prune_versions(directory, prefix, suffix, data_version):
+    """
+    Remove cached files of other data versions; the version changes with
+    every write to the source tables, so old ones would pile up.
+    """
+    keep = f"{prefix}-{data_version}-"
+    for old in glob.glob(os.path.join(directory, f"{prefix}-*{suffix}")):
+        if not os.path.basename(old).startswith(keep):
+            try:
+                os.remove(old)
+            except FileNotFoundError:
+                pass
+
+
+def _model_path(n_clusters, random_state, data_version):
+    return os.path.join(MODEL_DIR, f"kmeans-{data_version}-k{n_clusters}-s{random_state}.joblib")
+
+
+@profiling.profiled()
+def fit_model(data, n_clusters, random_state, data_version):
+    """
+    Return a fitted k-means model for this data version, loading it from the
+    model cache when the same (k, seed, version) was fitted before.
+    """
+    path = _model_path(n_clusters, random_state, data_version)
+    if os.path.exists(path):
+        return joblib.load(path)
+
+    X = feature_matrix(data)
+    if len(X) > MINIBATCH_THRESHOLD:
+        rng = np.random.default_rng(random_state)
+        sample = X[rng.choice(len(X), size=min(
+            FIT_SAMPLE_SIZE, len(X)), replace=False)]
+        model = MiniBatchKMeans(n_clusters=n_clusters, random_state=random_state,
+                                batch_size=4096, n_init=3).fit(sample)
+    else:
+        model = KMeans(n_clusters=n_clusters,
+                       random_state=random_state).fit(X)
+
+    os.makedirs(MODEL_DIR, exist_ok=True)
+    joblib.dump(model, f"{path}.tmp")
+    os.replace(f"{path}.tmp", path)
+    _prune_versions(MODEL_DIR, 'kmeans', '.joblib', data_version)
+    return model
+
+
+@profiling.profiled()
+def assign_clusters(model, data):
+    """
+    Label every user with the nearest cluster centre, in batches so the
+    distance matrix stays small.
+    """
+    X = feature_matrix(data)
+    labels = np.empty(len(X), dtype=np.int32)
+    for start in range(0, len(X), PREDICT_BATCH_SIZE):
+        end = start + PREDICT_BATCH_SIZE
+        labels[start:end] = model.predict(X[start:end])
+    return labels
+
+
+@profiling.profiled()
+def plot_sample(data, labels, max_points=PLOT_POINTS, random_state=0):
+    """
+    Downsample users for plotting, stratified by cluster so each cluster keeps
+    its share of points and small clusters stay visible.
+    """
+    frame = data.assign(cluster=labels)
+    if len(frame) <= max_points:
+        return frame
+    clusters, sizes = np.unique(labels, return_counts=True)
+    floor = max(1, max_points // (10 * len(clusters)))
+    rng = np.random.default_rng(random_state)
+    keep = []
+    for cluster, size in zip(clusters, sizes):
+        quota = min(size, max(floor, int(max_points * size / len(frame))))
+        keep.append(rng.choice(np.flatnonzero(
+            labels == cluster), size=quota, replace=False))
+    return frame.iloc[np.sort(np.concatenate(keep))]
+
+
+def _sweep_path(min_k, max_k, random_state, data_version):
+    return os.path.join(SWEEP_DIR, f"sweep-{data_version}-k{min_k}-{max_k}-s{random_state}.csv")
+
+
+def _score_k(data, n_clusters, random_state, data_version, sample_idx):
+    """
+    Fit (or load) the model for one k and return its inertia over all users
+    and its silhouette score on the shared sample.
+    """
+    model = fit_model(data, n_clusters, random_state, data_version)
+    X = feature_matrix(data)
+    inertia = 0.0
+    for start in range(0, len(X), PREDICT_BATCH_SIZE):
+        inertia -= model.score(X[start:start + PREDICT_BATCH_SIZE])
+    sample = X[sample_idx]
+    labels = model.predict(sample)
+    silhouette = (silhouette_score(sample, labels)
+                  if 1 < len(np.unique(labels)) < len(sample) else np.nan)
+    return {'k': n_clusters, 'inertia': inertia, 'silhouette': silhouette}
+
+
+@profiling.profiled()
+def sweep_k(data, max_k, random_state, data_version, min_k=2, n_jobs=-1):
+    """
+    Fit k = min_k..max_k in parallel and return a frame with the inertia and
+    sampled silhouette score of each k. Results are cached per data version,
+    and the fitted models land in the model cache so picking a k afterwards
+    does not refit.
+    """
+    path = _sweep_path(min_k, max_k, random_state, data_version)
+    if os.path.exists(path):
+        return pd.read_csv(path)
+
+    rng = np.random.default_rng(random_state)
+    sample_idx = np.sort(rng.choice(len(data), size=min(
+        SILHOUETTE_SAMPLE_SIZE, len(data)), replace=False))
+    ks = [k for k in range(min_k, max_k + 1) if k <= len(data)]
+    rows = joblib.Parallel(n_jobs=n_jobs)(
+        joblib.delayed(_score_k)(data, k, random_state, data_version, sample_idx)
+        for k in ks)
+    results = pd.DataFrame(rows, columns=['k', 'inertia', 'silhouette'])
+
+    os.makedirs(SWEEP_DIR, exist_ok=True)
+    results.to_csv(f"{path}.tmp", index=False)
+    os.replace(f"{path}.tmp", path)
+    _prune_versions(SWEEP_DIR, 'sweep', '.csv', data_version)
+    return results
+
+
+if __name__ == "__main__":
+    from data_loader import load_user_order_stats, source_version
+
+    parser = argparse.ArgumentParser(
+        description="Fit k-means for a range of k and report inertia and silhouette.")
+    parser.add_argument('--min-k', type=int, default=2)
+    parser.add_argument('--max-k', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--jobs', type=int, default=-1,
+                        help="parallel workers (-1 uses every core)")
+    args = parser.parse_args()
+
+    version = source_version()
+    users = load_user_order_stats(version).dropna().drop_duplicates()
+    results = sweep_k(users, args.max_k, args.seed, version,
+                      min_k=args.min_k, n_jobs=args.jobs)
+    print(results.to_string(index=False))
+    scored = results.dropna(subset=['silhouette'])
+    if scored.empty:
+        print("No k could be scored: every silhouette is undefined for this data.")
+    else:
+        best = scored.loc[scored['silhouette'].idxmax()]
+        print(f"Best silhouette: k={int(best['k'])} ({best['silhouette']:.3f})")
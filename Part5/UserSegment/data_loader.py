@@ -0,0 +1,261 @@
+# Data loading for the User Clustering Dashboard. Per-user order statistics are
+# aggregated in the database (or, without a database, from the CSV exports with
+# only the needed columns) and cached as Parquet keyed on source freshness, so
+# a restarted dashboard reuses the last result until the source tables change.
+# The order revenue trend is bucketed on the server and cached per database and
+# granularity; a refresh only re-reads the latest bucket. Vendor rankings are
+# read a page at a time from the totals maintained by Part2/vendor_sales.py.
+
+import glob
+import hashlib
+import logging
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(
+    os.path.abspath(__file__)), '..', '..'))
+sys.path.append(os.path.join(os.path.dirname(
+    os.path.abspath(__file__)), '..', '..', 'Part2'))
+import db  # noqa: E402
+import profiling  # noqa: E402
+from vendor_sales import top_vendors, vendor_count  # noqa: E402
+
+
+CACHE_DIR = os.environ.get('USER_SEGMENT_CACHE_DIR', 'cache')
+# 'db', 'csv', or 'auto' to try the database first and fall back to the CSVs.
+DATA_SOURCE = os.environ.get('USER_SEGMENT_SOURCE', 'auto')
+GROUPS_CARTS_CSV = 'groups_carts.csv'
+ORDERS_CSV = 'orders.csv'
+TREND_GRANULARITIES = {'day': 'D', 'week': 'W-SUN', 'month': 'M'}
+MAX_TREND_POINTS = 1000
+
+USER_ORDER_STATS_QUERY = """
+SELECT
+    gc.user_id,
+    COUNT(o.id) AS order_count,
+    SUM(o.total_amount) AS total_order_amount
+FROM
+    public.orders o
+JOIN
+    public.groups_carts gc ON o.groups_carts_id = gc.id
+GROUP BY
+    gc.user_id
+"""
+
+# The unit is interpolated from TREND_GRANULARITIES, never from user input.
+ORDER_TREND_QUERY = """
+SELECT
+    DATE_TRUNC('{unit}', o.created_at) AS bucket,
+    SUM(o.total_amount) AS revenue,
+    COUNT(*) AS order_count
+FROM
+    public.orders o
+WHERE
+    o.created_at IS NOT NULL
+    AND (%(since)s::timestamp IS NULL OR o.created_at >= %(since)s::timestamp)
+GROUP BY
+    1
+ORDER BY
+    1
+"""
+
+# Insert/update/delete counters from the statistics collector: a catalog
+# lookup that changes whenever the source tables do, without scanning them.
+SOURCE_VERSION_QUERY = """
+SELECT
+    STRING_AGG(relname || ':' || n_tup_ins || ':' || n_tup_upd || ':' || n_tup_del,
+               ',' ORDER BY relname)
+FROM
+    pg_stat_user_tables
+WHERE
+    relname IN ('orders', 'groups_carts')
+"""
+
+
+def _use_database():
+    return DATA_SOURCE in ('db', 'auto')
+
+
+def source_version():
+    """
+    Return a short token that changes whenever the order data changes. The
+    database token also names the database, since the statistics counters of
+    two databases (or of one after a stats reset) can match.
+    """
+    if _use_database():
+        try:
+            token = f"{_database_key()}:{db.fetchall(SOURCE_VERSION_QUERY)[0][0] or ''}"
+            return 'db-' + hashlib.sha1(token.encode()).hexdigest()[:12]
+        except Exception as e:
+            if DATA_SOURCE == 'db':
+                raise
+            logging.warning(
+                f"Database unavailable, using CSV exports instead: {e}")
+    stats = [f"{path}:{os.path.getmtime(path)}:{os.path.getsize(path)}"
+             for path in (GROUPS_CARTS_CSV, ORDERS_CSV)]
+    return 'csv-' + hashlib.sha1(','.join(stats).encode()).hexdigest()[:12]
+
+
+@profiling.profiled()
+def create_user_order_stats(groups_carts, orders):
+    user_order_stats = (
+        groups_carts.merge(orders, left_on='id',
+                           right_on='groups_carts_id', how='inner')
+        .groupby('user_id')
+        .agg(order_count=('id_y', 'count'), total_order_amount=('total_amount', 'sum'))
+        .reset_index()
+    )
+    return user_order_stats
+
+
+def _stats_from_csv():
+    groups_carts = pd.read_csv(GROUPS_CARTS_CSV, usecols=['id', 'user_id'])
+    orders = pd.read_csv(ORDERS_CSV, usecols=[
+                         'id', 'groups_carts_id', 'total_amount'])
+    return create_user_order_stats(groups_carts, orders)
+
+
+def _database_key():
+    """
+    Short token for the database the dashboard reads, so caches built from
+    one database are never reused for another.
+    """
+    identity = '{host}:{port}/{dbname}'.format(**db.DB_CONFIG)
+    return hashlib.sha1(identity.encode()).hexdigest()[:12]
+
+
+def _cache_path(name, version):
+    return os.path.join(CACHE_DIR, f"{name}-{version}.parquet")
+
+
+def _write_parquet(df, path):
+    """
+    Write ``df`` to ``path`` through a temporary file of its own, so that
+    concurrent writers (several dashboard sessions or processes) never share
+    a partial file.
+    """
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=CACHE_DIR, suffix='.tmp', delete=False) as tmp:
+        tmp_path = tmp.name
+    try:
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def _write_cache(df, name, version):
+    """
+    Write a cached frame and remove older versions of it. Another process
+    may already have removed one.
+    """
+    path = _cache_path(name, version)
+    _write_parquet(df, path)
+    for old in glob.glob(os.path.join(CACHE_DIR, f"{name}-*.parquet")):
+        if old != path:
+            try:
+                os.remove(old)
+            except FileNotFoundError:
+                pass
+
+
+@profiling.profiled()
+def load_user_order_stats(version=None, columns=None):
+    """
+    Per-user order count and total order amount for ``version`` of the source
+    data, read from the Parquet cache when present. ``columns`` limits what is
+    read from the cache.
+    """
+    version = version or source_version()
+    path = _cache_path('user_order_stats', version)
+    if os.path.exists(path):
+        return pd.read_parquet(path, columns=columns)
+
+    if version.startswith('db-'):
+        stats = db.read_frame(USER_ORDER_STATS_QUERY)
+    else:
+        stats = _stats_from_csv()
+    _write_cache(stats, 'user_order_stats', version)
+    return stats[columns] if columns else stats
+
+
+def _trend_from_csv(granularity):
+    orders = pd.read_csv(ORDERS_CSV, usecols=['created_at', 'total_amount'])
+    orders['created_at'] = pd.to_datetime(orders['created_at'], format='ISO8601')
+    orders = orders.dropna(subset=['created_at'])
+    # Same bucket starts as DATE_TRUNC: weeks start on Monday.
+    buckets = orders['created_at'].dt.to_period(
+        TREND_GRANULARITIES[granularity]).dt.start_time
+    trend = (orders.groupby(buckets)
+             .agg(revenue=('total_amount', 'sum'),
+                  order_count=('total_amount', 'size'))
+             .rename_axis('bucket')
+             .reset_index())
+    return trend
+
+
+@profiling.profiled()
+def load_order_trend(granularity='day', version=None):
+    """
+    Order revenue and order count per day, week or month. From the database,
+    buckets before the last cached one are reused and only the rest is
+    aggregated again; orders changed inside older buckets are not picked up
+    until the cache file is removed.
+    """
+    if granularity not in TREND_GRANULARITIES:
+        raise ValueError(f"Unknown granularity: {granularity}")
+    version = version or source_version()
+    if not version.startswith('db-'):
+        path = _cache_path(f"order_trend_{granularity}", version)
+        if os.path.exists(path):
+            return pd.read_parquet(path)
+        trend = _trend_from_csv(granularity)
+        _write_cache(trend, f"order_trend_{granularity}", version)
+        return trend
+
+    # Kept out of _cache_path's naming so pruning CSV versions never removes it.
+    path = os.path.join(CACHE_DIR, f"order_trend_{granularity}.{_database_key()}.parquet")
+    cached = pd.read_parquet(path) if os.path.exists(path) else None
+    since = cached['bucket'].max() if cached is not None and len(cached) else None
+    fresh = db.read_frame(ORDER_TREND_QUERY.format(unit=granularity),
+                          {'since': since}, parse_dates=['bucket'])
+    if since is not None:
+        fresh = pd.concat([cached[cached['bucket'] < since], fresh],
+                          ignore_index=True) if len(fresh) else cached
+    _write_parquet(fresh, path)
+    return fresh
+
+
+def downsample(trend, max_points=MAX_TREND_POINTS):
+    """
+    Average consecutive buckets so at most ``max_points`` are plotted. Each
+    point keeps the start of its first bucket, and values stay per bucket.
+    """
+    if len(trend) <= max_points:
+        return trend
+    step = -(-len(trend) // max_points)
+    blocks = np.arange(len(trend)) // step
+    return trend.groupby(blocks).agg(
+        bucket=('bucket', 'first'),
+        revenue=('revenue', 'mean'),
+        order_count=('order_count', 'mean'))
+
+
+@profiling.profiled()
+def load_vendor_page(page=0, page_size=20, source='cart_variations'):
+    """
+    One page of vendors ranked by revenue, with their rank. Needs the totals
+    built by Part2/vendor_sales.py.
+    """
+    rows = top_vendors(page_size, page * page_size, source)
+    vendors = pd.DataFrame(rows, columns=['rank', 'vendor_id', 'revenue', 'order_count'])
+    return vendors.astype({'revenue': float, 'order_count': int})
+
+
+def load_vendor_count(source='cart_variations'):
+    return vendor_count(source)
@@ -0,0 +1,312 @@
+# Generate a synthetic database for the analysis scripts at a given scale
+# factor. Row counts grow linearly with the scale; users, products, vendors and
+# categories follow Zipf-like popularity, order amounts are log-normal and
+# activity grows over time, so joins and group-bys see realistic skew. Rows
+# are built with NumPy in chunks and loaded with COPY.
+
+import argparse
+import io
+import os
+import sys
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import psycopg2
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import db  # noqa: E402
+
+
+BENCH_DATABASE = os.environ.get('BENCH_DATABASE', 'sqlbench')
+SCHEMA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'schema.sql')
+# The as-of date hard-coded in the Part2 sales growth scripts.
+DEFAULT_END = '2024-12-13'
+HISTORY_DAYS = 730
+CHUNK_ROWS = 200000
+
+# Rows at scale 1. Categories stay fixed; everything else is multiplied.
+SCALE_ROWS = {
+    'users': 10000,
+    'product_names': 1000,
+    'vendors': 200,
+    'products': 2000,
+    'group_deals': 3000,
+    'groups': 20000,
+    'groups_carts': 60000,
+    'single_deals': 1000,
+}
+CATEGORIES = [
+    'Dairy', 'Baking Goods', 'Cloth & Fashion', 'Electronics', 'Toys', 'Beverages',
+    'Snacks', 'Frozen Food', 'Household', 'Personal Care', 'Baby Care', 'Pet Supplies',
+    'Stationery', 'Sports', 'Home Decor', 'Kitchenware', 'Fruits & Vegetables',
+    'Meat & Seafood', 'Health', 'Books',
+]
+# Fraction of carts that become an order, and of orders that get rated.
+ORDER_RATE = 0.8
+RATING_RATE = 0.6
+
+# Deterministic ids: one prefix per table, the row number in the last group.
+TABLE_CODES = {name: code for code, name in enumerate([
+    'users', 'categories', 'product_names', 'vendors', 'products', 'product_variations',
+    'product_variation_stocks', 'product_variation_prices', 'group_deals', 'groups',
+    'groups_carts', 'group_cart_variations', 'orders', 'product_ratings', 'single_deals'], 1)}
+
+
+def uuids(table, index):
+    prefix = f"{TABLE_CODES[table]:08x}-0000-4000-8000-"
+    return prefix + pd.Index(index).map('{:012x}'.format).to_numpy(dtype=object)
+
+
+def zipf_choice(rng, n, size, a=1.1):
+    """
+    Draw ``size`` indices in [0, n) where index k has weight 1 / (k + 1) ** a.
+    """
+    weights = 1.0 / np.arange(1, n + 1) ** a
+    return rng.choice(n, size=size, p=weights / weights.sum())
+
+
+def between(start, end, fractions):
+    return start.to_datetime64() + ((end - start).value * fractions).astype('timedelta64[ns]')
+
+
+def growing_times(rng, start, end, size, growth=1.5):
+    # Density rises towards ``end``: more recent periods are busier.
+    return between(start, end, rng.random(size) ** (1.0 / growth))
+
+
+def after(rng, times, mean, end):
+    """
+    Timestamps an exponentially distributed delay after ``times``. Delays
+    that would pass ``end`` are redrawn uniformly up to ``end``.
+    """
+    end = end.to_datetime64()
+    delay = rng.exponential(mean.value, len(times)).astype('timedelta64[ns]')
+    late = times + delay > end
+    delay[late] = ((end - times[late]).astype(np.int64) *
+                   rng.random(late.sum())).astype('timedelta64[ns]')
+    return times + delay
+
+
+def choose(rng, values, size, probs):
+    return np.asarray(values, dtype=object)[rng.choice(len(values), size=size, p=probs)]
+
+
+def copy_frame(cursor, table, frame):
+    buffer = io.StringIO()
+    frame.to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+    cursor.copy_expert(
+        f"COPY public.{table} ({', '.join(frame.columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+    return len(frame)
+
+
+def ensure_database(database):
+    conn = psycopg2.connect(**dict(db.DB_CONFIG, dbname='postgres'))
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_database WHERE datname = %s;", (database,))
+            if cursor.fetchone() is None:
+                cursor.execute(f'CREATE DATABASE "{database}";')
+    finally:
+        conn.close()
+
+
+def generate(scale=1.0, seed=42, end=DEFAULT_END, database=BENCH_DATABASE, force=False):
+    """
+    Recreate the public schema of ``database`` and fill it with synthetic data
+    at ``scale``. Returns the number of rows written per table. Raises
+    ValueError for a database whose name does not contain 'bench', unless
+    ``force`` is set, so real data is never dropped by mistake.
+    """
+    if 'bench' not in database and not force:
+        raise ValueError(f"Refusing to replace the schema of '{database}'; "
+                         "use a benchmark database or force it.")
+    rng = np.random.default_rng(seed)
+    end = pd.Timestamp(end)
+    start = end - pd.Timedelta(days=HISTORY_DAYS)
+    n = {table: max(1, int(rows * scale)) for table, rows in SCALE_ROWS.items()}
+    rows = {}
+    ensure_database(database)
+
+    with db.connection({'dbname': database}, timeout_ms=0) as conn, conn.cursor() as cursor:
+        with open(SCHEMA_FILE, encoding='utf-8') as f:
+            cursor.execute(f.read())
+
+        def write(table, frame):
+            rows[table] = rows.get(table, 0) + copy_frame(cursor, table, frame)
+
+        # Users and catalog.
+        user_created = growing_times(rng, start, end, n['users'])
+        write('users', pd.DataFrame({
+            'id': uuids('users', range(n['users'])),
+            'name': [f"user {i}" for i in range(n['users'])],
+            'created_at': user_created,
+            'updated_at': after(rng, user_created, pd.Timedelta(days=60), end),
+        }))
+        write('categories', pd.DataFrame({
+            'id': uuids('categories', range(len(CATEGORIES))),
+            'name': CATEGORIES,
+            'created_at': start,
+        }))
+        write('product_names', pd.DataFrame({
+            'id': uuids('product_names', range(n['product_names'])),
+            'name': [f"product {i}" for i in range(n['product_names'])],
+            'category_id': uuids('categories', zipf_choice(
+                rng, len(CATEGORIES), n['product_names'], a=0.8)),
+            'created_at': start,
+        }))
+        product_created = between(start, end, rng.random(n['products']) * 0.5)
+        write('products', pd.DataFrame({
+            'id': uuids('products', range(n['products'])),
+            'name_id': uuids('product_names', rng.integers(0, n['product_names'], n['products'])),
+            'vendor_id': uuids('vendors', zipf_choice(rng, n['vendors'], n['products'])),
+            'created_at': product_created,
+        }))
+
+        # One to three variations per product, stored contiguously so a
+        # product's variations are variation_start[p] .. + variation_count[p].
+        variation_count = rng.integers(1, 4, n['products'])
+        variation_start = np.concatenate([[0], np.cumsum(variation_count)[:-1]])
+        variation_product = np.repeat(np.arange(n['products']), variation_count)
+        n_variations = len(variation_product)
+        variation_created = product_created[variation_product]
+        write('product_variations', pd.DataFrame({
+            'id': uuids('product_variations', range(n_variations)),
+            'product_id': uuids('products', variation_product),
+            'weight': rng.gamma(2.0, 0.75, n_variations).round(2),
+            'status': choose(rng, ['ACTIVE', 'INACTIVE'], n_variations, [0.85, 0.15]),
+            'created_at': variation_created,
+        }))
+        # Every variation has an initial stock and price; about a third get a
+        # later update, so "latest value" lookups have history to skip.
+        base_price = np.exp(rng.normal(np.log(120), 0.9, n_variations)).round().astype(np.int64)
+        for table, column, first, later in (
+                ('product_variation_stocks', 'stock',
+                 rng.integers(0, 200, n_variations), rng.integers(0, 200, n_variations)),
+                ('product_variation_prices', 'price',
+                 base_price, (base_price * rng.uniform(0.8, 1.2, n_variations)).round().astype(np.int64))):
+            updated = np.flatnonzero(rng.random(n_variations) < 0.35)
+            write(table, pd.DataFrame({
+                'id': uuids(table, range(n_variations + len(updated))),
+                'product_variation_id': uuids('product_variations', np.concatenate(
+                    [np.arange(n_variations), updated])),
+                column: np.concatenate([first, later[updated]]),
+                'created_at': np.concatenate([
+                    variation_created,
+                    after(rng, variation_created[updated], pd.Timedelta(days=90), end)]),
+            }))
+
+        # Deals and groups: popular products get most deals, power users
+        # create most groups, and groups start soon after the creator signs up.
+        deal_product = zipf_choice(rng, n['products'], n['group_deals'], a=1.2)
+        write('group_deals', pd.DataFrame({
+            'id': uuids('group_deals', range(n['group_deals'])),
+            'product_id': uuids('products', deal_product),
+            'created_at': np.maximum(growing_times(rng, start, end, n['group_deals']),
+                                     product_created[deal_product]),
+        }))
+        group_creator = zipf_choice(rng, n['users'], n['groups'])
+        group_created = after(rng, user_created[group_creator], pd.Timedelta(days=30), end)
+        write('groups', pd.DataFrame({
+            'id': uuids('groups', range(n['groups'])),
+            'group_deals_id': uuids('group_deals', rng.integers(0, n['group_deals'], n['groups'])),
+            'created_by': uuids('users', group_creator),
+            'status': choose(rng, ['COMPLETED', 'ACTIVE', 'CANCELLED'], n['groups'], [0.6, 0.3, 0.1]),
+            'created_at': group_created,
+        }))
+
+        # Carts, their variations, orders and ratings are written in chunks.
+        order_index = 0
+        for chunk_start in range(0, n['groups_carts'], CHUNK_ROWS):
+            cart = np.arange(chunk_start, min(chunk_start + CHUNK_ROWS, n['groups_carts']))
+            size = len(cart)
+            cart_group = rng.integers(0, n['groups'], size)
+            cart_created = after(rng, group_created[cart_group], pd.Timedelta(days=2), end)
+            cart_status = choose(rng, ['COMPLETED', 'ACTIVE', None], size, [0.6, 0.3, 0.1])
+            write('groups_carts', pd.DataFrame({
+                'id': uuids('groups_carts', cart),
+                'group_id': uuids('groups', cart_group),
+                'user_id': uuids('users', zipf_choice(rng, n['users'], size)),
+                'status': cart_status,
+                'created_at': cart_created,
+                'updated_at': after(rng, cart_created, pd.Timedelta(days=1), end),
+            }))
+
+            items = rng.integers(1, 4, size)
+            item_cart = np.repeat(np.arange(size), items)
+            item_product = zipf_choice(rng, n['products'], len(item_cart), a=1.2)
+            item_variation = variation_start[item_product] + \
+                rng.integers(0, variation_count[item_product])
+            item_first = np.concatenate([[0], np.cumsum(items)[:-1]])
+            write('group_cart_variations', pd.DataFrame({
+                'id': uuids('group_cart_variations',
+                            range(rows.get('group_cart_variations', 0),
+                                  rows.get('group_cart_variations', 0) + len(item_cart))),
+                'group_cart_id': uuids('groups_carts', cart[item_cart]),
+                'product_variation_id': uuids('product_variations', item_variation),
+                'created_at': cart_created[item_cart],
+            }))
+
+            ordered = np.flatnonzero(rng.random(size) < ORDER_RATE)
+            order_ids = np.arange(order_index, order_index + len(ordered))
+            order_index += len(ordered)
+            order_created = after(rng, cart_created[ordered], pd.Timedelta(hours=12), end)
+            write('orders', pd.DataFrame({
+                'id': uuids('orders', order_ids),
+                'groups_carts_id': uuids('groups_carts', cart[ordered]),
+                'total_amount': np.exp(rng.normal(np.log(150), 0.8, len(ordered))).round().astype(np.int64),
+                'status': choose(rng, ['COMPLETED', 'PENDING', 'CANCELLED'],
+                                 len(ordered), [0.7, 0.2, 0.1]),
+                'created_at': order_created,
+                'updated_at': after(rng, order_created, pd.Timedelta(days=3), end),
+            }))
+
+            # Rated orders rate one or two products from their cart.
+            rated = np.flatnonzero(rng.random(len(ordered)) < RATING_RATE)
+            per_order = rng.integers(1, 3, len(rated))
+            rating_order = np.repeat(rated, per_order)
+            rating_cart = ordered[rating_order]
+            rating_item = item_first[rating_cart] + \
+                rng.integers(0, items[rating_cart])
+            write('product_ratings', pd.DataFrame({
+                'id': uuids('product_ratings',
+                            range(rows.get('product_ratings', 0),
+                                  rows.get('product_ratings', 0) + len(rating_order))),
+                'product_id': uuids('products', item_product[rating_item]),
+                'order_id': uuids('orders', order_ids[rating_order]),
+                'rating': choose(rng, [1, 2, 3, 4, 5], len(rating_order),
+                                 [0.05, 0.07, 0.15, 0.33, 0.40]),
+                'created_at': after(rng, order_created[rating_order], pd.Timedelta(days=5), end),
+            }))
+
+        write('single_deals', pd.DataFrame({
+            'id': uuids('single_deals', range(n['single_deals'])),
+            'original_price': np.exp(rng.normal(np.log(40), 0.7, n['single_deals'])).round().astype(np.int64),
+            'quantity': rng.integers(1, 10, n['single_deals']),
+            'status': choose(rng, ['ACTIVE', 'INACTIVE'], n['single_deals'], [0.7, 0.3]),
+            'created_at': growing_times(rng, start, end, n['single_deals']),
+        }))
+        cursor.execute("ANALYZE;")
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic benchmark database.")
+    parser.add_argument('--scale', type=float, default=1.0)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--end', default=DEFAULT_END, help="latest timestamp in the data")
+    parser.add_argument('--database', default=BENCH_DATABASE)
+    parser.add_argument('--force', action='store_true',
+                        help="allow a database whose name does not contain 'bench'")
+    args = parser.parse_args()
+
+    started = datetime.now()
+    try:
+        rows = generate(args.scale, args.seed, args.end, args.database, args.force)
+    except ValueError as e:
+        sys.exit(str(e))
+    for table, count in rows.items():
+        print(f"{table:<26} {count:>12,}")
+    print(f"Generated scale {args.scale} in {(datetime.now() - started).total_seconds():.1f}s.")
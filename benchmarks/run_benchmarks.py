@@ -0,0 +1,288 @@
+# Benchmark every analysis pipeline against synthetic databases of growing
+# size. For each scale the database is regenerated, then each pipeline runs in
+# its own process so wall time and peak memory are measured in isolation.
+# Results go to a JSON file that can be compared with an earlier run to catch
+# regressions.
+
+import argparse
+import glob
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+
+import pyarrow.parquet as pq
+
+from generate_data import BENCH_DATABASE, DEFAULT_END, generate
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import db  # noqa: E402
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_SCALES = [0.5, 1, 2]
+DEFAULT_TIMEOUT = 900
+SAMPLE_SECONDS = 0.05
+ROWS_PATTERN = re.compile(r'^rows=(\d+)$', re.MULTILINE)
+# Counts the existing scripts print, e.g. "(8230 rows written)".
+REPORTED_ROWS_PATTERN = re.compile(r'(\d[\d,]*) (?:daily )?(?:rows|products)\b')
+
+DASHBOARD_SNIPPET = """
+from data_loader import load_order_trend, load_user_order_stats, load_vendor_page
+rows = len(load_user_order_stats())
+rows += sum(len(load_order_trend(g)) for g in ('day', 'week', 'month'))
+rows += len(load_vendor_page(0))
+print(f"rows={rows}")
+"""
+
+CLUSTERING_SNIPPET = """
+from clustering import assign_clusters, fit_model
+from data_loader import load_user_order_stats, source_version
+version = source_version()
+users = load_user_order_stats(version).dropna().drop_duplicates()
+labels = assign_clusters(fit_model(users, 3, 42, version), users)
+print(f"rows={len(labels)}")
+"""
+
+
+def _script(*parts):
+    return [sys.executable, os.path.join(ROOT, *parts)]
+
+
+def _sql(*parts):
+    return [sys.executable, os.path.abspath(__file__), '--run-sql', os.path.join(ROOT, *parts)]
+
+
+def _snippet(code, *parts):
+    return [sys.executable, '-c', f"import sys; sys.path.insert(0, {os.path.join(ROOT, *parts)!r})\n{code}"]
+
+
+# Run in this order at every scale; later pipelines may use tables, caches or
+# models written by earlier ones.
+PIPELINES = {
+    'part1_top_users_sql': _sql('Part1', 'Question1.sql'),
+    'part1_conversion_sql': _sql('Part1', 'q1.b.sql'),
+    'part4_kpi1_sql': _sql('Part4', 'kpi1.sql'),
+    'part4_kpi2_sql': _sql('Part4', 'kpi2.sql'),
+    'part4_kpi3_sql': _sql('Part4', 'KPI3.sql'),
+    'part5_user_segment_sql': _sql('Part5', 'UserSegment', 'UserSegmentMain.sql'),
+    'part5_model_features_sql': _sql('Part5', 'Predictive analysis', 'QueryforModelTesting.sql'),
+    'fetch2': _script('Part2', 'fetch2.py'),
+    'fetch_most_popular_product': _script('Part2', 'Fetch_Most_Popular_Product.py'),
+    'cohort_analysis': _script('Part2', 'cohort_analysis.py'),
+    'preprocess': _script('Part2', 'preprocess.py'),
+    'sales_rollup': _script('Part2', 'sales_rollup.py'),
+    'vendor_sales': _script('Part2', 'vendor_sales.py'),
+    'dashboard_loaders': _snippet(DASHBOARD_SNIPPET, 'Part5', 'UserSegment'),
+    'user_clustering': _snippet(CLUSTERING_SNIPPET, 'Part5', 'UserSegment'),
+    'product_features': _script('Part5', 'Predictive analysis', 'product_features.py'),
+    'train_model': _script('Part5', 'Predictive analysis', 'train_model.py') + ['--split', 'random'],
+    'score_products': _script('Part5', 'Predictive analysis', 'score_products.py'),
+}
+
+
+def count_output_rows(workdir, since):
+    """
+    Data rows in the CSV and Parquet files written under ``workdir`` after
+    ``since``.
+    """
+    rows = 0
+    for path in glob.glob(os.path.join(workdir, '**', '*'), recursive=True):
+        if not os.path.isfile(path) or os.path.getmtime(path) < since:
+            continue
+        if path.endswith('.csv'):
+            with open(path, 'rb') as f:
+                rows += max(0, sum(1 for _ in f) - 1)
+        elif path.endswith('.parquet'):
+            rows += pq.ParquetFile(path).metadata.num_rows
+    return rows
+
+
+def _status_kb(pid, field):
+    try:
+        with open(f"/proc/{pid}/status", encoding='ascii') as f:
+            for line in f:
+                if line.startswith(field):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def _descendants(pid):
+    parents = {}
+    for entry in os.listdir('/proc'):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat", encoding='ascii') as f:
+                    # The parent pid follows the parenthesised command name.
+                    parents[int(entry)] = int(f.read().rsplit(')', 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+    tree, frontier = [], [pid]
+    while frontier:
+        children = [child for child, parent in parents.items() if parent in frontier]
+        tree.extend(children)
+        frontier = children
+    return tree
+
+
+class MemorySampler(threading.Thread):
+    """
+    Track the peak memory of a process tree from /proc: the larger of the
+    main process's high-water mark and the highest combined resident set of
+    the process and its descendants (parallel workers) seen while sampling.
+    rusage cannot be used because a spawned child inherits the harness's
+    high-water mark.
+    """
+
+    def __init__(self, pid):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.peak_kb = 0
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.is_set():
+            tree_kb = sum(_status_kb(pid, 'VmRSS:') for pid in [self.pid] + _descendants(self.pid))
+            self.peak_kb = max(self.peak_kb, tree_kb, _status_kb(self.pid, 'VmHWM:'))
+            self._done.wait(SAMPLE_SECONDS)
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+
+def run_pipeline(name, command, workdir, env, timeout):
+    """
+    Run one pipeline in its own process and return its measurements. Peak
+    memory covers the pipeline's own processes, not the database server.
+    """
+    started = time.time()
+    with open(os.path.join(workdir, f"{name}.log"), 'w', encoding='utf-8') as log:
+        process = subprocess.Popen(command, cwd=workdir, env=env,
+                                   stdout=subprocess.PIPE, stderr=log, text=True)
+        sampler = MemorySampler(process.pid)
+        sampler.start()
+        timer = threading.Timer(timeout, process.kill)
+        timer.start()
+        stdout = process.stdout.read()
+        process.wait()
+        timer.cancel()
+        sampler.stop()
+        log.write(stdout)
+    wall = time.time() - started
+
+    # A pipeline's own rows= line wins; otherwise the counts it reports (one
+    # per table for preprocess) are added up, then written files are counted.
+    match = ROWS_PATTERN.findall(stdout)
+    reported = REPORTED_ROWS_PATTERN.findall(stdout)
+    if match:
+        rows_out = int(match[-1])
+    elif reported:
+        rows_out = sum(int(count.replace(',', '')) for count in reported)
+    else:
+        rows_out = count_output_rows(workdir, started)
+    return {
+        'pipeline': name,
+        'wall_seconds': round(wall, 3),
+        'peak_rss_mb': round(sampler.peak_kb / 1024, 1),
+        'rows_out': rows_out,
+        'returncode': process.returncode,
+        'timed_out': wall >= timeout and process.returncode < 0,
+    }
+
+
+def run_benchmarks(scales=DEFAULT_SCALES, pipelines=None, database=BENCH_DATABASE, seed=42,
+                   end=DEFAULT_END, timeout=DEFAULT_TIMEOUT, workroot='benchmark_runs',
+                   generate_data=True):
+    names = pipelines or list(PIPELINES)
+    env = dict(os.environ, PGDATABASE=database, MPLBACKEND='Agg')
+    report = {'started_at': datetime.now().isoformat(timespec='seconds'),
+              'database': database, 'seed': seed, 'datasets': {}, 'results': []}
+
+    for scale in scales:
+        if generate_data:
+            started = time.time()
+            tables = generate(scale, seed, end, database)
+            report['datasets'][str(scale)] = {
+                'rows': tables, 'total_rows': sum(tables.values()),
+                'generate_seconds': round(time.time() - started, 3)}
+            print(f"scale {scale}: generated {sum(tables.values()):,} rows")
+        # A fresh working directory per run, so no pipeline resumes from the
+        # watermarks or caches of an earlier one; logs stay for inspection.
+        workdir = os.path.abspath(os.path.join(workroot, f"scale-{scale}"))
+        shutil.rmtree(workdir, ignore_errors=True)
+        os.makedirs(workdir)
+        for name in names:
+            result = run_pipeline(name, PIPELINES[name], workdir, env, timeout)
+            result['scale'] = scale
+            report['results'].append(result)
+            state = 'ok' if result['returncode'] == 0 else (
+                'timeout' if result['timed_out'] else f"exit {result['returncode']}")
+            print(f"  {name:<28} {result['wall_seconds']:>9.2f}s {result['peak_rss_mb']:>8.1f} MB "
+                  f"{result['rows_out']:>10,} rows  {state}")
+    return report
+
+
+def compare(report, baseline, tolerance):
+    """
+    Return (scale, pipeline, metric, before, after) for every pipeline whose
+    wall time or peak memory grew by more than ``tolerance`` over the baseline.
+    """
+    before = {(str(r['scale']), r['pipeline']): r for r in baseline['results']}
+    regressions = []
+    for result in report['results']:
+        old = before.get((str(result['scale']), result['pipeline']))
+        if old is None or result['returncode'] != 0:
+            continue
+        for metric in ('wall_seconds', 'peak_rss_mb'):
+            if result[metric] > old[metric] * (1 + tolerance):
+                regressions.append((result['scale'], result['pipeline'], metric,
+                                    old[metric], result[metric]))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the analysis pipelines.")
+    parser.add_argument('--scales', type=float, nargs='+', default=DEFAULT_SCALES)
+    parser.add_argument('--pipelines', nargs='+', choices=list(PIPELINES),
+                        help="pipelines to run (default: all, in order)")
+    parser.add_argument('--database', default=BENCH_DATABASE)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--end', default=DEFAULT_END)
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT,
+                        help="seconds before a pipeline is killed")
+    parser.add_argument('--skip-generate', action='store_true',
+                        help="benchmark the database as it is (one scale)")
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--baseline', help="earlier results file to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="allowed slowdown over the baseline, as a fraction")
+    parser.add_argument('--run-sql', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_sql:
+        print(f"rows={db.run_sql_file(args.run_sql)}")
+        sys.exit(0)
+    if 'bench' not in args.database and not args.skip_generate:
+        sys.exit(f"Refusing to regenerate '{args.database}'; use a benchmark database.")
+
+    report = run_benchmarks(args.scales[:1] if args.skip_generate else args.scales,
+                            args.pipelines, args.database, args.seed, args.end,
+                            args.timeout, generate_data=not args.skip_generate)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}.")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for scale, name, metric, old, new in regressions:
+            print(f"REGRESSION scale {scale} {name}: {metric} {old} -> {new}")
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,110 @@
+-- Tables read by the analysis scripts and SQL files, with the columns they use.
+-- Used by generate_data.py to build a synthetic benchmark database; only the
+-- primary keys are indexed so that every benchmark starts from the same plan.
+
+DROP SCHEMA IF EXISTS public CASCADE;
+CREATE SCHEMA public;
+
+CREATE TABLE users (
+    id uuid PRIMARY KEY,
+    name varchar,
+    created_at timestamp,
+    updated_at timestamp
+);
+
+CREATE TABLE categories (
+    id uuid PRIMARY KEY,
+    name varchar,
+    created_at timestamp
+);
+
+CREATE TABLE product_names (
+    id uuid PRIMARY KEY,
+    name varchar,
+    category_id uuid,
+    created_at timestamp
+);
+
+CREATE TABLE products (
+    id uuid PRIMARY KEY,
+    name_id uuid,
+    vendor_id uuid,
+    created_at timestamp
+);
+
+CREATE TABLE product_variations (
+    id uuid PRIMARY KEY,
+    product_id uuid,
+    weight numeric,
+    status varchar,
+    created_at timestamp
+);
+
+CREATE TABLE product_variation_stocks (
+    id uuid PRIMARY KEY,
+    product_variation_id uuid,
+    stock integer,
+    created_at timestamp
+);
+
+CREATE TABLE product_variation_prices (
+    id uuid PRIMARY KEY,
+    product_variation_id uuid,
+    price numeric,
+    created_at timestamp
+);
+
+CREATE TABLE group_deals (
+    id uuid PRIMARY KEY,
+    product_id uuid,
+    created_at timestamp
+);
+
+CREATE TABLE groups (
+    id uuid PRIMARY KEY,
+    group_deals_id uuid,
+    created_by uuid,
+    status varchar,
+    created_at timestamp
+);
+
+CREATE TABLE groups_carts (
+    id uuid PRIMARY KEY,
+    group_id uuid,
+    user_id uuid,
+    status varchar,
+    created_at timestamp,
+    updated_at timestamp
+);
+
+CREATE TABLE group_cart_variations (
+    id uuid PRIMARY KEY,
+    group_cart_id uuid,
+    product_variation_id uuid,
+    created_at timestamp
+);
+
+CREATE TABLE orders (
+    id uuid PRIMARY KEY,
+    groups_carts_id uuid,
+    total_amount numeric,
+    status varchar,
+    created_at timestamp,
+    updated_at timestamp
+);
+
+CREATE TABLE product_ratings (
+    id uuid PRIMARY KEY,
+    product_id uuid,
+    order_id uuid,
+    rating integer,
+    created_at timestamp
+);
+
+CREATE TABLE single_deals (
+    id uuid PRIMARY KEY,
+    original_price numeric,
+    quantity integer,
+    status varchar,
+    created_at timestamp
+);
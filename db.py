@@ -0,0 +1,329 @@
+# Shared database access for the analysis scripts: connection settings from the
+# environment, a bounded connection pool per process, statement timeouts,
+# server-side cursors for large results and a COPY-based bulk path into pandas.
+# With SQLANALYSIS_PROFILE set, every statement is recorded by profiling.py.
+
+import os
+import re
+import threading
+from contextlib import contextmanager
+
+import pandas as pd
+from psycopg2 import pool
+from sqlalchemy import create_engine
+from sqlalchemy.engine import URL
+
+import profiling
+
+
+DB_CONFIG = {
+    'host': os.environ.get('PGHOST', 'localhost'),
+    'port': os.environ.get('PGPORT', '5432'),
+    'dbname': os.environ.get('PGDATABASE', 'SQLTEST'),
+    'user': os.environ.get('PGUSER', 'postgres'),
+    'password': os.environ.get('PGPASSWORD', 'Admin'),
+}
+
+POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '8'))
+STATEMENT_TIMEOUT_MS = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', '300000'))
+
+_lock = threading.Lock()
+_pools = {}
+_engines = {}
+_pid = os.getpid()
+
+
+def _normalize(config):
+    """
+    Merge ``config`` over the environment defaults, accepting the 'database'
+    key used by some scripts as an alias for 'dbname'.
+    """
+    merged = dict(DB_CONFIG)
+    for key, value in (config or {}).items():
+        merged['dbname' if key == 'database' else key] = value
+    return merged
+
+
+def _options(timeout_ms):
+    return f"-c statement_timeout={timeout_ms}"
+
+
+def _reset_after_fork():
+    # Pools and engines must not be shared with a parent process.
+    global _pid
+    if os.getpid() != _pid:
+        _pools.clear()
+        _engines.clear()
+        _pid = os.getpid()
+
+
+class _BoundedPool:
+    """
+    psycopg2's pool raises once every connection is in use; this wrapper makes
+    callers wait for a free connection instead.
+    """
+
+    def __init__(self, config, size):
+        self._slots = threading.BoundedSemaphore(size)
+        self._pool = pool.ThreadedConnectionPool(
+            0, size, options=_options(STATEMENT_TIMEOUT_MS),
+            cursor_factory=profiling.cursor_factory(), **config)
+
+    def getconn(self):
+        self._slots.acquire()
+        try:
+            return self._pool.getconn()
+        except Exception:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn, close=False):
+        try:
+            self._pool.putconn(conn, close=close)
+        finally:
+            self._slots.release()
+
+    def closeall(self):
+        self._pool.closeall()
+
+
+def get_pool(config=None):
+    config = _normalize(config)
+    key = tuple(sorted(config.items()))
+    with _lock:
+        _reset_after_fork()
+        if key not in _pools:
+            _pools[key] = _BoundedPool(config, POOL_SIZE)
+        return _pools[key]
+
+
+@contextmanager
+def connection(config=None, timeout_ms=None):
+    """
+    Borrow a pooled connection. The transaction is committed when the block
+    exits normally and rolled back on error. ``timeout_ms`` overrides the
+    statement timeout for this block only (0 disables it).
+    """
+    db_pool = get_pool(config)
+    conn = db_pool.getconn()
+    broken = False
+    try:
+        if timeout_ms is not None:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    "SET LOCAL statement_timeout = %s;", (int(timeout_ms),))
+        yield conn
+        conn.commit()
+    except Exception:
+        broken = conn.closed != 0
+        if not broken:
+            conn.rollback()
+        raise
+    finally:
+        db_pool.putconn(conn, close=broken)
+
+
+@contextmanager
+def autocommit_connection(config=None):
+    """
+    Borrow a pooled connection in autocommit mode without a statement timeout,
+    for statements that cannot run inside a transaction block such as
+    CREATE INDEX CONCURRENTLY. Both settings are restored on release.
+    """
+    with connection(config) as conn:
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SET statement_timeout = 0;")
+            yield conn
+        finally:
+            if not conn.closed:
+                with conn.cursor() as cursor:
+                    cursor.execute("RESET statement_timeout;")
+                conn.autocommit = False
+
+
+def get_engine(config=None):
+    """
+    Return this process's SQLAlchemy engine for ``config``, created once with
+    a bounded pool and the configured statement timeout.
+    """
+    config = _normalize(config)
+    key = tuple(sorted(config.items()))
+    with _lock:
+        _reset_after_fork()
+        if key not in _engines:
+            url = URL.create('postgresql+psycopg2', username=config['user'],
+                             password=config['password'], host=config['host'],
+                             port=config['port'], database=config['dbname'])
+            connect_args = {'options': _options(STATEMENT_TIMEOUT_MS)}
+            if profiling.ENABLED:
+                connect_args['cursor_factory'] = profiling.cursor_factory()
+            _engines[key] = create_engine(
+                url, pool_size=POOL_SIZE, max_overflow=0, pool_pre_ping=True,
+                connect_args=connect_args)
+        return _engines[key]
+
+
+def fetchall(query, params=None, config=None):
+    with connection(config) as conn, conn.cursor() as cursor:
+        cursor.execute(query, params)
+        return cursor.fetchall()
+
+
+def execute(query, params=None, config=None):
+    """
+    Run a statement and return the number of affected rows.
+    """
+    with connection(config) as conn, conn.cursor() as cursor:
+        cursor.execute(query, params)
+        return cursor.rowcount
+
+
+def stream_rows(query, params=None, config=None, itersize=10000, timeout_ms=0):
+    """
+    Yield rows through a server-side cursor, ``itersize`` rows per round trip,
+    so large results never sit in memory at once. Long scans have no
+    statement timeout unless ``timeout_ms`` is given.
+    """
+    with connection(config, timeout_ms=timeout_ms) as conn:
+        with conn.cursor(name='stream_rows') as cursor:
+            cursor.itersize = itersize
+            cursor.execute(query, params)
+            yield from cursor
+
+
+def iter_frames(query, params=None, config=None, chunksize=50000, timeout_ms=0):
+    """
+    Like ``stream_rows`` but yields DataFrames of up to ``chunksize`` rows.
+    """
+    with connection(config, timeout_ms=timeout_ms) as conn:
+        with conn.cursor(name='iter_frames') as cursor:
+            cursor.itersize = chunksize
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(chunksize)
+                if not rows:
+                    break
+                columns = [col.name for col in cursor.description]
+                yield pd.DataFrame.from_records(rows, columns=columns)
+
+
+# Postgres type OIDs read_frame decodes explicitly; anything else is left to
+# pandas' inference (integers, and NUMERIC, which becomes float64).
+_BOOL_OIDS = {16}
+_TEXT_OIDS = {18, 19, 25, 1042, 1043, 2950}
+_TEMPORAL_OIDS = {1082, 1114, 1184}
+_COPY_NULL = r'\N'
+
+
+class _CountingWriter:
+    """
+    Write end of the COPY pipe; counts the bytes passing through.
+    """
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.bytes = 0
+
+    def write(self, data):
+        self.bytes += len(data)
+        return self.raw.write(data)
+
+    def seekable(self):
+        return False
+
+
+def read_frame(query, params=None, config=None, parse_dates=None, dtype=None):
+    """
+    Load a query result into pandas with a text COPY ... TO STDOUT, which
+    avoids decoding every row into Python objects. The CSV stream is parsed
+    while it arrives, so the payload is never held in memory as a whole.
+
+    Columns are typed from the result's Postgres types: booleans become a
+    nullable boolean column, text keeps empty strings apart from NULL, and
+    dates and timestamps are parsed. NUMERIC arrives as float64; pass
+    ``dtype`` (e.g. object with a converter upstream) where exact decimals
+    matter. ``parse_dates`` and ``dtype`` add to or override the derived types.
+    """
+    with profiling.span('read_frame', kind='fetch') as span:
+        with connection(config) as conn, conn.cursor() as cursor:
+            sql = cursor.mogrify(query.strip().rstrip(';'), params).decode()
+            cursor.execute(f"SELECT * FROM ({sql}) AS typed LIMIT 0;")
+            columns = [(col.name, col.type_code) for col in cursor.description]
+            dtypes = {name: str for name, oid in columns if oid in _TEXT_OIDS | _BOOL_OIDS}
+            dtypes.update(dtype or {})
+            dates = [name for name, oid in columns if oid in _TEMPORAL_OIDS]
+            dates += [name for name in parse_dates or [] if name not in dates]
+
+            read_fd, write_fd = os.pipe()
+            writer = _CountingWriter(os.fdopen(write_fd, 'wb'))
+            failure = []
+
+            def copy():
+                try:
+                    cursor.copy_expert(
+                        f"COPY ({sql}) TO STDOUT WITH (FORMAT csv, HEADER, NULL '{_COPY_NULL}')",
+                        writer)
+                except BaseException as e:
+                    failure.append(e)
+                finally:
+                    try:
+                        writer.raw.close()
+                    except BrokenPipeError:
+                        pass
+
+            copier = threading.Thread(target=copy, daemon=True)
+            copier.start()
+            with os.fdopen(read_fd, 'rb') as reader:
+                try:
+                    frame = pd.read_csv(reader, dtype=dtypes, parse_dates=dates or None,
+                                        keep_default_na=False, na_values=[_COPY_NULL])
+                finally:
+                    # Unblocks the copy thread if parsing stopped early.
+                    reader.close()
+                    copier.join()
+                    # A failed COPY (timeout, SQL error) sends little or
+                    # nothing, so its error explains the result better than
+                    # the parser's; a broken pipe only means parsing stopped.
+                    if failure and not isinstance(failure[0], BrokenPipeError):
+                        raise failure[0]
+        for name, oid in columns:
+            if oid in _BOOL_OIDS and name not in (dtype or {}):
+                frame[name] = frame[name].map({'t': True, 'f': False}).astype('boolean')
+        span.add(rows=len(frame), bytes=writer.bytes)
+    return frame
+
+
+def read_statements(path):
+    """
+    The statements of a SQL file, split on semicolons at line ends, without
+    the ones that are only comments.
+    """
+    with open(path, encoding='utf-8') as f:
+        return [s.strip() for s in re.split(r';\s*(?:\n|$)', f.read())
+                if re.sub(r'--[^\n]*', '', s).strip()]
+
+
+def run_sql_file(path, config=None):
+    """
+    Execute every statement of a SQL file, without a statement timeout, and
+    return the number of rows the statements returned.
+    """
+    rows = 0
+    with connection(config, timeout_ms=0) as conn, conn.cursor() as cursor:
+        for statement in read_statements(path):
+            cursor.execute(statement)
+            if cursor.description is not None:
+                rows += len(cursor.fetchall())
+    return rows
+
+
+def close_all():
+    with _lock:
+        for db_pool in _pools.values():
+            db_pool.closeall()
+        for engine in _engines.values():
+            engine.dispose()
+        _pools.clear()
+        _engines.clear()
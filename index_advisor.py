@@ -0,0 +1,458 @@
+# Suggest indexes for the project's SQL workload. Every read-only statement in
+# the report files is explained against the target database; sequential scans
+# of large tables are turned into index candidates from the columns they are
+# filtered and joined on. Selective filters become partial indexes on
+# low-cardinality equality columns (e.g. orders(created_at) WHERE status =
+# 'COMPLETED'), and the other columns a query reads from the table are
+# INCLUDEd when few enough to allow index-only scans. With --apply the
+# indexes are built concurrently and each statement is timed before and after.
+#
+#   python index_advisor.py                      print the suggested DDL
+#   python index_advisor.py --apply --repeat 3   build them and time the workload
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import time
+from collections import defaultdict
+
+import db
+from psycopg2 import errors
+
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+WORKLOAD = [
+    os.path.join('Part1', 'Question1.sql'),
+    os.path.join('Part1', 'q1.b.sql'),
+    os.path.join('Part4', 'kpi1.sql'),
+    os.path.join('Part4', 'kpi2.sql'),
+    os.path.join('Part4', 'KPI3.sql'),
+    os.path.join('Part5', 'UserSegment', 'UserSegmentMain.sql'),
+    os.path.join('Part5', 'Predictive analysis', 'QueryforModelTesting.sql'),
+    os.path.join('Part5', 'Predictive analysis', 'reasonchangingto3and6moth.sql'),
+]
+# Scans of smaller tables are cheap enough to leave alone.
+MIN_TABLE_ROWS = 10000
+# A filter must keep at most this fraction of a table to be worth an index.
+MAX_SELECTIVITY = 0.2
+# Equality columns with at most this many values go into the index predicate.
+PARTIAL_MAX_DISTINCT = 20
+# Above this many extra columns an index is not made covering.
+MAX_INCLUDE = 3
+TIMING_TIMEOUT_MS = 600000
+
+_READ_ONLY = re.compile(r'^\s*(SELECT|WITH)\b', re.IGNORECASE)
+_COMPARISON = re.compile(
+    r'^\(?(?P<alias>\w+)\.(?P<column>\w+)\)?(?:::[\w ]+)?\s*'
+    r'(?P<op>=|<>|>=|<=|>|<)\s*(?P<rhs>.+)$', re.DOTALL)
+_COLUMN_REF = re.compile(r'\b([A-Za-z_]\w*)\.([A-Za-z_]\w*)\b')
+_LITERAL = re.compile(r"^\(?('(?:[^']|'')*'|-?\d+(?:\.\d+)?)\)?(?:::[\w ]+)?$")
+_CONDITION_KEYS = ('Filter', 'Hash Cond', 'Merge Cond', 'Join Filter', 'Index Cond',
+                   'Recheck Cond')
+
+INDEX_QUERY = """
+    SELECT
+        ARRAY(
+            SELECT a.attname::text
+            FROM unnest(i.indkey) WITH ORDINALITY AS k(attnum, position)
+            JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = k.attnum
+            WHERE k.position <= i.indnkeyatts
+            ORDER BY k.position) AS key_columns,
+        pg_get_expr(i.indpred, i.indrelid) AS predicate
+    FROM
+        pg_index i
+    WHERE
+        i.indrelid = %(table)s::regclass
+        AND i.indisvalid
+"""
+
+# A CREATE INDEX CONCURRENTLY that fails leaves an invalid index behind.
+INDEX_VALID_QUERY = """
+    SELECT i.indisvalid FROM pg_index i WHERE i.indexrelid = to_regclass(%(name)s)
+"""
+
+# n_distinct is negative when it is a fraction of the row count.
+DISTINCT_QUERY = """
+    SELECT
+        s.attname::text,
+        CASE WHEN s.n_distinct < 0 THEN -s.n_distinct * GREATEST(c.reltuples, 0)
+             ELSE s.n_distinct END AS distinct_values
+    FROM
+        pg_stats s
+    JOIN
+        pg_class c ON c.oid = %(table)s::regclass
+    WHERE
+        s.schemaname || '.' || s.tablename = %(table)s
+"""
+
+
+def load_workload(paths):
+    """
+    (label, statement) for every read-only statement of the given SQL files;
+    labels are 'file:n' with n counting from 1.
+    """
+    workload = []
+    for path in paths:
+        full = path if os.path.isabs(path) else os.path.join(ROOT, path)
+        statements = db.read_statements(full)
+        for number, statement in enumerate(statements, 1):
+            body = re.sub(r'--[^\n]*', '', statement)
+            if _READ_ONLY.match(body):
+                workload.append((f"{os.path.relpath(full, ROOT)}:{number}", statement))
+    return workload
+
+
+def explain(statement, config=None):
+    """
+    The estimated JSON plan of ``statement``, with qualified column names.
+    """
+    with db.connection(config) as conn, conn.cursor() as cursor:
+        cursor.execute(f"EXPLAIN (VERBOSE, FORMAT JSON) {statement}")
+        return cursor.fetchone()[0][0]
+
+
+def plan_nodes(plan):
+    stack = [plan['Plan']]
+    while stack:
+        node = stack.pop()
+        yield node
+        stack.extend(node.get('Plans', []))
+
+
+def split_conjuncts(condition):
+    """
+    The top-level AND terms of a plan condition, without enclosing parentheses.
+    """
+    def unwrap(text):
+        text = text.strip()
+        while text.startswith('(') and text.endswith(')'):
+            depth = 0
+            for position, char in enumerate(text):
+                depth += (char == '(') - (char == ')')
+                if depth == 0 and position < len(text) - 1:
+                    return text
+            text = text[1:-1].strip()
+        return text
+
+    terms, depth, start = [], 0, 0
+    text = unwrap(condition)
+    for position, char in enumerate(text):
+        depth += (char == '(') - (char == ')')
+        if depth == 0 and text.startswith(' AND ', position):
+            terms.append(unwrap(text[start:position]))
+            start = position + 5
+    terms.append(unwrap(text[start:]))
+    return terms
+
+
+def _conditions(node):
+    return [node[key] for key in _CONDITION_KEYS if key in node]
+
+
+def _referenced_columns(nodes, scan, alias):
+    """
+    Columns of ``alias`` the rest of the plan reads. The scan's own output
+    list is skipped because Postgres often emits every column there.
+    """
+    columns = set()
+    for node in nodes:
+        texts = _conditions(node)
+        if node is not scan:
+            texts += node.get('Output', [])
+        for text in texts:
+            columns.update(col for ref, col in _COLUMN_REF.findall(text) if ref == alias)
+    return columns
+
+
+class Candidate:
+    """
+    One suggested index; ``reasons`` lists the statements it was derived from.
+    """
+
+    def __init__(self, table, keys, include=(), predicate=None):
+        self.table = table
+        self.keys = tuple(keys)
+        self.include = tuple(sorted(set(include) - set(keys)))
+        self.predicate = predicate
+        self.reasons = []
+
+    @property
+    def signature(self):
+        return (self.table, self.keys, self.predicate)
+
+    @property
+    def name(self):
+        base = f"{self.table.split('.')[-1]}_{'_'.join(self.keys)}"
+        if self.include or self.predicate:
+            digest = hashlib.sha1(repr((self.include, self.predicate)).encode()).hexdigest()[:6]
+            base = f"{base[:52]}_{digest}"
+        return f"{base[:59]}_idx"
+
+    @property
+    def qualified_name(self):
+        schema = self.table.rsplit('.', 1)[0] if '.' in self.table else 'public'
+        return f"{schema}.{self.name}"
+
+    def ddl(self):
+        include = f" INCLUDE ({', '.join(self.include)})" if self.include else ''
+        where = f" WHERE {self.predicate}" if self.predicate else ''
+        return (f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {self.name} "
+                f"ON {self.table} ({', '.join(self.keys)}){include}{where};")
+
+
+def _table_stats(table, config, cache):
+    if table not in cache:
+        rows = db.fetchall("SELECT reltuples FROM pg_class WHERE oid = %(table)s::regclass;",
+                           {'table': table}, config=config)[0][0]
+        distinct = dict(db.fetchall(DISTINCT_QUERY, {'table': table}, config=config))
+        indexes = db.fetchall(INDEX_QUERY, {'table': table}, config=config)
+        cache[table] = (max(rows, 0), distinct, indexes)
+    return cache[table]
+
+
+def _normalize_predicate(predicate):
+    return re.sub(r'[()\s]|::\w+', '', predicate or '')
+
+
+def _is_covered(candidate, indexes):
+    # An existing index on the same leading columns serves the same lookups.
+    for key_columns, predicate in indexes:
+        if tuple(key_columns[:len(candidate.keys)]) != candidate.keys:
+            continue
+        if predicate is None or (
+                _normalize_predicate(predicate) == _normalize_predicate(candidate.predicate)):
+            return True
+    return False
+
+
+def candidates_for_plan(plan, config=None, stats_cache=None, min_rows=MIN_TABLE_ROWS):
+    """
+    Index candidates for the sequential scans in one plan.
+    """
+    stats_cache = {} if stats_cache is None else stats_cache
+    nodes = list(plan_nodes(plan))
+    join_terms = [term for node in nodes for text in _conditions(node)
+                  for term in split_conjuncts(text)]
+    found = []
+    for scan in nodes:
+        if scan.get('Node Type') != 'Seq Scan':
+            continue
+        table = f"{scan.get('Schema', 'public')}.{scan['Relation Name']}"
+        alias = scan.get('Alias', scan['Relation Name'])
+        table_rows, distinct, indexes = _table_stats(table, config, stats_cache)
+        if table_rows < min_rows:
+            continue
+        referenced = _referenced_columns(nodes, scan, alias)
+
+        equalities, ranges, join_columns = [], [], []
+        for term in split_conjuncts(scan['Filter']) if 'Filter' in scan else []:
+            match = _COMPARISON.match(term)
+            if not match or match['alias'] != alias:
+                continue
+            outer = [ref for ref in _COLUMN_REF.findall(match['rhs']) if ref[0] != alias]
+            if outer and match['op'] == '=':
+                join_columns.append(match['column'])
+            elif match['op'] == '=' and _LITERAL.match(match['rhs'].strip()):
+                equalities.append((match['column'], _LITERAL.match(match['rhs'].strip())[1]))
+            elif match['op'] in ('>=', '<=', '>', '<') and not outer:
+                ranges.append(match['column'])
+        for term in join_terms:
+            match = _COMPARISON.match(term)
+            if not match or match['op'] != '=':
+                continue
+            sides = [(match['alias'], match['column'])] + _COLUMN_REF.findall(match['rhs'])
+            if len({ref for ref, _ in sides}) > 1:
+                join_columns += [col for ref, col in sides if ref == alias]
+
+        proposals = []
+        selective = 'Filter' in scan and scan['Plan Rows'] <= MAX_SELECTIVITY * table_rows
+        if selective and (equalities or ranges):
+            keys, predicates = [], []
+            for column, value in equalities:
+                if 0 < distinct.get(column, 0) <= PARTIAL_MAX_DISTINCT:
+                    predicates.append(f"{column} = {value}")
+                else:
+                    keys.append(column)
+            keys += ranges[:1]
+            if not keys and join_columns:
+                keys = join_columns[:1]
+            if keys:
+                proposals.append((keys, ' AND '.join(predicates) or None))
+        for column in dict.fromkeys(join_columns):
+            proposals.append(([column], None))
+
+        for keys, predicate in proposals:
+            extra = referenced - set(keys) - {c for c, _ in equalities if predicate and c in predicate}
+            candidate = Candidate(table, keys, extra if len(extra) <= MAX_INCLUDE else (),
+                                  predicate)
+            if not _is_covered(candidate, indexes):
+                found.append(candidate)
+    return found
+
+
+def advise(workload, config=None, min_rows=MIN_TABLE_ROWS):
+    """
+    Explain every statement and merge the candidates of all plans. Returns
+    (candidates, plans by label); candidates that differ only in their
+    INCLUDE lists are combined.
+    """
+    merged, plans, stats_cache = {}, {}, {}
+    for label, statement in workload:
+        plans[label] = explain(statement, config=config)
+        for candidate in candidates_for_plan(plans[label], config, stats_cache, min_rows):
+            existing = merged.setdefault(candidate.signature, candidate)
+            if existing is not candidate:
+                include = set(existing.include) | set(candidate.include)
+                existing.include = tuple(sorted(include)) if len(include) <= MAX_INCLUDE else ()
+            if label not in existing.reasons:
+                existing.reasons.append(label)
+    return list(merged.values()), plans
+
+
+def time_statement(statement, repeat=3, config=None):
+    """
+    Best wall time in milliseconds over ``repeat`` runs, including fetching
+    the result, or None when the statement times out.
+    """
+    timings = []
+    for _ in range(repeat):
+        try:
+            with db.connection(config, timeout_ms=TIMING_TIMEOUT_MS) as conn, \
+                    conn.cursor() as cursor:
+                started = time.perf_counter()
+                cursor.execute(statement)
+                if cursor.description is not None:
+                    cursor.fetchall()
+                timings.append((time.perf_counter() - started) * 1000)
+        except errors.QueryCanceled:
+            return None
+    return round(min(timings), 1)
+
+
+def used_indexes(plan):
+    return {node['Index Name'] for node in plan_nodes(plan) if 'Index Name' in node}
+
+
+def _index_valid(cursor, qualified_name):
+    """
+    True for a usable index, False for an invalid one, None when it is missing.
+    """
+    cursor.execute(INDEX_VALID_QUERY, {'name': qualified_name})
+    row = cursor.fetchone()
+    return None if row is None else row[0]
+
+
+def apply_candidates(candidates, config=None):
+    """
+    Build the candidate indexes without blocking writers and refresh the
+    planner statistics of their tables. An invalid index left by an earlier
+    failed build is dropped first, since IF NOT EXISTS would keep it; a build
+    that fails now is dropped again. Returns the names created and a dict of
+    name -> error for the ones that could not be built.
+    """
+    created, failed = [], {}
+    with db.autocommit_connection(config) as conn, conn.cursor() as cursor:
+        for candidate in candidates:
+            if _index_valid(cursor, candidate.qualified_name) is False:
+                cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {candidate.qualified_name};")
+            try:
+                cursor.execute(candidate.ddl())
+            except errors.Error as e:
+                failed[candidate.name] = str(e).strip()
+            else:
+                if _index_valid(cursor, candidate.qualified_name):
+                    created.append(candidate.name)
+                    continue
+                failed[candidate.name] = 'index is invalid after the build'
+            if _index_valid(cursor, candidate.qualified_name) is False:
+                cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {candidate.qualified_name};")
+        for table in sorted({candidate.table for candidate in candidates
+                             if candidate.name in created}):
+            cursor.execute(f"ANALYZE {table};")
+    return created, failed
+
+
+def drop_indexes(candidates, config=None):
+    with db.autocommit_connection(config) as conn, conn.cursor() as cursor:
+        for candidate in candidates:
+            cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {candidate.qualified_name};")
+
+
+def run(paths=WORKLOAD, config=None, apply=False, repeat=3, drop_unused=False,
+        min_rows=MIN_TABLE_ROWS):
+    """
+    Advise on the workload and, with ``apply``, build the indexes and measure
+    every statement before and after. Returns a JSON-serialisable report.
+    """
+    workload = load_workload(paths)
+    candidates, plans = advise(workload, config, min_rows)
+    report = {'indexes': [{'name': c.name, 'ddl': c.ddl(), 'reasons': c.reasons}
+                          for c in candidates],
+              'statements': [{'statement': label} for label, _ in workload]}
+    if not apply or not candidates:
+        return report
+
+    for entry, (_, statement) in zip(report['statements'], workload):
+        entry['before_ms'] = time_statement(statement, repeat, config)
+    created, failed = apply_candidates(candidates, config)
+    for index in report['indexes']:
+        index['created'] = index['name'] in created
+        if index['name'] in failed:
+            index['error'] = failed[index['name']]
+    usage = defaultdict(list)
+    for entry, (label, statement) in zip(report['statements'], workload):
+        entry['after_ms'] = time_statement(statement, repeat, config)
+        for name in used_indexes(explain(statement, config=config)):
+            usage[name].append(label)
+        if entry['before_ms'] and entry['after_ms']:
+            entry['speedup'] = round(entry['before_ms'] / entry['after_ms'], 2)
+    for index in report['indexes']:
+        index['used_by'] = usage.get(index['name'], [])
+    if drop_unused:
+        unused = [c for c in candidates if c.name in created and not usage.get(c.name)]
+        drop_indexes(unused, config)
+        dropped = {c.name for c in unused}
+        for index in report['indexes']:
+            index['dropped'] = index['name'] in dropped
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Suggest and optionally build indexes "
+                                                 "for the project's SQL files.")
+    parser.add_argument('files', nargs='*', default=WORKLOAD,
+                        help="SQL files to analyse (default: the report queries)")
+    parser.add_argument('--database', help="target database (default: PGDATABASE)")
+    parser.add_argument('--apply', action='store_true',
+                        help="create the indexes concurrently and time every statement")
+    parser.add_argument('--repeat', type=int, default=3, help="timed runs per statement")
+    parser.add_argument('--drop-unused', action='store_true',
+                        help="after --apply, drop indexes no plan uses")
+    parser.add_argument('--min-rows', type=int, default=MIN_TABLE_ROWS,
+                        help="ignore scans of tables smaller than this")
+    parser.add_argument('--output', help="also write the report as JSON")
+    args = parser.parse_args()
+
+    config = {'dbname': args.database} if args.database else None
+    report = run(args.files, config, args.apply, args.repeat, args.drop_unused, args.min_rows)
+    for index in report['indexes']:
+        print(index['ddl'])
+        print(f"    -- from {', '.join(index['reasons'])}")
+        if 'error' in index:
+            print(f"    -- not created: {index['error']}")
+        elif 'used_by' in index:
+            state = 'dropped, unused' if index.get('dropped') else (
+                f"used by {', '.join(index['used_by'])}" if index['used_by'] else 'unused')
+            print(f"    -- {state}")
+    if not report['indexes']:
+        print("No index suggestions.")
+    if args.apply:
+        for entry in report['statements']:
+            before, after = entry.get('before_ms'), entry.get('after_ms')
+            speedup = f"x{entry['speedup']}" if 'speedup' in entry else ''
+            print(f"{entry['statement']:<60} {before!s:>10} ms -> {after!s:>10} ms {speedup}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,330 @@
+# Optional instrumentation for the analysis scripts. With SQLANALYSIS_PROFILE
+# set, every query run through db.py and every decorated pipeline stage is
+# recorded as a JSON span (elapsed time, rows, bytes, memory, optional
+# EXPLAIN ANALYZE plan) appended to a JSON-lines file. Without it the
+# decorators return the original functions and spans are shared no-ops.
+#
+#   SQLANALYSIS_PROFILE=spans.jsonl    write spans to this file ('-' for stderr)
+#   SQLANALYSIS_PROFILE_EXPLAIN=1      also capture EXPLAIN (ANALYZE, BUFFERS)
+#                                      for read-only queries (runs them twice)
+#   SQLANALYSIS_PROFILE_MEMORY=1       trace Python allocations per span
+#
+#   python profiling.py spans.jsonl [--baseline old.jsonl]   summarise a run
+
+import argparse
+import functools
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import defaultdict
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+PROFILE_PATH = os.environ.get('SQLANALYSIS_PROFILE', '')
+ENABLED = bool(PROFILE_PATH)
+EXPLAIN = ENABLED and os.environ.get('SQLANALYSIS_PROFILE_EXPLAIN', '') not in ('', '0')
+TRACE_MEMORY = ENABLED and os.environ.get('SQLANALYSIS_PROFILE_MEMORY', '') not in ('', '0')
+RUN_ID = os.environ.get('SQLANALYSIS_PROFILE_RUN') or uuid.uuid4().hex[:12]
+QUERY_TEXT_LIMIT = 500
+
+# EXPLAIN ANALYZE executes the statement, so only plain reads are explained.
+_READ_ONLY = re.compile(r'^\s*(SELECT|WITH)\b', re.IGNORECASE)
+_WRITES = re.compile(r'\b(INSERT|UPDATE|DELETE|MERGE|TRUNCATE|CREATE|DROP|ALTER)\b', re.IGNORECASE)
+_COPY_QUERY = re.compile(r'^\s*COPY\s*\((.*)\)\s*TO\s+STDOUT', re.IGNORECASE | re.DOTALL)
+
+_local = threading.local()
+_write_lock = threading.Lock()
+_sink = None
+_sink_pid = None
+
+if ENABLED:
+    # Spans from worker processes share the run id of the parent.
+    os.environ['SQLANALYSIS_PROFILE_RUN'] = RUN_ID
+if TRACE_MEMORY:
+    tracemalloc.start()
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def add(self, **fields):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span:
+    """
+    One timed unit of work. ``add`` attaches or accumulates fields: numeric
+    values such as rows and bytes are summed, anything else is replaced.
+    """
+
+    def __init__(self, name, kind, fields):
+        self.name = name
+        self.kind = kind
+        self.fields = fields
+        self.id = uuid.uuid4().hex[:12]
+        self.parent = None
+        self.peak = 0
+
+    def add(self, **fields):
+        for key, value in fields.items():
+            if isinstance(value, (int, float)) and isinstance(self.fields.get(key), (int, float)):
+                self.fields[key] += value
+            else:
+                self.fields[key] = value
+
+    def __enter__(self):
+        stack = _stack()
+        if stack:
+            self.parent = stack[-1].id
+            if TRACE_MEMORY:
+                stack[-1].peak = max(stack[-1].peak, tracemalloc.get_traced_memory()[1])
+        if TRACE_MEMORY:
+            tracemalloc.reset_peak()
+            self._traced_start = tracemalloc.get_traced_memory()[0]
+        stack.append(self)
+        self._wall = time.time()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self._start
+        stack = _stack()
+        stack.pop()
+        record = {
+            'run': RUN_ID,
+            'id': self.id,
+            'parent': self.parent,
+            'pid': os.getpid(),
+            'kind': self.kind,
+            'span': self.name,
+            'start': round(self._wall, 6),
+            'elapsed_ms': round(elapsed * 1000, 3),
+        }
+        if resource is not None:
+            record['max_rss_mb'] = round(
+                resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+        if TRACE_MEMORY:
+            self.peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+            record['peak_traced_mb'] = round((self.peak - self._traced_start) / 2 ** 20, 3)
+            if stack:
+                stack[-1].peak = max(stack[-1].peak, self.peak)
+        if exc_type is not None:
+            record['error'] = f"{exc_type.__name__}: {exc}"
+        record.update(self.fields)
+        _emit(record)
+        return False
+
+
+def _stack():
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    return _local.stack
+
+
+def _emit(record):
+    global _sink, _sink_pid
+    line = json.dumps(record, default=str) + '\n'
+    with _write_lock:
+        if PROFILE_PATH == '-':
+            sys.stderr.write(line)
+            return
+        if _sink is None or _sink_pid != os.getpid():
+            _sink = open(PROFILE_PATH, 'a', encoding='utf-8', buffering=1)
+            _sink_pid = os.getpid()
+        _sink.write(line)
+
+
+def span(name, kind='stage', **fields):
+    """
+    Context manager timing a block; a shared no-op when profiling is off.
+    """
+    if not ENABLED:
+        return _NULL_SPAN
+    return Span(name, kind, fields)
+
+
+def profiled(name=None):
+    """
+    Decorator recording each call of a pipeline stage as a span. When
+    profiling is off the function is returned unchanged.
+    """
+    def decorate(func):
+        if not ENABLED:
+            return func
+        label = name or f"{func.__module__}.{func.__qualname__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(label):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def _query_fields(query):
+    text = query.decode() if isinstance(query, bytes) else str(query)
+    compact = ' '.join(text.split())
+    return {'query': compact[:QUERY_TEXT_LIMIT],
+            'query_hash': hashlib.sha1(compact.encode()).hexdigest()[:12]}
+
+
+def _explain(cursor, query, params):
+    """
+    Run EXPLAIN (ANALYZE, BUFFERS) for ``query`` on the cursor's connection
+    with a plain cursor, inside a savepoint so a failing plan leaves the
+    caller's transaction usable.
+    """
+    import psycopg2.extensions
+    conn = cursor.connection
+    savepoint = not conn.autocommit
+    with conn.cursor(cursor_factory=psycopg2.extensions.cursor) as explain_cursor:
+        if savepoint:
+            explain_cursor.execute("SAVEPOINT profiling_explain;")
+        try:
+            explain_cursor.execute(
+                f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {query}", params)
+            plan = explain_cursor.fetchone()[0]
+            if savepoint:
+                explain_cursor.execute("RELEASE SAVEPOINT profiling_explain;")
+            return plan
+        except Exception as e:
+            if savepoint:
+                explain_cursor.execute("ROLLBACK TO SAVEPOINT profiling_explain;")
+            return {'error': str(e)}
+
+
+def _explainable(query):
+    text = query.decode() if isinstance(query, bytes) else str(query)
+    return bool(_READ_ONLY.match(text)) and not _WRITES.search(text)
+
+
+@functools.lru_cache(maxsize=None)
+def cursor_factory():
+    """
+    A psycopg2 cursor class that records every execute and COPY as a query
+    span, or None when profiling is off so connections keep the default.
+    """
+    if not ENABLED:
+        return None
+    import psycopg2.extensions
+
+    class ProfilingCursor(psycopg2.extensions.cursor):
+
+        def execute(self, query, vars=None):
+            fields = _query_fields(query)
+            self._profile_hash = fields['query_hash']
+            if EXPLAIN and _explainable(query):
+                fields['plan'] = _explain(self, query, vars)
+            with span('query', kind='query', **fields) as s:
+                result = super().execute(query, vars)
+                if self.name is None and self.rowcount >= 0:
+                    s.add(rows=self.rowcount)
+                return result
+
+        def executemany(self, query, vars_list):
+            with span('query', kind='query', **_query_fields(query)) as s:
+                result = super().executemany(query, vars_list)
+                s.add(rows=self.rowcount)
+                return result
+
+        # Server-side cursors transfer rows on fetch, so fetches are timed
+        # per batch; a span never stays open while the caller works.
+        def _fetch_span(self):
+            return span('fetch', kind='fetch', query_hash=getattr(self, '_profile_hash', None))
+
+        def fetchmany(self, size=None):
+            size = self.arraysize if size is None else size
+            if self.name is None:
+                return super().fetchmany(size)
+            with self._fetch_span() as s:
+                rows = super().fetchmany(size)
+                s.add(rows=len(rows))
+            return rows
+
+        def fetchall(self):
+            if self.name is None:
+                return super().fetchall()
+            with self._fetch_span() as s:
+                rows = super().fetchall()
+                s.add(rows=len(rows))
+            return rows
+
+        def __iter__(self):
+            if self.name is None:
+                yield from super().__iter__()
+                return
+            while True:
+                rows = self.fetchmany(self.itersize)
+                if not rows:
+                    return
+                yield from rows
+
+        def copy_expert(self, sql, file, size=8192):
+            fields = _query_fields(sql)
+            inner = _COPY_QUERY.match(sql)
+            if EXPLAIN and inner:
+                fields['plan'] = _explain(self, inner.group(1), None)
+            start = file.tell() if file.seekable() else 0
+            with span('copy', kind='query', **fields) as s:
+                result = super().copy_expert(sql, file, size)
+                end = file.tell() if file.seekable() else start
+                s.add(rows=max(self.rowcount, 0), bytes=abs(end - start))
+                return result
+
+    return ProfilingCursor
+
+
+def summarize(path):
+    """
+    Aggregate a span file by span name (and query hash for queries):
+    calls, total and mean elapsed time, rows and bytes.
+    """
+    totals = defaultdict(lambda: {'calls': 0, 'elapsed_ms': 0.0, 'rows': 0, 'bytes': 0})
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            record = json.loads(line)
+            key = record['span'] if record['kind'] == 'stage' else \
+                f"{record['span']}:{record.get('query_hash')}"
+            entry = totals[key]
+            entry['calls'] += 1
+            entry['elapsed_ms'] += record['elapsed_ms']
+            entry['rows'] += record.get('rows') or 0
+            entry['bytes'] += record.get('bytes') or 0
+            if 'query' in record:
+                entry['query'] = record['query'][:80]
+    return dict(totals)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarise a profiling span file.")
+    parser.add_argument('spans')
+    parser.add_argument('--baseline', help="span file of an earlier run to compare with")
+    parser.add_argument('--top', type=int, default=25)
+    args = parser.parse_args()
+
+    current = summarize(args.spans)
+    baseline = summarize(args.baseline) if args.baseline else {}
+    ranked = sorted(current.items(), key=lambda item: item[1]['elapsed_ms'], reverse=True)
+    for key, entry in ranked[:args.top]:
+        change = ''
+        if key in baseline and baseline[key]['elapsed_ms']:
+            change = f" {entry['elapsed_ms'] / baseline[key]['elapsed_ms'] - 1:+.0%}"
+        label = entry.get('query', key)
+        print(f"{entry['elapsed_ms']:>11.1f} ms{change:>7} {entry['calls']:>6}x "
+              f"{entry['rows']:>10} rows {entry['bytes']:>12} B  {label}")
@@ -0,0 +1,278 @@
+# Run the analysis suite as a dependency graph. Every report is a task with
+# the tasks it depends on and the database connections and CPU cores it
+# holds; a task starts as soon as its dependencies have succeeded and its
+# resources are free, so independent reports run side by side and the batch
+# takes about as long as its longest chain. Each task runs in its own process
+# with its output in <workdir>/logs; the run ends with per-task timings and
+# the critical path.
+#
+#   python scheduler.py                          run every task
+#   python scheduler.py --only score_products    run a task and what it needs
+#   python scheduler.py --db-slots 4 --cpu-slots 2 --output run.json
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+
+import db
+
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+CPU_COUNT = os.cpu_count() or 1
+DEFAULT_DB_SLOTS = db.POOL_SIZE
+DEFAULT_CPU_SLOTS = CPU_COUNT
+
+
+def _script(*parts):
+    return [sys.executable, os.path.join(ROOT, *parts)]
+
+
+def _sql(*parts):
+    return [sys.executable, os.path.abspath(__file__), '--run-sql', os.path.join(ROOT, *parts)]
+
+
+# Tables the rollup and model tasks rewrite while the others run. preprocess
+# exports the source tables only, so it never reads one of them mid-refresh.
+DERIVED_TABLES = [
+    'category_sales_daily', 'vendor_sales_daily', 'vendor_sales_totals',
+    'product_sales_daily', 'product_features', 'product_sellout_scores',
+]
+
+# 'db' is the number of connections a task keeps busy and 'cpu' the cores it
+# uses on this machine; tasks that only wait on the database take no core.
+TASKS = {
+    'part1_top_users': {'command': _sql('Part1', 'Question1.sql'), 'db': 1, 'cpu': 0},
+    'part1_conversion': {'command': _sql('Part1', 'q1.b.sql'), 'db': 1, 'cpu': 0},
+    'kpis': {'command': _script('Part4', 'kpi.py'), 'db': 4, 'cpu': 0},
+    'fetch2': {'command': _script('Part2', 'fetch2.py'), 'db': 1, 'cpu': 0},
+    'fetch_most_popular_product': {
+        'command': _script('Part2', 'Fetch_Most_Popular_Product.py'), 'db': 1, 'cpu': 0},
+    'cohort_analysis': {'command': _script('Part2', 'cohort_analysis.py'), 'db': 1, 'cpu': 1},
+    'preprocess': {'command': _script('Part2', 'preprocess.py') + ['--exclude', *DERIVED_TABLES],
+                   'db': CPU_COUNT, 'cpu': CPU_COUNT},
+    'sales_rollup': {'command': _script('Part2', 'sales_rollup.py'), 'db': 1, 'cpu': 0},
+    'vendor_sales': {'command': _script('Part2', 'vendor_sales.py'), 'db': 1, 'cpu': 0},
+    'product_features': {'command': _script('Part5', 'Predictive analysis', 'product_features.py'),
+                         'db': 1, 'cpu': 0},
+    'train_model': {'command': _script('Part5', 'Predictive analysis', 'train_model.py')
+                    + ['--split', 'random'],
+                    'deps': ['product_features'], 'db': 1, 'cpu': CPU_COUNT},
+    'score_products': {'command': _script('Part5', 'Predictive analysis', 'score_products.py'),
+                       'deps': ['train_model'], 'db': 1, 'cpu': 1},
+}
+
+
+class Resources:
+    """
+    Counted database and CPU slots. A task takes all it needs at once, so two
+    tasks never hold part of what the other is waiting for; a request larger
+    than the limit is reduced to the limit.
+    """
+
+    def __init__(self, db_slots, cpu_slots):
+        self.limits = {'db': db_slots, 'cpu': cpu_slots}
+        self.free = dict(self.limits)
+        self._condition = threading.Condition()
+
+    def _wanted(self, task):
+        return {kind: min(task.get(kind, 0), limit) for kind, limit in self.limits.items()}
+
+    def acquire(self, task):
+        wanted = self._wanted(task)
+        with self._condition:
+            self._condition.wait_for(
+                lambda: all(self.free[kind] >= n for kind, n in wanted.items()))
+            for kind, n in wanted.items():
+                self.free[kind] -= n
+
+    def release(self, task):
+        with self._condition:
+            for kind, n in self._wanted(task).items():
+                self.free[kind] += n
+            self._condition.notify_all()
+
+
+def select_tasks(tasks, only=None):
+    """
+    The tasks in ``only`` and everything they depend on, in declaration
+    order; all tasks when ``only`` is empty.
+    """
+    if not only:
+        return list(tasks)
+    needed, stack = set(), list(only)
+    while stack:
+        name = stack.pop()
+        if name not in needed:
+            needed.add(name)
+            stack.extend(tasks[name].get('deps', []))
+    return [name for name in tasks if name in needed]
+
+
+def check_graph(tasks, names):
+    """
+    Raise ValueError for unknown dependencies or a dependency cycle.
+    """
+    state = {}
+
+    def visit(name, path):
+        if state.get(name) == 'done':
+            return
+        if state.get(name) == 'visiting':
+            raise ValueError(f"Dependency cycle: {' -> '.join(path + [name])}")
+        state[name] = 'visiting'
+        for dep in tasks[name].get('deps', []):
+            if dep not in tasks:
+                raise ValueError(f"Task '{name}' depends on unknown task '{dep}'")
+            visit(dep, path + [name])
+        state[name] = 'done'
+
+    for name in names:
+        visit(name, [])
+
+
+def critical_path(tasks, results):
+    """
+    The chain of finished tasks with the longest total run time, following
+    dependencies, and that total in seconds.
+    """
+    longest = {}
+
+    def chain(name):
+        if name not in longest:
+            deps = [dep for dep in tasks[name].get('deps', [])
+                    if results[dep]['seconds'] is not None]
+            best = max((chain(dep) for dep in deps), key=lambda c: c[1], default=([], 0.0))
+            longest[name] = (best[0] + [name], best[1] + results[name]['seconds'])
+        return longest[name]
+
+    finished = [name for name, result in results.items() if result['seconds'] is not None]
+    return max((chain(name) for name in finished), key=lambda c: c[1], default=([], 0.0))
+
+
+def run_task(name, task, workdir, env, timeout):
+    """
+    Run one task in its own process, output to <workdir>/logs/<name>.log, and
+    return (returncode, seconds); the return code is None on a timeout.
+    """
+    log_path = os.path.join(workdir, 'logs', f"{name}.log")
+    started = time.perf_counter()
+    with open(log_path, 'w', encoding='utf-8') as log:
+        process = subprocess.Popen(task['command'], cwd=workdir, env=env,
+                                   stdout=log, stderr=subprocess.STDOUT)
+        try:
+            returncode = process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+            returncode = None
+    return returncode, time.perf_counter() - started
+
+
+def run_schedule(tasks=TASKS, only=None, db_slots=DEFAULT_DB_SLOTS,
+                 cpu_slots=DEFAULT_CPU_SLOTS, workdir='reports', timeout=None):
+    """
+    Run the selected tasks, each once its dependencies have succeeded.
+    Dependents of a failed task are skipped. Returns a report with the
+    outcome and timings of every task and the critical path.
+    """
+    names = select_tasks(tasks, only)
+    check_graph(tasks, names)
+    workdir = os.path.abspath(workdir)
+    os.makedirs(os.path.join(workdir, 'logs'), exist_ok=True)
+    env = dict(os.environ, MPLBACKEND='Agg')
+    resources = Resources(db_slots, cpu_slots)
+    done = {name: threading.Event() for name in names}
+    results = {name: {'status': 'pending', 'seconds': None} for name in names}
+    print_lock = threading.Lock()
+    batch_start = time.perf_counter()
+
+    def worker(name):
+        task = tasks[name]
+        try:
+            for dep in task.get('deps', []):
+                done[dep].wait()
+            failed = [dep for dep in task.get('deps', []) if results[dep]['status'] != 'ok']
+            if failed:
+                results[name]['status'] = f"skipped ({', '.join(failed)} failed)"
+                return
+            ready = time.perf_counter()
+            resources.acquire(task)
+            try:
+                start = time.perf_counter()
+                returncode, seconds = run_task(name, task, workdir, env, timeout)
+            finally:
+                resources.release(task)
+            results[name].update(
+                status='ok' if returncode == 0 else (
+                    'timeout' if returncode is None else f"exit {returncode}"),
+                seconds=round(seconds, 3),
+                waited=round(start - ready, 3),
+                started=round(start - batch_start, 3),
+                finished=round(start - batch_start + seconds, 3))
+        finally:
+            with print_lock:
+                result = results[name]
+                timing = f"{result['seconds']:>9.2f}s" if result['seconds'] is not None else ' ' * 10
+                print(f"  {name:<28} {timing}  {result['status']}", flush=True)
+            done[name].set()
+
+    threads = [threading.Thread(target=worker, args=(name,), name=name) for name in names]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    wall = time.perf_counter() - batch_start
+    path, path_seconds = critical_path(tasks, results)
+    return {
+        'started_at': datetime.now().isoformat(timespec='seconds'),
+        'limits': resources.limits,
+        'wall_seconds': round(wall, 3),
+        'task_seconds': round(sum(r['seconds'] or 0 for r in results.values()), 3),
+        'critical_path': path,
+        'critical_path_seconds': round(path_seconds, 3),
+        'tasks': results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the analysis reports as a task graph.")
+    parser.add_argument('--only', nargs='+', choices=list(TASKS),
+                        help="run these tasks and their dependencies (default: all)")
+    parser.add_argument('--db-slots', type=int, default=DEFAULT_DB_SLOTS,
+                        help="database connections the tasks may hold at once")
+    parser.add_argument('--cpu-slots', type=int, default=DEFAULT_CPU_SLOTS,
+                        help="CPU cores the tasks may use at once")
+    parser.add_argument('--workdir', default='reports',
+                        help="directory the reports and logs are written to")
+    parser.add_argument('--timeout', type=float, help="seconds before a task is killed")
+    parser.add_argument('--output', help="also write the run report as JSON")
+    parser.add_argument('--list', action='store_true', help="show the tasks and exit")
+    parser.add_argument('--run-sql', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_sql:
+        print(f"{db.run_sql_file(args.run_sql)} rows")
+        sys.exit(0)
+    if args.list:
+        for name in select_tasks(TASKS, args.only):
+            task = TASKS[name]
+            deps = ', '.join(task.get('deps', [])) or '-'
+            print(f"{name:<28} db={task.get('db', 0)} cpu={task.get('cpu', 0)}  after: {deps}")
+        sys.exit(0)
+
+    report = run_schedule(TASKS, args.only, args.db_slots, args.cpu_slots,
+                          args.workdir, args.timeout)
+    print(f"Batch finished in {report['wall_seconds']:.2f}s "
+          f"(tasks took {report['task_seconds']:.2f}s in total).")
+    print(f"Critical path ({report['critical_path_seconds']:.2f}s): "
+          f"{' -> '.join(report['critical_path'])}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    sys.exit(0 if all(r['status'] == 'ok' for r in report['tasks'].values()) else 1)
@@ -0,0 +1,101 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Part2'))
+import cohort_analysis  # noqa: E402
+
+
+def _participations(rows):
+    return pd.DataFrame(rows, columns=['user_id', 'signup_date', 'participation_date'])
+
+
+def _full_counts(df, since=None):
+    """
+    Recompute the cohort counts from scratch the way fetch_cohort_counts does,
+    with a plain groupby.
+    """
+    df = cohort_analysis.preprocess_data(df.copy())
+    df = df[df['participation_date'] <= df['signup_date'] + pd.DateOffset(
+        months=cohort_analysis.COHORT_WINDOW_MONTHS)]
+    if since is not None:
+        df = df[df['signup_date'] >= since]
+    return (df.groupby(['cohort_month', 'months_after_signup'])['user_id']
+            .nunique().rename('users').reset_index())
+
+
+def _sorted(counts):
+    return counts.sort_values(['cohort_month', 'months_after_signup']).reset_index(drop=True)
+
+
+@pytest.fixture
+def participations():
+    return _participations([
+        (1, '2024-01-10 09:00', '2024-01-12 10:00'),
+        (1, '2024-01-10 09:00', '2024-01-20 10:00'),
+        (1, '2024-01-10 09:00', '2024-03-10 09:00'),
+        (2, '2024-01-31 10:00', '2024-02-29 23:00'),
+        (3, '2024-03-05 08:00', '2024-04-05 07:59'),
+        (3, '2024-03-05 08:00', '2024-04-05 08:00'),
+        (4, '2024-04-15 12:00', '2024-04-20 12:00'),
+    ])
+
+
+def test_months_after_signup_matches_postgres_age():
+    # Expected offsets are EXTRACT(YEAR/MONTH FROM AGE(participation, signup)).
+    df = cohort_analysis.preprocess_data(_participations([
+        (1, '2024-01-31 10:00', '2024-02-29 23:00'),
+        (1, '2024-01-31 10:00', '2024-03-31 09:00'),
+        (1, '2024-01-31 10:00', '2024-03-31 10:00'),
+        (2, '2024-01-15 12:00', '2024-02-15 11:59'),
+        (2, '2024-01-15 12:00', '2024-04-15 12:00'),
+        (3, '2023-12-20 00:00', '2024-01-05 00:00'),
+        (3, '2023-12-20 00:00', '2023-12-19 00:00'),
+    ]))
+    assert list(df['months_after_signup']) == [0, 1, 2, 0, 3, 0]
+    assert list(df['cohort_month'].astype(str)) == [
+        '2024-01', '2024-01', '2024-01', '2024-01', '2024-01', '2023-12']
+
+
+def test_count_cohort_users_matches_groupby(participations):
+    df = cohort_analysis.preprocess_data(participations.copy())
+    counts = cohort_analysis.count_cohort_users(df)
+    expected = (df.groupby(['cohort_month', 'months_after_signup'])['user_id']
+                .nunique().rename('users').reset_index())
+    pd.testing.assert_frame_equal(_sorted(counts), _sorted(expected), check_dtype=False)
+
+
+def test_refresh_matches_full_recompute(participations, monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    source = {'rows': participations, 'now': '2024-05-10 12:00'}
+    calls = []
+
+    def fetch_cohort_counts(since=None):
+        calls.append(since)
+        return _full_counts(source['rows'], since)
+
+    monkeypatch.setattr(cohort_analysis, 'fetch_cohort_counts', fetch_cohort_counts)
+    monkeypatch.setattr(cohort_analysis.db, 'fetchall',
+                        lambda *args, **kwargs: [(pd.Timestamp(source['now']),)])
+
+    first = cohort_analysis.refresh_cohort_counts()
+    pd.testing.assert_frame_equal(_sorted(first), _sorted(_full_counts(participations)),
+                                  check_dtype=False)
+
+    # Later participations land only in cohorts that were still open.
+    source['rows'] = pd.concat([participations, _participations([
+        (3, '2024-03-05 08:00', '2024-05-20 08:00'),
+        (4, '2024-04-15 12:00', '2024-05-16 12:00'),
+        (5, '2024-05-02 07:00', '2024-05-03 07:00'),
+    ])], ignore_index=True)
+    source['now'] = '2024-06-02 08:00'
+    second = cohort_analysis.refresh_cohort_counts()
+
+    assert calls == [None, pd.Timestamp('2024-02-01')]
+    pd.testing.assert_frame_equal(_sorted(second), _sorted(_full_counts(source['rows'])),
+                                  check_dtype=False)
+    counts, first_open = cohort_analysis.load_cohort_state()
+    assert str(first_open) == '2024-03'
+    pd.testing.assert_frame_equal(_sorted(counts), _sorted(second), check_dtype=False)
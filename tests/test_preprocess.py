@@ -0,0 +1,175 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine, text
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Part2'))
+from preprocess import DataPreprocessor, load_preprocessed  # noqa: E402
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'source.db'}")
+    with engine.begin() as conn:
+        conn.execute(text("""
+            CREATE TABLE orders (
+                id INTEGER PRIMARY KEY,
+                amount REAL,
+                created_at DATETIME NOT NULL,
+                updated_at DATETIME
+            )
+        """))
+        conn.execute(text("""
+            INSERT INTO orders VALUES
+                (1, 10.0, '2024-01-05 10:00:00.000000', NULL),
+                (2, 20.0, '2024-01-20 11:00:00.000000', NULL),
+                (3, 30.0, '2024-02-03 12:00:00.000000', '2024-02-04 09:00:00.000000')
+        """))
+        conn.execute(text("CREATE TABLE events (id INTEGER PRIMARY KEY, payload TEXT)"))
+        conn.execute(text("INSERT INTO events VALUES (1, 'a'), (2, 'b')"))
+        conn.execute(text("CREATE TABLE codes (code TEXT, label TEXT)"))
+        conn.execute(text("INSERT INTO codes VALUES ('A01', 'x'), ('A02', 'y')"))
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def preprocessor(engine, tmp_path):
+    preprocessor = DataPreprocessor(
+        vocabulary_dir=str(tmp_path / 'vocabularies'),
+        watermark_dir=str(tmp_path / 'watermarks'), engine=engine)
+    yield preprocessor
+    preprocessor.close_connection()
+
+
+def _change_orders(engine):
+    with engine.begin() as conn:
+        conn.execute(text("""
+            UPDATE orders SET amount = 25.0, updated_at = '2024-03-01 08:00:00.000000'
+            WHERE id = 2
+        """))
+        conn.execute(text("""
+            INSERT INTO orders VALUES (4, 40.0, '2024-03-02 09:00:00.000000', NULL)
+        """))
+
+
+def _amounts(df):
+    return dict(zip(df['id'], df['amount']))
+
+
+def test_timestamp_watermark_is_stored_as_iso(preprocessor, tmp_path):
+    path = tmp_path / 'orders.csv'
+    assert preprocessor.export_table('orders', str(path), incremental=True) == 3
+    assert preprocessor.load_watermark('orders') == {
+        'column': 'updated_at', 'value': '2024-02-04T09:00:00'}
+
+
+def test_csv_incremental_merges_updated_rows(preprocessor, engine, tmp_path):
+    path = tmp_path / 'orders.csv'
+    assert preprocessor.export_table('orders', str(path), incremental=True) == 3
+    assert preprocessor.export_table('orders', str(path), incremental=True) == 1
+
+    _change_orders(engine)
+    # Order 3 is re-read because the watermark is inclusive, then merged.
+    assert preprocessor.export_table('orders', str(path), incremental=True) == 3
+    df = pd.read_csv(path)
+    assert sorted(df['id']) == [1, 2, 3, 4]
+    assert _amounts(df) == {1: 10.0, 2: 25.0, 3: 30.0, 4: 40.0}
+    assert preprocessor.load_watermark('orders')['value'] == '2024-03-02T09:00:00'
+
+
+def test_parquet_incremental_merges_updated_rows(preprocessor, engine, tmp_path):
+    path = tmp_path / 'orders.parquet'
+    assert preprocessor.export_table('orders', str(path), incremental=True,
+                                     output_format='parquet') == 3
+
+    _change_orders(engine)
+    assert preprocessor.export_table('orders', str(path), incremental=True,
+                                     output_format='parquet') == 3
+    df = load_preprocessed(str(path))
+    assert sorted(df['id']) == [1, 2, 3, 4]
+    assert _amounts(df) == {1: 10.0, 2: 25.0, 3: 30.0, 4: 40.0}
+
+
+def test_integer_key_watermark(preprocessor, engine, tmp_path):
+    path = tmp_path / 'events.csv'
+    assert preprocessor.export_table('events', str(path), incremental=True) == 2
+    assert preprocessor.load_watermark('events') == {'column': 'id', 'value': 2}
+
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO events VALUES (3, 'c')"))
+    assert preprocessor.export_table('events', str(path), incremental=True) == 1
+    assert sorted(pd.read_csv(path)['id']) == [1, 2, 3]
+
+
+def test_text_watermark_column(preprocessor, engine, tmp_path):
+    preprocessor.add_table_config('codes', {'categorical_cols': [], 'timestamp_cols': [],
+                                            'watermark_col': 'code'})
+    path = tmp_path / 'codes.csv'
+    assert preprocessor.export_table('codes', str(path), incremental=True) == 2
+    assert preprocessor.load_watermark('codes') == {'column': 'code', 'value': 'A02'}
+
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO codes VALUES ('A03', 'z')"))
+    assert preprocessor.export_table('codes', str(path), incremental=True) == 1
+    assert list(pd.read_csv(path)['code']) == ['A01', 'A02', 'A03']
+
+
+def test_aggregate_skips_key_columns(preprocessor, engine):
+    with engine.begin() as conn:
+        conn.execute(text("""
+            CREATE TABLE items (
+                id INTEGER PRIMARY KEY,
+                order_id INTEGER REFERENCES orders (id),
+                quantity INTEGER,
+                created_at DATETIME NOT NULL
+            )
+        """))
+        conn.execute(text("""
+            INSERT INTO items VALUES
+                (1, 1, 2, '2024-01-05 10:00:00'),
+                (2, 2, 3, '2024-01-20 11:00:00'),
+                (3, 3, 4, '2024-02-03 12:00:00')
+        """))
+    result = preprocessor.aggregate_table('items')
+    assert list(result.columns) == ['period', 'quantity_sum', 'row_count']
+    assert list(result['quantity_sum']) == [5, 4]
+
+
+def test_arrow_schema_keeps_double_precision(preprocessor, engine):
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE readings (small REAL, wide DOUBLE)"))
+        conn.execute(text("INSERT INTO readings VALUES (1.5, 0.1)"))
+    sample = pd.read_sql_table('readings', engine)
+    schema = preprocessor.arrow_schema('readings', sample)
+    assert str(schema.field('small').type) == 'float'
+    assert str(schema.field('wide').type) == 'double'
+
+
+def test_parquet_partitioned_on_watermark_has_no_duplicates(preprocessor, engine, tmp_path):
+    with engine.begin() as conn:
+        conn.execute(text("""
+            CREATE TABLE tickets (id INTEGER PRIMARY KEY, amount REAL, updated_at DATETIME)
+        """))
+        conn.execute(text("""
+            INSERT INTO tickets VALUES
+                (1, 10.0, '2024-01-05 10:00:00.000000'),
+                (2, 20.0, '2024-02-20 11:00:00.000000')
+        """))
+    path = tmp_path / 'tickets.parquet'
+    assert preprocessor.partition_column('tickets') == 'updated_at'
+    assert preprocessor.export_table('tickets', str(path), incremental=True,
+                                     output_format='parquet') == 2
+
+    # The update moves ticket 1 from the January partition to March.
+    with engine.begin() as conn:
+        conn.execute(text("""
+            UPDATE tickets SET amount = 15.0, updated_at = '2024-03-01 08:00:00.000000'
+            WHERE id = 1
+        """))
+    preprocessor.export_table('tickets', str(path), incremental=True, output_format='parquet')
+    df = load_preprocessed(str(path))
+    assert sorted(df['id']) == [1, 2]
+    assert _amounts(df) == {1: 15.0, 2: 20.0}
@@ -0,0 +1,95 @@
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import scheduler  # noqa: E402
+
+
+def _python(code):
+    return [sys.executable, '-c', code]
+
+
+# extract -> clean -> train -> score, with report and audit on the side.
+TASKS = {
+    'extract': {'command': _python('pass'), 'db': 1, 'cpu': 0},
+    'clean': {'command': _python('pass'), 'deps': ['extract'], 'db': 1, 'cpu': 1},
+    'report': {'command': _python('pass'), 'deps': ['extract'], 'db': 1, 'cpu': 0},
+    'train': {'command': _python('pass'), 'deps': ['clean'], 'db': 0, 'cpu': 2},
+    'score': {'command': _python('pass'), 'deps': ['train', 'report'], 'db': 1, 'cpu': 1},
+    'audit': {'command': _python('pass'), 'db': 1, 'cpu': 0},
+}
+
+
+def test_select_tasks_pulls_in_dependencies():
+    assert scheduler.select_tasks(TASKS) == list(TASKS)
+    assert scheduler.select_tasks(TASKS, ['score']) == [
+        'extract', 'clean', 'report', 'train', 'score']
+    assert scheduler.select_tasks(TASKS, ['report', 'audit']) == ['extract', 'report', 'audit']
+
+
+def test_check_graph_rejects_cycles_and_unknown_tasks():
+    scheduler.check_graph(TASKS, list(TASKS))
+
+    cyclic = dict(TASKS, extract=dict(TASKS['extract'], deps=['score']))
+    with pytest.raises(ValueError, match='Dependency cycle'):
+        scheduler.check_graph(cyclic, list(cyclic))
+
+    unknown = dict(TASKS, audit=dict(TASKS['audit'], deps=['missing']))
+    with pytest.raises(ValueError, match="unknown task 'missing'"):
+        scheduler.check_graph(unknown, list(unknown))
+
+
+def test_critical_path_follows_the_longest_chain():
+    seconds = {'extract': 1.0, 'clean': 2.0, 'report': 4.0, 'train': 0.0,
+               'score': 1.0, 'audit': 5.0}
+    results = {name: {'seconds': s} for name, s in seconds.items()}
+    path, total = scheduler.critical_path(TASKS, results)
+    assert path == ['extract', 'report', 'score']
+    assert total == 6.0
+
+    # A task that never ran is left out of every chain.
+    results['report']['seconds'] = None
+    assert scheduler.critical_path(TASKS, results) == (['audit'], 5.0)
+    assert scheduler.critical_path(TASKS, {}) == ([], 0.0)
+
+
+def test_resources_cap_requests_and_wait_for_release():
+    resources = scheduler.Resources(db_slots=2, cpu_slots=1)
+    big = {'db': 5, 'cpu': 0}
+    resources.acquire(big)
+    assert resources.free == {'db': 0, 'cpu': 1}
+
+    acquired = threading.Event()
+
+    def take_one():
+        resources.acquire({'db': 1, 'cpu': 1})
+        acquired.set()
+
+    thread = threading.Thread(target=take_one)
+    thread.start()
+    assert not acquired.wait(0.2)
+    resources.release(big)
+    assert acquired.wait(5)
+    thread.join()
+    assert resources.free == {'db': 1, 'cpu': 0}
+
+
+def test_run_schedule_respects_slots_and_skips_failed_dependents(tmp_path):
+    tasks = {
+        'a': {'command': _python('import time; time.sleep(0.2)'), 'db': 1},
+        'b': {'command': _python('import time; time.sleep(0.2)'), 'db': 1},
+        'broken': {'command': _python('raise SystemExit(3)')},
+        'after_broken': {'command': _python('pass'), 'deps': ['broken']},
+    }
+    report = scheduler.run_schedule(tasks, db_slots=1, cpu_slots=1, workdir=str(tmp_path))
+    results = report['tasks']
+    assert results['a']['status'] == results['b']['status'] == 'ok'
+    assert results['broken']['status'] == 'exit 3'
+    assert results['after_broken']['status'] == 'skipped (broken failed)'
+    # With one database slot the two sleeps cannot overlap.
+    first, second = sorted([results['a'], results['b']], key=lambda r: r['started'])
+    assert second['started'] >= first['finished'] - 0.01
+    assert os.path.exists(tmp_path / 'logs' / 'a.log')